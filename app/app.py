@@ -1,63 +1,125 @@
 import os
-import cv2
 import time
 import threading
+from contextlib import contextmanager
 from pathlib import Path
-import camera_tracker.pipeline_components as pc
-import camera_tracker.predictors as predictors
+import cv2
 import camera_tracker.utils as utils
-from camera_tracker.tracking_system import TrackingSystem
+from camera_tracker.builder import build_tracking_system
+from camera_tracker.capture import FrameCapture
+from camera_tracker.control import ControlServer
+from camera_tracker.frame_channel import SharedFrameWriter
+from camera_tracker.metrics import MetricsExporter
+from camera_tracker.process_runner import TrackingSystemProxy
+from camera_tracker.recording import ReplaySource
+from camera_tracker.streaming import JpegPublisher
 import settings
 
 from motor_control import gimbal
 
+# frame channel shape when the video source doesn't report its resolution
+DEFAULT_CHANNEL_SHAPE = (1080, 1920, 3)
+
+
+def channel_shape(frame_size):
+    """
+    Shape of the frame channels for frames of frame_size (width, height),
+    0 when unknown. Labeled frames have IMG_SIZE, but captured frames are
+    published as they are while the system is paused.
+    """
+    if not all(frame_size):
+        return DEFAULT_CHANNEL_SHAPE
+    return (max(frame_size[1], settings.IMG_SIZE[1]),
+            max(frame_size[0], settings.IMG_SIZE[0]), 3)
+
 
 def setup_tracking_system():
-    pre_tracker_pipe = [
-        pc.ResizeTransformer(out_size=settings.IMG_SIZE)
-    ]
-
-    pre_detector_pipe = [
-        pc.ResizeTransformer(out_size=settings.IMG_SIZE),
-        pc.GrayscaleTransformer(),
-        pc.BlurTransformer()
-    ]
-
-    detector = predictors.PixelDifferenceDetector(pixel_difference_threshold=settings.PIXEL_DIFFERENCE_TH,
-                                                  structuring_kernel_shape=settings.STRUCTURING_KERNEL_SHAPE,
-                                                  bbox_area_min=settings.BBOX_AREA_MIN_TH,
-                                                  bbox_area_max=settings.BBOX_AREA_MAX_TH)
-    tracker = predictors.CvTracker(tracker_name=settings.TRACKER_NAME,
-                                   tracker_health=settings.MAX_TRACKER_HEALTH)
-    camera_moving_detector = predictors.CameraMovingDetector(
-        predictors.PixelDifferenceDetector(pixel_difference_threshold=settings.PIXEL_DIFFERENCE_TH,
-                                                  structuring_kernel_shape=settings.STRUCTURING_KERNEL_SHAPE,
-                                                  bbox_area_min=settings.BBOX_AREA_MIN_TH,
-                                                  bbox_area_max=settings.BBOX_AREA_MAX_TH),
-        settings.CAMERA_MOVING_THRESHOLD
-    )
-
-    tracking_sys = TrackingSystem(tracker=tracker,
-                                  detector=detector,
-                                  camera_moving_detector=camera_moving_detector,
-                                  pre_tracker_pipe=pre_tracker_pipe,
-                                  pre_detector_pipe=pre_detector_pipe,
-                                  video_source=utils.get_frame_generator(),
-                                  iou_threshold=settings.IOU_THRESHOLD,
-                                  valid_loc_frame_cnt=settings.VALID_LOC_FRAME_CNT,
-                                  display=settings.DISPLAY)
-    return tracking_sys
+    """
+    Returns the tracking system and the shape its frame channels need.
+    """
+    if settings.REPLAY_PATH:
+        video_source = ReplaySource(settings.REPLAY_PATH, realtime=settings.REPLAY_REALTIME)
+        frame_size = video_source.recording.frame(0).image.shape[1::-1] \
+            if len(video_source) else (0, 0)
+    else:
+        cap = utils.get_stream(source=settings.VIDEO_SOURCE)
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                      int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        video_source = FrameCapture(cap,
+                                    buffer_size=settings.CAPTURE_BUFFER_SIZE,
+                                    policy=settings.CAPTURE_POLICY)
+    shape = channel_shape(frame_size)
+    if settings.EXECUTION_MODE == 'process':
+        return TrackingSystemProxy(settings, video_source,
+                                   input_path=settings.INPUT_CHANNEL_PATH,
+                                   output_path=settings.FRAME_CHANNEL_PATH,
+                                   max_shape=shape,
+                                   stream_max_fps=settings.STREAM_MAX_FPS), shape
+    tracking_sys = build_tracking_system(settings, video_source)
+    if settings.REPLAY_PATH:
+        # replay the recorded commands too
+        video_source.attach(tracking_sys)
+    return tracking_sys, shape
 
 
 def server_communication():
+    if settings.FRAME_TRANSPORT == 'shm':
+        shm_communication()
+    else:
+        fifo_communication()
+
+
+def shm_communication():
+    # the web server maps the channel and encodes frames only for clients
+    writer = SharedFrameWriter(settings.FRAME_CHANNEL_PATH, frame_channel_shape)
+    min_interval = 1 / settings.STREAM_MAX_FPS
+    last_seq = 0
     while True:
-        frame = tracking_sys.get_labeled_video_frame()
-        if frame is not None:
-            with open(settings.IMG_FIFO_PATH, 'wb') as fifo:
-                fifo.flush()
-                success, img = cv2.imencode('.jpg', frame)
-                if success:
-                    fifo.write(bytearray(img))
+        t0 = time.monotonic()
+        if tracking_sys.wait_labeled_video_frame(last_seq, timeout=0.5) == last_seq:
+            continue
+        last_seq = tracking_sys.write_labeled_video_frame(writer, last_seq)
+        time.sleep(max(0.0, min_interval - (time.monotonic() - t0)))
+
+
+def fifo_communication():
+    def write_fifo(img):
+        with open(settings.IMG_FIFO_PATH, 'wb') as fifo:
+            fifo.write(img)
+
+    publisher = JpegPublisher(tracking_sys, write_fifo,
+                              max_fps=settings.STREAM_MAX_FPS,
+                              jpeg_quality=settings.JPEG_QUALITY)
+    publisher.run()
+
+
+def select_target(bbox):
+    bbox = tuple(int(n) for n in bbox)
+    tracking_sys.set_target(bbox)
+    loc = (bbox[0]+bbox[2]/2, bbox[1]+bbox[3]/2)
+
+    with gimbal_moving():
+        gimbal.move_to(loc)
+
+
+def move_to(location):
+    gimbal.move_to([int(l) for l in location], sleep=False)
+
+
+def control_server():
+    handlers = {
+        'manual_start': tracking_sys.pause,
+        'manual_stop': tracking_sys.resume,
+        'move_to': move_to,
+        'reset_position': gimbal.reset_position,
+        'select_target': select_target,
+        'select_track': tracking_sys.select_track,
+        'status': tracking_sys.get_status,
+        'metrics': tracking_sys.get_metrics,
+    }
+    server = ControlServer(settings.CONTROL_SOCKET_PATH, handlers)
+    server.start()
+    return server
 
 
 def server_command():
@@ -82,66 +144,92 @@ def server_command():
             elif cmd[0] == 'select target':
                 bbox = tuple([int(n) for n in cmd[1].split(',')])
                 print(bbox)
-                tracking_sys.set_target(bbox)
-                loc = (bbox[0]+bbox[2]/2, bbox[1]+bbox[3]/2)
-
-                tracking_sys.pause()
-                gimbal.move_to(loc)
-                tracking_sys.resume()
+                select_target(bbox)
             else:
                 print('unknown command:')
                 print(cmd)
 
 
+@contextmanager
+def gimbal_moving():
+    # with motion compensation detection keeps working while the gimbal
+    # moves, otherwise the motion would be seen everywhere
+    if settings.MOTION_COMPENSATION:
+        with tracking_sys.camera_motion():
+            yield
+        return
+    tracking_sys.pause()
+    try:
+        yield
+    finally:
+        tracking_sys.resume()
+
+
 def motor_communication():
     gimbal.init_gimbal(settings.IMG_SIZE)
     while True:
+        # don't hold the location lock while the gimbal moves, the
+        # tracking loop needs it every frame
         with tracking_sys.loc_cv:
             ret = tracking_sys.loc_cv.wait(settings.TIME_BEFORE_RECENTRE)
-            
-            if ret:
-                loc = tracking_sys.get_location()
-                if (settings.IMG_SIZE[0] / 2 - settings.DEAD_ZONE_X) < loc[0] < (settings.IMG_SIZE[0] / 2 + settings.DEAD_ZONE_X) and \
-                        (settings.IMG_SIZE[1] / 2 - settings.DEAD_ZONE_Y) < loc[1] < (settings.IMG_SIZE[1] / 2 + settings.DEAD_ZONE_Y):
-                    print(f'object ({int(loc[0])}, {int(loc[1])}) in dead zone')
-                    continue
-
-                print('new location! pausing..')
-                tracking_sys.pause()
+
+        if ret:
+            loc = tracking_sys.get_predicted_location(settings.GIMBAL_LEAD_TIME) or \
+                tracking_sys.get_location()
+            if loc is None:
+                continue
+            loc = (min(max(loc[0], 0), settings.IMG_SIZE[0]),
+                   min(max(loc[1], 0), settings.IMG_SIZE[1]))
+            if (settings.IMG_SIZE[0] / 2 - settings.DEAD_ZONE_X) < loc[0] < (settings.IMG_SIZE[0] / 2 + settings.DEAD_ZONE_X) and \
+                    (settings.IMG_SIZE[1] / 2 - settings.DEAD_ZONE_Y) < loc[1] < (settings.IMG_SIZE[1] / 2 + settings.DEAD_ZONE_Y):
+                print(f'object ({int(loc[0])}, {int(loc[1])}) in dead zone')
+                continue
+
+            print('new location!')
+            with gimbal_moving():
                 gimbal.move_to(loc)
-                print('resuming...')
-                tracking_sys.resume()
-            else:
-                # timeout, recentre
-                print('timeout, pausing..')
-                tracking_sys.pause()
+        else:
+            # timeout, recentre
+            print('timeout, recentring')
+            with gimbal_moving():
                 gimbal.reset_position()
-                print('resuming...')
-                tracking_sys.resume()
 
 
 if __name__ == '__main__':
-    if not Path(settings.IMG_FIFO_PATH).exists():
+    if settings.FRAME_TRANSPORT == 'fifo' and not Path(settings.IMG_FIFO_PATH).exists():
         os.mkfifo(settings.IMG_FIFO_PATH)
 
-    if not Path(settings.CMD_FIFO_PATH).exists():
+    if settings.CONTROL_TRANSPORT == 'fifo' and not Path(settings.CMD_FIFO_PATH).exists():
         os.mkfifo(settings.CMD_FIFO_PATH)
 
-    tracking_sys = setup_tracking_system()
+    tracking_sys, frame_channel_shape = setup_tracking_system()
+
+    if settings.METRICS_FILE or settings.METRICS_PORT:
+        metrics_exporter = MetricsExporter(tracking_sys.metrics,
+                                           get_metrics=tracking_sys.get_metrics,
+                                           path=settings.METRICS_FILE,
+                                           port=settings.METRICS_PORT,
+                                           interval=settings.METRICS_INTERVAL)
+        metrics_exporter.start()
 
     motor_thread = threading.Thread(target=motor_communication, name='motor')
     motor_thread.start()
 
     tracking_sys.start()
 
-    # start server communication thread
-    server_comm_thread = threading.Thread(
-        target=server_communication, name='server_comm')
-    server_comm_thread.start()
-
-    server_cmd_thread = threading.Thread(
-        target=server_command, name='server_cmd')
-    server_cmd_thread.start()
+    # start server communication thread. The worker process writes the
+    # shared-memory channel itself.
+    if settings.EXECUTION_MODE == 'thread' or settings.FRAME_TRANSPORT != 'shm':
+        server_comm_thread = threading.Thread(
+            target=server_communication, name='server_comm')
+        server_comm_thread.start()
+
+    if settings.CONTROL_TRANSPORT == 'socket':
+        control_server()
+    else:
+        server_cmd_thread = threading.Thread(
+            target=server_command, name='server_cmd')
+        server_cmd_thread.start()
 
     while True:
         time.sleep(1)
@@ -0,0 +1,81 @@
+IMG_SIZE = (640, 360)
+
+# tracker
+# cascade mode: TRACKER_NAME runs on every frame, re-anchored by
+# ACCURATE_TRACKER_NAME as often as FRAME_BUDGET allows. None to disable.
+ACCURATE_TRACKER_NAME = None
+IOU_THRESHOLD = 0.4
+MAX_TRACKER_HEALTH = 5
+TIME_BEFORE_RECENTRE = 60
+# frames the tracker and the detector have to agree on before a location
+# is published
+VALID_LOC_FRAME_CNT = 3
+
+# detector
+# 'pixel_difference' compares consecutive frames, 'running_average' and
+# 'mog2' compare with a background model (see BackgroundSubtractionDetector)
+DETECTOR = 'pixel_difference'
+BBOX_AREA_MIN_TH = 150
+PIXEL_DIFFERENCE_TH = 10
+
+# camera moving
+CAMERA_MOVING_THRESHOLD = IMG_SIZE[0] * IMG_SIZE[1] / 2
+
+# detections more elongated than BBOX_MAX_ASPECT_RATIO (longer over
+# shorter side) are dropped, and boxes at most DETECTION_MERGE_DISTANCE
+# pixels apart are merged, None to disable
+BBOX_MAX_ASPECT_RATIO = None
+DETECTION_MERGE_DISTANCE = None
+# weight of a new frame in the background model, None for the default of
+# the model
+BACKGROUND_LEARNING_RATE = None
+
+# compensate the camera motion when detecting, so tracking keeps running
+# while the gimbal moves instead of pausing. Off until validated on the
+# rig
+MOTION_COMPENSATION = False
+
+# Kalman filter of the target location. The detector is skipped for up
+# to MAX_DETECTION_SKIP frames in a row while the tracker stays within
+# DETECTION_SKIP_DISTANCE pixels of the prediction, 0 to detect on
+# every frame
+KALMAN_FILTER = False
+KALMAN_PROCESS_NOISE = 2000.0
+KALMAN_MEASUREMENT_NOISE = 25.0
+MAX_DETECTION_SKIP = 0
+DETECTION_SKIP_DISTANCE = 5
+
+# track every detected object with a persistent ID, the gimbal follows the
+# one selected with the select_track command. At most MAX_ACTIVE_TRACKERS
+# trackers are updated per frame, the others take turns
+MULTI_TARGET = False
+MAX_ACTIVE_TRACKERS = 4
+MAX_TRACKS = 8
+
+# target processing time per frame in seconds
+FRAME_BUDGET = 1 / 20
+# skip detections (at most MAX_DETECTION_INTERVAL - 1 in a row) and
+# labeled frames while the tracking is healthy to stay within FRAME_BUDGET
+# (opt-in)
+ADAPTIVE_SCHEDULING = False
+MAX_DETECTION_INTERVAL = 5
+
+# capture
+# drop_oldest, block, latest_only
+CAPTURE_POLICY = 'latest_only'
+CAPTURE_BUFFER_SIZE = 4
+
+# preprocessing and detection write into preallocated buffers
+REUSE_BUFFERS = True
+
+# run detector and tracker concurrently on worker threads (opt-in)
+PIPELINED = False
+
+# record the session (frames, commands and results) to RECORD_PATH,
+# None to disable. RECORD_COMPRESSION None keeps raw frames, 'png'
+# compresses them losslessly
+RECORD_PATH = None
+RECORD_COMPRESSION = None
+
+# debug
+DISPLAY = False
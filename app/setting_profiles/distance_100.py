@@ -1,18 +1,18 @@
-IMG_SIZE = (640, 360)
+from .base import *
 
 # tracker
 # CSRT, KCF, MEDIANFLOW, MOSSE
 TRACKER_NAME = 'KCF'
-IOU_THRESHOLD = 0.4
-MAX_TRACKER_HEALTH = 5
-TIME_BEFORE_RECENTRE = 60
+# track and detect only in a window of ROI_SCALE times the target size,
+# None to always use the whole frame
+ROI_SCALE = 3
 
 # detector
-BBOX_AREA_MIN_TH = 150
 BBOX_AREA_MAX_TH = IMG_SIZE[0] * IMG_SIZE[1] / 10
-PIXEL_DIFFERENCE_TH = 10
 STRUCTURING_KERNEL_SHAPE = (5, 5)
+# detect on level 0 (full size), 1 (1/2) or 2 (1/4) of an image pyramid
+DETECTION_PYRAMID_LEVEL = 0
 
 # camera moving
 DEAD_ZONE_X = IMG_SIZE[0] / 4
-DEAD_ZONE_Y = IMG_SIZE[1] / 4
\ No newline at end of file
+DEAD_ZONE_Y = IMG_SIZE[1] / 4
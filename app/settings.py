@@ -1,11 +1,41 @@
 from setting_profiles.distance_5 import *
 
-# debug
-DISPLAY = False
-
 # communication
 IMG_FIFO_PATH = '/home/pi/fifo_img.jpg'
 CMD_FIFO_PATH = '/home/pi/fifo_cmd'
+# fifo: text commands through CMD_FIFO_PATH, as the web server sends
+# them. socket: commands come through the control server at
+# CONTROL_SOCKET_PATH (see camera_tracker/control.py)
+CONTROL_TRANSPORT = 'fifo'
+CONTROL_SOCKET_PATH = '/tmp/camera_tracker.sock'
+# fifo: JPEGs through IMG_FIFO_PATH, as the web server expects. shm:
+# labeled frames go through a shared-memory channel, for web servers
+# that map it
+FRAME_TRANSPORT = 'fifo'
+FRAME_CHANNEL_PATH = '/dev/shm/camera_tracker_frames'
+STREAM_MAX_FPS = 15
+JPEG_QUALITY = 80
+
+# camera index, video file or stream URL
+VIDEO_SOURCE = 0
+
+# thread: the tracking loop runs on a thread of the app, process: in a
+# worker process fed through the shared-memory channel at
+# INPUT_CHANNEL_PATH, so it doesn't share the GIL with the app threads
+EXECUTION_MODE = 'thread'
+INPUT_CHANNEL_PATH = '/dev/shm/camera_tracker_input'
+
+# replay a recording instead of VIDEO_SOURCE, at the recorded frame rate
+# when REPLAY_REALTIME, as fast as possible otherwise
+REPLAY_PATH = None
+REPLAY_REALTIME = True
+
+# the gimbal is sent to where the Kalman filter predicts the target
+# GIMBAL_LEAD_TIME seconds later
+GIMBAL_LEAD_TIME = 0.2
 
-CAMERA_MOVING_THRESHOLD = IMG_SIZE[0] * IMG_SIZE[1] / 2
-VALID_LOC_FRAME_CNT = 3
\ No newline at end of file
+# metrics: JSON file dumped every METRICS_INTERVAL seconds and/or a
+# Prometheus text endpoint on 127.0.0.1:METRICS_PORT/metrics, None to disable
+METRICS_FILE = None
+METRICS_PORT = None
+METRICS_INTERVAL = 10
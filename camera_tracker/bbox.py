@@ -0,0 +1,133 @@
+"""
+This module provides bounding box operations on arrays of boxes.
+
+Boxes are (x, y, w, h) rows of an Nx4 array, unless the name says xyxy
+(x1, y1, x2, y2). Every function also takes a single box or a list of
+tuples, and returns arrays. utils keeps the scalar versions for one box,
+which are faster than NumPy for a single pair.
+"""
+import numpy as np
+from typing import Sequence, Tuple, Union
+
+Boxes = np.ndarray
+
+
+def as_boxes(boxes, dtype=None) -> Boxes:
+    """
+    boxes as an Nx4 array, without a copy when it already is one.
+    """
+    return np.asarray(boxes, dtype=dtype).reshape(-1, 4)
+
+
+def area(boxes) -> np.ndarray:
+    boxes = as_boxes(boxes)
+    return boxes[:, 2] * boxes[:, 3]
+
+
+def centroid(boxes) -> np.ndarray:
+    """
+    Centres of boxes as an Nx2 array.
+    """
+    boxes = as_boxes(boxes, np.float64)
+    return boxes[:, :2] + boxes[:, 2:] / 2
+
+
+def xywh_to_xyxy(boxes) -> Boxes:
+    boxes = as_boxes(boxes)
+    return np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1)
+
+
+def xyxy_to_xywh(boxes) -> Boxes:
+    boxes = as_boxes(boxes)
+    return np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+
+
+def translate(boxes, dx: float, dy: float) -> Boxes:
+    return as_boxes(boxes) + np.array([dx, dy, 0, 0])
+
+
+def scale(boxes, factor: Union[float, Tuple[float, float]]) -> Boxes:
+    """
+    Scale boxes by factor, or by (fx, fy) along each axis.
+    """
+    fx, fy = (factor, factor) if np.isscalar(factor) else factor
+    return as_boxes(boxes) * np.array([fx, fy, fx, fy])
+
+
+def clip(boxes, frame_size: Sequence[int]) -> Boxes:
+    """
+    Clip boxes to a frame of frame_size (width, height). Boxes outside
+    of the frame get a zero width or height.
+    """
+    xyxy = xywh_to_xyxy(boxes)
+    w, h = frame_size
+    np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+    np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+    return xyxy_to_xywh(xyxy)
+
+
+def iou_matrix(boxes_a, boxes_b) -> np.ndarray:
+    """
+    Pairwise intersection over union of boxes_a (N) and boxes_b (M) as
+    an NxM array, with the semantics of utils.bbox_intersection_over_union:
+    the intersection counts inclusive pixels (+1), and degenerate pairs,
+    where it would divide by zero, are 0.
+    """
+    a = as_boxes(boxes_a, np.float64)
+    b = as_boxes(boxes_b, np.float64)
+    xA = np.maximum(a[:, None, 0], b[None, :, 0])
+    yA = np.maximum(a[:, None, 1], b[None, :, 1])
+    xB = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+    yB = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+    inter_area = np.maximum(0, xB - xA + 1) * np.maximum(0, yB - yA + 1)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter_area
+    iou = np.divide(inter_area, union, out=np.zeros_like(union), where=union != 0)
+    return np.maximum(iou, 0, out=iou)
+
+
+def _components(adjacent: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Connected components of the graph of the NxN reflexive boolean
+    adjacency matrix adjacent, so chains of adjacent boxes form one
+    component. Returns the component of every box and their number.
+    """
+    component = np.full(len(adjacent), -1)
+    n = 0
+    for i in range(len(adjacent)):
+        if component[i] >= 0:
+            continue
+        members = adjacent[i]
+        while True:
+            grown = adjacent[members].any(axis=0)
+            if (grown == members).all():
+                break
+            members = grown
+        component[members] = n
+        n += 1
+    return component, n
+
+
+def merge_adjacent(boxes, distance: float) -> Boxes:
+    """
+    Merge boxes that are at most distance apart into their bounding box,
+    until no two boxes are that close.
+    """
+    boxes = as_boxes(boxes, np.int64)
+    while len(boxes) > 1:
+        x1, y1 = boxes[:, 0], boxes[:, 1]
+        x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+        near = (x1[:, None] <= x2[None, :] + distance) & (x1[None, :] <= x2[:, None] + distance) & \
+               (y1[:, None] <= y2[None, :] + distance) & (y1[None, :] <= y2[:, None] + distance)
+
+        group_of, n = _components(near)
+        if n == len(boxes):
+            break
+
+        gx1, gy1 = np.full(n, np.iinfo(np.int64).max), np.full(n, np.iinfo(np.int64).max)
+        gx2, gy2 = np.full(n, np.iinfo(np.int64).min), np.full(n, np.iinfo(np.int64).min)
+        np.minimum.at(gx1, group_of, x1)
+        np.minimum.at(gy1, group_of, y1)
+        np.maximum.at(gx2, group_of, x2)
+        np.maximum.at(gy2, group_of, y2)
+        boxes = np.stack([gx1, gy1, gx2 - gx1, gy2 - gy1], axis=1)
+    return boxes
@@ -0,0 +1,86 @@
+"""
+This module compares the array bbox operations of camera_tracker.bbox
+with the one-box-at-a-time functions of camera_tracker.utils, on random
+boxes:
+
+    python -m camera_tracker.bbox_benchmark --sizes 1x1 1x10 8x32 -o result.json
+"""
+import json
+import timeit
+import argparse
+import numpy as np
+from typing import Callable, Dict
+
+from . import bbox
+from . import utils
+
+
+def random_boxes(n: int, rng, frame_size=(640, 480)) -> np.ndarray:
+    wh = rng.integers(5, 100, (n, 2))
+    xy = rng.integers(0, frame_size, (n, 2))
+    return np.concatenate([xy, wh], axis=1)
+
+
+def best_time(func: Callable, repeat: int = 5) -> float:
+    """
+    Best time of one call of func in seconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def bench_size(n: int, m: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Time every operation on n boxes (and m for the pairwise ones), as
+    utils loops and as bbox calls. Results in microseconds.
+    """
+    rng = np.random.default_rng(seed)
+    boxes_a, boxes_b = random_boxes(n, rng), random_boxes(m, rng)
+    tuples_a = [tuple(int(v) for v in b) for b in boxes_a]
+    tuples_b = [tuple(int(v) for v in b) for b in boxes_b]
+
+    cases = {
+        'iou': (lambda: [[utils.bbox_intersection_over_union(a, b) for b in tuples_b]
+                         for a in tuples_a],
+                lambda: bbox.iou_matrix(boxes_a, boxes_b)),
+        'area': (lambda: [utils.bbox_area(a) for a in tuples_a],
+                 lambda: bbox.area(boxes_a)),
+        'scale': (lambda: [utils.scale_bbox(a, 0.5) for a in tuples_a],
+                  lambda: bbox.scale(boxes_a, 0.5)),
+        'translate': (lambda: [utils.translate_bbox(a, 3, 4) for a in tuples_a],
+                      lambda: bbox.translate(boxes_a, 3, 4)),
+    }
+    result = {}
+    for name, (scalar, vectorized) in cases.items():
+        result[name] = {
+            'utils_us': best_time(scalar) * 1e6,
+            'bbox_us': best_time(vectorized) * 1e6
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the array bbox operations against the scalar ones.')
+    parser.add_argument('--sizes', nargs='+', default=['1x1', '1x8', '8x8', '32x32'],
+                        metavar='NxM', help='numbers of boxes compared')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the result to this JSON file')
+    args = parser.parse_args(argv)
+
+    result = {}
+    for size in args.sizes:
+        n, m = (int(v) for v in size.split('x'))
+        result[size] = bench_size(n, m, args.seed)
+        for name, times in result[size].items():
+            print(f"{size:>7} {name:>9}: utils {times['utils_us']:8.2f} us, "
+                  f"bbox {times['bbox_us']:8.2f} us")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
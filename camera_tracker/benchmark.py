@@ -0,0 +1,368 @@
+"""
+This module provides a replayable benchmark of the whole TrackingSystem loop.
+
+Frames come from a recorded video, a session recording (see
+recording.py, whose commands are replayed too) or from a synthetic one
+(rectangles moving over noise, so it runs offline and has a ground
+truth), and are
+fed to the system as fast as it takes them. The result holds per-stage
+latency percentiles, throughput, allocations, tracking accuracy and the
+system's own metrics, and can be written as JSON to compare runs across
+commits and setting profiles:
+
+    python -m camera_tracker.benchmark app/setting_profiles/distance_5.py -o result.json
+"""
+import os
+import ast
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import contextlib
+import cv2
+import numpy as np
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .builder import build_tracking_system, load_settings
+from .capture import CapturedFrame
+from .recording import ReplaySource
+from .bbox import iou_matrix, scale
+from .utils import BoundingBox
+
+# (stage, attribute of the TrackingSystem, method) timed by the benchmark.
+# With a shared detector camera_moving includes detect. Detectors find
+# their boxes in predict_all, which predict and CameraMovingDetector call.
+STAGES = [
+    ('preprocess', 'preprocess_graph', 'run'),
+    ('camera_moving', 'camera_moving_detector', 'predict'),
+    ('detect', 'detector', 'predict_all'),
+    ('track', 'tracker', 'predict'),
+    ('tracker_init', 'tracker', 'init_tracker'),
+]
+
+PERCENTILES = (50, 90, 99)
+
+# a tracked box matching the ground truth at least this well is a success
+SUCCESS_IOU = 0.5
+
+
+class SyntheticVideo:
+    """
+    Rectangles moving at constant speed over noise, bouncing off the frame
+    borders. After a frame was generated, ground_truth[seq] holds the box
+    of every rectangle in it, in frame coordinates.
+    """
+
+    def __init__(self, n_frames: int = 300, frame_size=(640, 480),
+                 n_objects: int = 1, object_size=(60, 40),
+                 speed: float = 4.0, noise: float = 20, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        w, h = frame_size
+
+        self.n_frames = n_frames
+        self.frame_size = frame_size
+        self.object_size = object_size
+        self.ground_truth = {}
+
+        # a few noise frames are cycled, so generating a frame is cheap
+        self._noise = [rng.normal(60, noise, (h, w, 3)).clip(0, 255).astype(np.uint8)
+                       for _ in range(8)]
+        self._colors = [tuple(int(c) for c in rng.integers(150, 256, 3))
+                        for _ in range(n_objects)]
+        self._pos = rng.uniform((0, 0), (w - object_size[0], h - object_size[1]),
+                                (n_objects, 2))
+        angle = rng.uniform(0, 2 * np.pi, n_objects)
+        self._vel = speed * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+
+    def __iter__(self):
+        ow, oh = self.object_size
+        limit = np.array([self.frame_size[0] - ow, self.frame_size[1] - oh])
+        pos = self._pos.copy()
+        vel = self._vel.copy()
+
+        for seq in range(1, self.n_frames + 1):
+            frame = self._noise[seq % len(self._noise)].copy()
+            boxes = []
+            for (x, y), color in zip(pos.astype(int), self._colors):
+                frame[y:y + oh, x:x + ow] = color
+                boxes.append((int(x), int(y), ow, oh))
+            self.ground_truth[seq] = boxes
+
+            yield CapturedFrame(seq, time.monotonic(), frame)
+
+            pos += vel
+            vel[(pos < 0) | (pos > limit)] *= -1
+            pos = pos.clip(0, limit)
+
+
+def video_file_frames(path):
+    """
+    Yield the frames of a recorded video as CapturedFrame tuples.
+    """
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise RuntimeError(f'cannot open video {path}')
+
+    seq = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        seq += 1
+        yield CapturedFrame(seq, time.monotonic(), frame)
+    cap.release()
+
+
+def summarize(samples: List[float], scale: float = 1e3) -> Dict[str, float]:
+    """
+    Count, mean, percentiles and max of samples, multiplied by scale
+    (seconds to milliseconds by default).
+    """
+    if not samples:
+        return {'count': 0}
+
+    values = np.asarray(samples) * scale
+    summary = {'count': len(values), 'mean': float(values.mean())}
+    for p in PERCENTILES:
+        summary[f'p{p}'] = float(np.percentile(values, p))
+    summary['max'] = float(values.max())
+    return summary
+
+
+class Benchmark:
+    """
+    Run a TrackingSystem over a frame source and collect the measurements.
+
+    ground_truth maps a frame sequence number to the list of object boxes
+    in source frame coordinates (see SyntheticVideo). The first warmup
+    frames are left out of the latency and allocation figures.
+    """
+
+    def __init__(self, settings, source, ground_truth: Optional[Dict[int, List[BoundingBox]]] = None,
+                 warmup: int = 10, trace_allocations: bool = False):
+        self.settings = settings
+        self.source = source
+        self.ground_truth = ground_truth
+        self.warmup = warmup
+        self.trace_allocations = trace_allocations
+
+        self.tracking_sys = build_tracking_system(settings, self._feed())
+        if isinstance(source, ReplaySource):
+            source.attach(self.tracking_sys)
+
+        self._samples = defaultdict(list)
+        self._alloc_samples = []
+        self._ious = []
+        self._tracking_frames = 0
+        self._detected_frames = 0
+        self._frame_cnt = 0
+
+    def run(self, quiet: bool = True) -> Dict:
+        self._wrap_stages()
+        if self.trace_allocations:
+            tracemalloc.start()
+
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+            t0 = time.perf_counter()
+            with self.tracking_sys.run_lock:
+                self.tracking_sys.running = True
+            self.tracking_sys.run_sys()
+            wall_time = time.perf_counter() - t0
+
+        traced_peak = None
+        if self.trace_allocations:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self._unwrap_stages()
+
+        return {
+            'frames': self._frame_cnt,
+            'wall_time': wall_time,
+            'throughput_fps': self._frame_cnt / wall_time if wall_time else 0,
+            'latency_ms': {stage: summarize(samples)
+                           for stage, samples in self._samples.items()},
+            'allocations': None if not self.trace_allocations else {
+                'frame_peak_bytes': summarize(self._alloc_samples, scale=1),
+                'traced_peak_bytes': traced_peak
+            },
+            'accuracy': self._accuracy(),
+            'tracker': self.tracking_sys.tracker.get_stat(),
+            'metrics': self.tracking_sys.get_metrics()
+        }
+
+    def _feed(self):
+        """
+        The video source of the system. The time between handing out a
+        frame and being asked for the next one is the frame time.
+        """
+        prev_seq = None
+        it = iter(self.source)
+        while True:
+            if prev_seq is not None:
+                self._end_frame(prev_seq, time.perf_counter())
+
+            t0 = time.perf_counter()
+            frame = next(it, None)
+            t1 = time.perf_counter()
+            if frame is None:
+                return
+
+            prev_seq = frame.seq
+            if self._measuring():
+                self._samples['capture'].append(t1 - t0)
+            if self.trace_allocations:
+                tracemalloc.reset_peak()
+                self._alloc_base = tracemalloc.get_traced_memory()[0]
+            self._frame_start = time.perf_counter()
+            yield frame
+
+    def _end_frame(self, seq: int, t_end: float):
+        if self._measuring():
+            self._samples['frame'].append(t_end - self._frame_start)
+            if self.trace_allocations:
+                self._alloc_samples.append(
+                    tracemalloc.get_traced_memory()[1] - self._alloc_base)
+        self._frame_cnt += 1
+        if self._frame_cnt == self.warmup:
+            self.tracking_sys.metrics.reset()
+
+        ts = self.tracking_sys
+        self._detected_frames += bool(ts.detected)
+        if not ts.tracking:
+            return
+        self._tracking_frames += 1
+
+        if self.ground_truth is not None and seq in self.ground_truth:
+            self._ious.append(float(iou_matrix(
+                ts.track_bbox, self._to_tracker_coordinates(self.ground_truth[seq])).max(initial=0)))
+
+    def _to_tracker_coordinates(self, boxes: List[BoundingBox]) -> np.ndarray:
+        frame_size = getattr(self.source, 'frame_size', None)
+        if frame_size is None:
+            return np.asarray(boxes)
+        return scale(boxes, (self.settings.IMG_SIZE[0] / frame_size[0],
+                             self.settings.IMG_SIZE[1] / frame_size[1]))
+
+    def _accuracy(self) -> Dict[str, float]:
+        n = max(self._frame_cnt, 1)
+        accuracy = {
+            'tracking_ratio': self._tracking_frames / n,
+            'detection_ratio': self._detected_frames / n
+        }
+        if self.ground_truth is not None:
+            ious = np.asarray(self._ious)
+            accuracy['mean_iou'] = float(ious.mean()) if len(ious) else 0.0
+            # successful frames over all frames, a lost target counts as failure
+            accuracy['success_rate'] = float((ious >= SUCCESS_IOU).sum()) / n
+        return accuracy
+
+    def _measuring(self) -> bool:
+        return self._frame_cnt >= self.warmup
+
+    def _wrap_stages(self):
+        for stage, attr, method in STAGES:
+            obj = getattr(self.tracking_sys, attr)
+            setattr(obj, method, self._timed(stage, getattr(obj, method)))
+
+    def _unwrap_stages(self):
+        for _, attr, method in STAGES:
+            with contextlib.suppress(AttributeError):
+                delattr(getattr(self.tracking_sys, attr), method)
+
+    def _timed(self, stage, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if self._measuring():
+                    self._samples[stage].append(time.perf_counter() - t0)
+        return timed
+
+
+def run_benchmark(settings, source, ground_truth=None, **kwargs) -> Dict:
+    return Benchmark(settings, source, ground_truth, **kwargs).run()
+
+
+def _git_commit() -> Optional[str]:
+    with contextlib.suppress(Exception):
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL).decode().strip()
+    return None
+
+
+def _json_settings(settings) -> Dict:
+    out = {}
+    for name in dir(settings):
+        if name.isupper():
+            value = getattr(settings, name)
+            with contextlib.suppress(TypeError):
+                json.dumps(value)
+                out[name] = value
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tracking system loop.')
+    parser.add_argument('profile', help='setting profile, e.g. app/setting_profiles/distance_5.py')
+    parser.add_argument('--video', help='recorded video, a synthetic one is used by default')
+    parser.add_argument('--replay', help='session recording (see recording.py), replayed at max speed')
+    parser.add_argument('--frames', type=int, default=300, help='synthetic video length')
+    parser.add_argument('--objects', type=int, default=1, help='moving objects in the synthetic video')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--trace-allocations', action='store_true',
+                        help='measure allocations with tracemalloc (slows the loop down)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a setting, VALUE is a Python literal')
+    parser.add_argument('-o', '--output', help='write the result to this JSON file')
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        overrides[name] = ast.literal_eval(value)
+    settings = load_settings(args.profile, **overrides)
+
+    if args.replay:
+        source, ground_truth = ReplaySource(args.replay, realtime=False), None
+    elif args.video:
+        source, ground_truth = video_file_frames(args.video), None
+    else:
+        source = SyntheticVideo(args.frames, n_objects=args.objects, seed=args.seed)
+        ground_truth = source.ground_truth
+
+    result = run_benchmark(settings, source, ground_truth, warmup=args.warmup,
+                           trace_allocations=args.trace_allocations)
+    result['meta'] = {
+        'commit': _git_commit(),
+        'profile': str(args.profile),
+        'source': args.replay or args.video or f'synthetic(frames={args.frames}, objects={args.objects}, seed={args.seed})',
+        'settings': _json_settings(settings),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+    print(f"{result['frames']} frames, {result['throughput_fps']:.1f} fps")
+    for stage, summary in result['latency_ms'].items():
+        if summary['count']:
+            print(f"{stage:>14}: p50 {summary['p50']:.2f} ms, p99 {summary['p99']:.2f} ms")
+    print('accuracy:', result['accuracy'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
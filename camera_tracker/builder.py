@@ -0,0 +1,172 @@
+"""
+This module builds a TrackingSystem from a settings module, so the app,
+the tests and the benchmarks set the system up the same way.
+"""
+import sys
+import importlib.util
+from pathlib import Path
+
+import camera_tracker.pipeline_components as pc
+import camera_tracker.predictors as predictors
+import camera_tracker.utils as utils
+from camera_tracker.kalman import ConstantVelocityKalman
+from camera_tracker.multi_tracker import MultiTargetTracker
+from camera_tracker.recording import SessionRecorder
+from camera_tracker.scheduler import FrameScheduler
+from camera_tracker.tracking_system import TrackingSystem
+
+
+# settings build_tracking_system and StreamManager read. Every setting
+# profile defines them, most through the shared setting_profiles/base.py,
+# so the app, the tests and the benchmarks run the configuration that is
+# deployed.
+REQUIRED_SETTINGS = (
+    'IMG_SIZE', 'DISPLAY', 'CAPTURE_POLICY', 'CAPTURE_BUFFER_SIZE',
+    'REUSE_BUFFERS', 'PIPELINED', 'TRACKER_NAME', 'ACCURATE_TRACKER_NAME',
+    'IOU_THRESHOLD', 'MAX_TRACKER_HEALTH', 'ROI_SCALE', 'VALID_LOC_FRAME_CNT',
+    'DETECTOR', 'BBOX_AREA_MIN_TH', 'BBOX_AREA_MAX_TH', 'PIXEL_DIFFERENCE_TH',
+    'STRUCTURING_KERNEL_SHAPE', 'DETECTION_PYRAMID_LEVEL', 'BBOX_MAX_ASPECT_RATIO',
+    'DETECTION_MERGE_DISTANCE', 'BACKGROUND_LEARNING_RATE', 'CAMERA_MOVING_THRESHOLD',
+    'MOTION_COMPENSATION', 'KALMAN_FILTER', 'KALMAN_PROCESS_NOISE',
+    'KALMAN_MEASUREMENT_NOISE', 'MAX_DETECTION_SKIP', 'DETECTION_SKIP_DISTANCE',
+    'MULTI_TARGET', 'MAX_ACTIVE_TRACKERS', 'MAX_TRACKS', 'FRAME_BUDGET',
+    'ADAPTIVE_SCHEDULING', 'MAX_DETECTION_INTERVAL', 'RECORD_PATH', 'RECORD_COMPRESSION',
+)
+
+
+def check_settings(settings):
+    """
+    Raise a ValueError naming the required settings settings lacks.
+    """
+    missing = [name for name in REQUIRED_SETTINGS if not hasattr(settings, name)]
+    if missing:
+        raise ValueError(f'missing settings: {", ".join(missing)}')
+
+
+def load_settings(profile_path, **overrides):
+    """
+    Load a setting profile (e.g. app/setting_profiles/distance_5.py) as a
+    settings module, overrides replace any setting. Raises a ValueError
+    when the profile, with the modules it imports from its directory,
+    lacks a required setting.
+    """
+    profile_path = Path(profile_path).resolve()
+    # the profile directory is the package of the profile, for its
+    # relative imports (from .base import *)
+    package = profile_path.parent.name
+    if package not in sys.modules:
+        package_spec = importlib.util.spec_from_loader(package, None, is_package=True)
+        package_spec.submodule_search_locations.append(str(profile_path.parent))
+        sys.modules[package] = importlib.util.module_from_spec(package_spec)
+    spec = importlib.util.spec_from_file_location(
+        f'{package}.{profile_path.stem}', profile_path)
+    settings = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(settings)
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    check_settings(settings)
+    return settings
+
+
+def build_tracking_system(settings, video_source, **kwargs) -> TrackingSystem:
+    """
+    Build a TrackingSystem from settings. kwargs are passed on to it,
+    e.g. a shared executor.
+
+    With RECORD_PATH the session is recorded there, a named system (see
+    StreamManager) records to RECORD_PATH with its name before the suffix.
+    """
+    check_settings(settings)
+    pre_tracker_pipe = [
+        pc.ResizeTransformer(out_size=settings.IMG_SIZE,
+                             reuse_buffers=settings.REUSE_BUFFERS)
+    ]
+
+    # detection runs on a pyramid level, the blur kernel shrinks with it
+    detection_downscale = 2 ** settings.DETECTION_PYRAMID_LEVEL
+    pre_detector_pipe = [
+        pc.ResizeTransformer(out_size=settings.IMG_SIZE,
+                             reuse_buffers=settings.REUSE_BUFFERS),
+        pc.GrayscaleTransformer(reuse_buffers=settings.REUSE_BUFFERS),
+        pc.PyrDownTransformer(levels=settings.DETECTION_PYRAMID_LEVEL,
+                              reuse_buffers=settings.REUSE_BUFFERS),
+        pc.BlurTransformer(ksize=utils.scale_kernel_size((21, 21), detection_downscale),
+                           reuse_buffers=settings.REUSE_BUFFERS)
+    ]
+
+    detector_kwargs = dict(pixel_difference_threshold=settings.PIXEL_DIFFERENCE_TH,
+                           structuring_kernel_shape=settings.STRUCTURING_KERNEL_SHAPE,
+                           bbox_area_min=settings.BBOX_AREA_MIN_TH,
+                           bbox_area_max=settings.BBOX_AREA_MAX_TH,
+                           reuse_buffers=settings.REUSE_BUFFERS,
+                           downscale=detection_downscale,
+                           motion_estimator=predictors.GlobalMotionEstimator()
+                           if settings.MOTION_COMPENSATION else None,
+                           max_aspect_ratio=settings.BBOX_MAX_ASPECT_RATIO,
+                           merge_distance=settings.DETECTION_MERGE_DISTANCE)
+    # 'pixel_difference' compares consecutive frames, the other detectors
+    # compare with a background model
+    if settings.DETECTOR == 'pixel_difference':
+        detector = predictors.PixelDifferenceDetector(**detector_kwargs)
+    else:
+        detector = predictors.BackgroundSubtractionDetector(model=settings.DETECTOR,
+                                                            learning_rate=settings.BACKGROUND_LEARNING_RATE,
+                                                            **detector_kwargs)
+    if settings.ACCURATE_TRACKER_NAME:
+        tracker = predictors.CascadeTracker(tracker_name=settings.TRACKER_NAME,
+                                            tracker_health=settings.MAX_TRACKER_HEALTH,
+                                            accurate_tracker_name=settings.ACCURATE_TRACKER_NAME,
+                                            frame_budget=settings.FRAME_BUDGET,
+                                            roi_scale=settings.ROI_SCALE)
+    else:
+        tracker = predictors.CvTracker(tracker_name=settings.TRACKER_NAME,
+                                       tracker_health=settings.MAX_TRACKER_HEALTH,
+                                       roi_scale=settings.ROI_SCALE)
+    # shares the detector, so the difference mask is computed once per frame
+    camera_moving_detector = predictors.CameraMovingDetector(
+        detector, settings.CAMERA_MOVING_THRESHOLD)
+
+    kalman = None
+    if settings.KALMAN_FILTER:
+        kalman = ConstantVelocityKalman(process_noise=settings.KALMAN_PROCESS_NOISE,
+                                        measurement_noise=settings.KALMAN_MEASUREMENT_NOISE)
+
+    multi_target_tracker = None
+    if settings.MULTI_TARGET:
+        multi_target_tracker = MultiTargetTracker(
+            lambda: predictors.CvTracker(tracker_name=settings.TRACKER_NAME,
+                                         tracker_health=settings.MAX_TRACKER_HEALTH),
+            settings.MAX_TRACKER_HEALTH,
+            iou_threshold=settings.IOU_THRESHOLD,
+            max_active_trackers=settings.MAX_ACTIVE_TRACKERS,
+            max_tracks=settings.MAX_TRACKS)
+
+    scheduler = None
+    if settings.ADAPTIVE_SCHEDULING:
+        scheduler = FrameScheduler(settings.FRAME_BUDGET,
+                                   max_detection_interval=settings.MAX_DETECTION_INTERVAL)
+
+    if settings.RECORD_PATH and 'recorder' not in kwargs:
+        path = Path(settings.RECORD_PATH)
+        if kwargs.get('name') is not None:
+            path = path.with_name(f"{path.stem}.{kwargs['name']}{path.suffix}")
+        kwargs['recorder'] = SessionRecorder(str(path), compression=settings.RECORD_COMPRESSION)
+
+    tracking_sys = TrackingSystem(tracker=tracker,
+                                  detector=detector,
+                                  camera_moving_detector=camera_moving_detector,
+                                  pre_tracker_pipe=pre_tracker_pipe,
+                                  pre_detector_pipe=pre_detector_pipe,
+                                  video_source=video_source,
+                                  iou_threshold=settings.IOU_THRESHOLD,
+                                  valid_loc_frame_cnt=settings.VALID_LOC_FRAME_CNT,
+                                  display=settings.DISPLAY,
+                                  pipelined=settings.PIPELINED,
+                                  kalman=kalman,
+                                  multi_target_tracker=multi_target_tracker,
+                                  scheduler=scheduler,
+                                  max_detection_skip=settings.MAX_DETECTION_SKIP,
+                                  detection_skip_distance=settings.DETECTION_SKIP_DISTANCE,
+                                  **kwargs)
+    return tracking_sys
@@ -0,0 +1,192 @@
+"""
+This module provides a threaded frame grabber, so the camera driver is
+drained continuously while the tracking loop is busy with a frame.
+"""
+import time
+import threading
+import numpy as np
+from collections import deque, namedtuple
+from typing import Dict, Optional
+
+# a frame together with its sequence number and the monotonic time it was read
+CapturedFrame = namedtuple('CapturedFrame', ['seq', 'timestamp', 'image'])
+
+# capture policies
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+LATEST_ONLY = 'latest_only'
+
+POLICIES = (DROP_OLDEST, BLOCK, LATEST_ONLY)
+
+
+class FrameCapture:
+    """
+    Read frames from a cv2.VideoCapture on its own thread into a bounded
+    ring of preallocated frame buffers, plus a spare buffer the next frame
+    is read into when the ring is full, so no frame is dropped before a
+    newer one has actually been read.
+
+    When the ring is full the policy decides what happens:
+    1. drop_oldest: the oldest unread frame is overwritten.
+    2. block: the capture thread waits for the consumer, no frame is lost.
+    3. latest_only: only the newest frame is kept, so the consumer always
+                    gets the freshest frame.
+
+    Iterating over a FrameCapture yields CapturedFrame tuples, so it can be
+    used as the video_source of a TrackingSystem. The image of a yielded
+    frame lives in a ring slot and stays valid until two more frames have
+    been read; copy it if it has to live longer.
+    """
+
+    # number of frames the consumer may still be holding
+    HELD_FRAMES = 2
+
+    def __init__(self, cap, buffer_size: int = 4, policy: str = LATEST_ONLY):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown capture policy: {policy}')
+        if buffer_size < self.HELD_FRAMES + 1:
+            raise ValueError(
+                f'buffer_size must be at least {self.HELD_FRAMES + 1}')
+
+        self._cap = cap
+        self.buffer_size = buffer_size
+        self.policy = policy
+
+        self._buffers = None
+        self._free = list(range(buffer_size))
+        self._spare = buffer_size
+        self._ready = deque()
+        self._held = deque()
+        self._cond = threading.Condition()
+
+        self.thread = None
+        self.running = False
+        self.eof = False
+
+        # stats
+        self.frame_cnt = 0
+        self.dropped_cnt = 0
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+
+        self.thread = threading.Thread(
+            target=self._run, name='FrameCapture', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._cap.release()
+
+    def read(self, timeout: Optional[float] = None) -> Optional[CapturedFrame]:
+        """
+        Return the next captured frame, or None when the stream ended,
+        the capture was stopped or the timeout expired.
+        """
+        with self._cond:
+            while not self._ready:
+                if self.eof or not self.running:
+                    return None
+                if not self._cond.wait(timeout):
+                    return None
+
+            seq, timestamp, slot, image = self._ready.popleft()
+
+            # the oldest frame handed out is no longer in use
+            self._held.append(slot)
+            if len(self._held) > self.HELD_FRAMES:
+                self._free.append(self._held.popleft())
+            self._cond.notify_all()
+
+        return CapturedFrame(seq, timestamp, image)
+
+    def __iter__(self):
+        self.start()
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def get_stat(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'frame_count': self.frame_cnt,
+                'dropped_count': self.dropped_cnt,
+                'queued_count': len(self._ready)
+            }
+
+    def _acquire_slot(self) -> Optional[int]:
+        with self._cond:
+            while self.running:
+                if self._free:
+                    return self._free.pop()
+                if self.policy != BLOCK:
+                    return self._spare
+                self._cond.wait()
+        return None
+
+    def _read_into(self, slot: int):
+        if self._buffers is None:
+            ret, frame = self._cap.read()
+        else:
+            ret, frame = self._cap.read(self._buffers[slot])
+
+        if not ret:
+            return None
+
+        if self._buffers is None or frame.shape != self._buffers.shape[1:] \
+                or frame.dtype != self._buffers.dtype:
+            # first frame or the resolution changed. Frames still held by
+            # the consumer keep the old ring alive until they are released.
+            self._buffers = np.empty(
+                (self.buffer_size + 1,) + frame.shape, dtype=frame.dtype)
+
+        buf = self._buffers[slot]
+        if frame is not buf:
+            np.copyto(buf, frame)
+        return buf
+
+    def _run(self):
+        while True:
+            slot = self._acquire_slot()
+            if slot is None:
+                return
+
+            image = self._read_into(slot)
+            timestamp = time.monotonic()
+
+            with self._cond:
+                if image is None:
+                    if slot != self._spare:
+                        self._free.append(slot)
+                    self.eof = True
+                    self._cond.notify_all()
+                    return
+
+                if slot == self._spare:
+                    # the oldest ready frame gives its slot to the next read
+                    if self._ready:
+                        self._spare = self._ready.popleft()[2]
+                        self.dropped_cnt += 1
+                    else:
+                        # the consumer took it meanwhile and freed a slot
+                        self._spare = self._free.pop()
+
+                self.frame_cnt += 1
+                if self.policy == LATEST_ONLY:
+                    while self._ready:
+                        self._free.append(self._ready.popleft()[2])
+                        self.dropped_cnt += 1
+
+                self._ready.append((self.frame_cnt, timestamp, slot, image))
+                self._cond.notify_all()
@@ -0,0 +1,169 @@
+"""
+This module provides the control channel of the camera tracker: an
+asyncio server on a Unix domain socket, and a blocking client for it.
+
+Messages are JSON objects, each prefixed by its length as a 4-byte
+big-endian integer. A request names a command and its arguments,
+
+    {"cmd": "select_target", "bbox": [10, 20, 30, 40]}
+
+and every request gets a reply, in order on its connection:
+
+    {"ok": true, "result": ...}
+    {"ok": false, "error": "unknown command: foo"}
+
+Connections are handled concurrently. Handlers are blocking functions,
+they run in a thread pool so a slow command (e.g. a gimbal move) does
+not hold up the others.
+"""
+import os
+import json
+import socket
+import struct
+import asyncio
+import threading
+from contextlib import suppress
+from typing import Callable, Dict, Optional
+
+LENGTH = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 1 << 20
+
+
+class ControlError(Exception):
+    pass
+
+
+def encode_message(msg: dict) -> bytes:
+    data = json.dumps(msg).encode()
+    return LENGTH.pack(len(data)) + data
+
+
+def decode_message(data: bytes) -> dict:
+    msg = json.loads(data)
+    if not isinstance(msg, dict):
+        raise ControlError('message must be a JSON object')
+    return msg
+
+
+class ControlServer:
+    """
+    Serve commands on a Unix domain socket at path. handlers maps a
+    command name to a function called with the request arguments, whose
+    return value is the result of the reply.
+    """
+
+    def __init__(self, path: str, handlers: Dict[str, Callable]):
+        self.path = path
+        self.handlers = handlers
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='control_server', daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join()
+            self._loop = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.path)
+        self._started.set()
+        try:
+            await self._server.wait_closed()
+        finally:
+            with suppress(OSError):
+                os.unlink(self.path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(LENGTH.size)
+                except asyncio.IncompleteReadError:
+                    break
+                size, = LENGTH.unpack(header)
+                if size > MAX_MESSAGE_SIZE:
+                    writer.write(encode_message(
+                        {'ok': False, 'error': 'message too large'}))
+                    break
+                reply = await self._dispatch(await reader.readexactly(size))
+                writer.write(encode_message(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, data: bytes) -> dict:
+        try:
+            request = decode_message(data)
+            cmd = request.pop('cmd', None)
+            handler = self.handlers.get(cmd)
+            if handler is None:
+                raise ControlError(f'unknown command: {cmd}')
+            result = await self._loop.run_in_executor(None, lambda: handler(**request))
+        except Exception as e:
+            return {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        return {'ok': True, 'result': result}
+
+
+class ControlClient:
+    """
+    Blocking client of a ControlServer.
+
+        with ControlClient(path) as client:
+            client.request('select_target', bbox=[10, 20, 30, 40])
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = 5):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def request(self, cmd: str, **args):
+        """
+        Send a command and return the result of its reply. Raises
+        ControlError when the command failed.
+        """
+        self.sock.sendall(encode_message(dict(args, cmd=cmd)))
+        size, = LENGTH.unpack(self._recv_exactly(LENGTH.size))
+        reply = decode_message(self._recv_exactly(size))
+        if not reply.get('ok'):
+            raise ControlError(reply.get('error'))
+        return reply.get('result')
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.sock.recv(size - len(buf))
+            if not chunk:
+                raise ControlError('connection closed')
+            buf += chunk
+        return bytes(buf)
@@ -0,0 +1,143 @@
+"""
+This module provides a shared-memory frame channel: one process writes
+frames into a memory-mapped file, other processes (e.g. the web server)
+map it read-only and copy the latest frame out when they need it.
+
+The file starts with a header guarded by a sequence lock: the writer makes
+seq odd before updating the frame and even again afterwards, and a reader
+retries when seq was odd or changed while it copied the frame.
+Python has no memory fences, so on weakly ordered CPUs a torn frame
+remains possible in theory; the channel is meant for display frames.
+"""
+import os
+import mmap
+import time
+import struct
+import numpy as np
+from collections import namedtuple
+from typing import Optional, Tuple
+
+import cv2
+
+MAGIC = b'CTFC'
+VERSION = 1
+
+# magic, version, seq, frame number, timestamp, height, width, channels
+HEADER = struct.Struct('<4sIQQdIII')
+HEADER_SIZE = 64
+SEQ_OFFSET = 8
+
+SharedFrame = namedtuple('SharedFrame', ['seq', 'frame_no', 'timestamp', 'image'])
+
+
+class SharedFrameWriter:
+    """
+    Writer side of the channel. Frames are uint8 images of at most
+    max_shape (height, width, channels).
+    """
+
+    def __init__(self, path: str, max_shape: Tuple[int, int, int] = (1080, 1920, 3)):
+        self.path = path
+        self.capacity = int(np.prod(max_shape))
+        self.seq = 0
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + self.capacity)
+            self._mm = mmap.mmap(fd, HEADER_SIZE + self.capacity)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, 0, 0, 0.0, 0, 0, 0)
+        self._data = np.frombuffer(self._mm, dtype=np.uint8,
+                                   count=self.capacity, offset=HEADER_SIZE)
+
+    def write(self, frame: np.ndarray, frame_no: int = 0, timestamp: Optional[float] = None):
+        if frame.dtype != np.uint8 or frame.size > self.capacity:
+            raise ValueError(
+                f'frame must be uint8 and at most {self.capacity} bytes')
+        if timestamp is None:
+            timestamp = time.monotonic()
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+
+        self._set_seq(self.seq + 1)
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.seq,
+                         frame_no, timestamp, h, w, c)
+        np.copyto(self._data[:frame.size].reshape(frame.shape), frame)
+        self._set_seq(self.seq + 1)
+
+    def close(self, unlink: bool = False):
+        self._data = None
+        self._mm.close()
+        if unlink:
+            os.unlink(self.path)
+
+    def _set_seq(self, seq: int):
+        self.seq = seq
+        struct.pack_into('<Q', self._mm, SEQ_OFFSET, seq)
+
+
+class SharedFrameReader:
+    """
+    Reader side of the channel, mapping the file read-only.
+    """
+
+    # attempts to get a consistent frame before giving up
+    MAX_RETRIES = 10
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = HEADER.unpack_from(self._mm, 0)[:2]
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f'{path} is not a frame channel')
+
+    @property
+    def seq(self) -> int:
+        return struct.unpack_from('<Q', self._mm, SEQ_OFFSET)[0]
+
+    def read(self, out: Optional[np.ndarray] = None,
+             last_seq: Optional[int] = None) -> Optional[SharedFrame]:
+        """
+        Copy the latest frame into out (allocated when None or of another
+        shape). Returns None when there is no frame yet, when the frame is
+        still the one of last_seq, or when no consistent copy could be made.
+        """
+        for _ in range(self.MAX_RETRIES):
+            _, _, seq, frame_no, timestamp, h, w, c = HEADER.unpack_from(self._mm, 0)
+            if seq == 0 or seq == last_seq:
+                return None
+            if seq % 2:
+                # a frame is being written
+                time.sleep(0)
+                continue
+
+            shape = (h, w, c) if c > 1 else (h, w)
+            if out is None or out.shape != shape:
+                out = np.empty(shape, dtype=np.uint8)
+            src = np.frombuffer(self._mm, dtype=np.uint8, count=out.size,
+                                offset=HEADER_SIZE).reshape(shape)
+            np.copyto(out, src)
+
+            if self.seq == seq:
+                return SharedFrame(seq, frame_no, timestamp, out)
+        return None
+
+    def read_jpeg(self, quality: int = 80, last_seq: Optional[int] = None):
+        """
+        JPEG-encode the latest frame, for remote clients. Returns the
+        frame seq and the encoded bytes, or None as read does.
+        """
+        frame = self.read(last_seq=last_seq)
+        if frame is None:
+            return None
+        success, img = cv2.imencode('.jpg', frame.image,
+                                    [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not success:
+            return None
+        return frame.seq, img.tobytes()
+
+    def close(self):
+        self._mm.close()
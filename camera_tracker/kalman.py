@@ -0,0 +1,101 @@
+"""
+This module provides a constant-velocity Kalman filter for the target
+location, used to smooth it and to predict where the target will be.
+"""
+import math
+import numpy as np
+from typing import Optional, Tuple
+
+Point = Tuple[float, float]
+
+_H = np.array([[1., 0., 0., 0.],
+               [0., 1., 0., 0.]])
+
+
+class ConstantVelocityKalman:
+    """
+    Kalman filter of a 2D point moving at (nearly) constant velocity.
+    The state is (x, y, vx, vy), velocities in pixels per second.
+
+    Time steps come from the measurement timestamps (seconds), so dropped
+    frames and a varying frame rate are accounted for.
+
+    process_noise: variance of the acceleration (pixels / s^2)^2
+    measurement_noise: variance of a measured position (pixels^2)
+    """
+
+    def __init__(self, process_noise: float = 2000.0, measurement_noise: float = 25.0,
+                 initial_velocity_variance: float = 1e4):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.initial_velocity_variance = initial_velocity_variance
+
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.timestamp = None
+        self._R = measurement_noise * np.eye(2)
+
+    @property
+    def initialized(self) -> bool:
+        return self.timestamp is not None
+
+    @property
+    def location(self) -> Optional[Point]:
+        if not self.initialized:
+            return None
+        return float(self.x[0]), float(self.x[1])
+
+    @property
+    def velocity(self) -> Optional[Point]:
+        if not self.initialized:
+            return None
+        return float(self.x[2]), float(self.x[3])
+
+    def reset(self):
+        self.timestamp = None
+
+    def update(self, measurement: Point, timestamp: float):
+        """
+        Fold in a measured position taken at timestamp.
+        """
+        z = np.asarray(measurement, dtype=float)
+        if not self.initialized:
+            self.x = np.array([z[0], z[1], 0., 0.])
+            self.P = np.diag([self.measurement_noise, self.measurement_noise,
+                              self.initial_velocity_variance, self.initial_velocity_variance])
+            self.timestamp = timestamp
+            return
+
+        x, P = self._propagate(max(timestamp - self.timestamp, 0.0))
+        y = z - _H @ x
+        S = _H @ P @ _H.T + self._R
+        K = P @ _H.T @ np.linalg.inv(S)
+        self.x = x + K @ y
+        self.P = (np.eye(4) - K @ _H) @ P
+        self.timestamp = timestamp
+
+    def predict(self, timestamp: float) -> Optional[Point]:
+        """
+        Predicted position at timestamp, without changing the filter.
+        """
+        if not self.initialized:
+            return None
+        dt = timestamp - self.timestamp
+        return float(self.x[0] + self.x[2] * dt), float(self.x[1] + self.x[3] * dt)
+
+    def distance(self, point: Point, timestamp: float) -> float:
+        """
+        Distance between point and the position predicted at timestamp.
+        """
+        px, py = self.predict(timestamp)
+        return math.hypot(point[0] - px, point[1] - py)
+
+    def _propagate(self, dt: float):
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        dt2 = dt * dt
+        q = self.process_noise * np.array([[dt2 * dt2 / 4, 0, dt2 * dt / 2, 0],
+                                           [0, dt2 * dt2 / 4, 0, dt2 * dt / 2],
+                                           [dt2 * dt / 2, 0, dt2, 0],
+                                           [0, dt2 * dt / 2, 0, dt2]])
+        return F @ self.x, F @ self.P @ F.T + q
@@ -0,0 +1,231 @@
+"""
+This module provides low-overhead timing of the hot path: per-stage
+latency histograms and counters, and an exporter that dumps them to a
+file or serves them as Prometheus text.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# histogram bucket upper bounds in seconds, 10us to ~20s, sqrt(2) apart
+BUCKETS = tuple(1e-5 * 2 ** (i / 2) for i in range(42))
+
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed, logarithmically spaced buckets.
+    Percentiles are estimated by interpolating inside a bucket.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                value = lower + (upper - lower) * (rank - seen) / n
+                return min(max(value, self.min), self.max)
+            seen += n
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        summary = {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max
+        }
+        for p in PERCENTILES:
+            summary[f'p{p}'] = self.percentile(p)
+        return summary
+
+
+class _StageTimer:
+    __slots__ = ('_metrics', '_stage', '_t0')
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._stage, time.perf_counter() - self._t0)
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage latency histograms (in seconds) and
+    counters.
+
+        with metrics.time('detect'):
+            detector.predict(frame)
+        metrics.incr('detections')
+
+    A disabled registry ignores everything, so instrumentation can stay
+    in the code at no cost.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self.start_time = time.monotonic()
+
+    def time(self, stage: str) -> _StageTimer:
+        return _StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = Histogram()
+            hist.observe(seconds)
+
+    def incr(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self.start_time = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'uptime': time.monotonic() - self.start_time,
+                'stages': {stage: hist.snapshot()
+                           for stage, hist in self._histograms.items()},
+                'counters': dict(self._counters)
+            }
+
+    def to_prometheus(self, prefix: str = 'camera_tracker') -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = [f'# TYPE {prefix}_stage_seconds histogram']
+        with self._lock:
+            for stage, hist in self._histograms.items():
+                cumulative = 0
+                for bound, n in zip(BUCKETS, hist.counts):
+                    cumulative += n
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(
+                    f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {hist.sum:.9g}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+            for name, value in self._counters.items():
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+                lines.append(f'{prefix}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    Periodically dump metrics to a JSON file, and/or serve them as
+    Prometheus text on http://127.0.0.1:<port>/metrics.
+
+    get_metrics returns the JSON-able metrics to dump (e.g.
+    TrackingSystem.get_metrics).
+    """
+
+    def __init__(self, metrics: Metrics, get_metrics=None,
+                 path: Optional[str] = None, port: Optional[int] = None,
+                 interval: float = 10):
+        self.metrics = metrics
+        self.get_metrics = get_metrics or metrics.snapshot
+        self.path = path
+        self.port = port
+        self.interval = interval
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        if self.path is not None:
+            self._thread = threading.Thread(
+                target=self._dump_loop, name='metrics_dump', daemon=True)
+            self._thread.start()
+
+        if self.port is not None:
+            self._server = ThreadingHTTPServer(
+                ('127.0.0.1', self.port), self._handler_class())
+            threading.Thread(target=self._server.serve_forever,
+                             name='metrics_http', daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def dump(self):
+        # write then rename, so readers never see a partial file
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.get_metrics(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _dump_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
+
+    def _handler_class(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,180 @@
+"""
+This module tracks several targets at once. Every target keeps its ID
+for as long as it is tracked, so the operator can choose which one the
+gimbal follows.
+"""
+import itertools
+import numpy as np
+from typing import Callable, List, Optional
+
+from .bbox import iou_matrix
+from .predictors import CvTracker
+from .utils import BoundingBox, Image
+
+
+class Track:
+    """
+    A tracked target.
+
+    hits counts the frames a detection confirmed the track, health drops
+    on every frame without one and the track is dropped at 0.
+
+    A stale track waited for its turn and its tracker missed frames, it
+    predicts from its last state at its next turn. When the tracker of a
+    track fails, the next matching detection corrects the box and the
+    tracker restarts from it.
+    """
+
+    def __init__(self, track_id: int, tracker: CvTracker, bbox: BoundingBox, health: int):
+        self.id = track_id
+        self.tracker = tracker
+        self.bbox = bbox
+        self.health = health
+        self.hits = 1
+        self.age = 0
+        # whether a detection confirmed the track in the last frame
+        self.matched = False
+        # the tracker missed frames
+        self.stale = False
+        # the last tracker update failed
+        self.lost = False
+        # the tracker is initialized on bbox at its next turn
+        self.needs_init = False
+        self.last_update = 0
+
+
+class MultiTargetTracker:
+    """
+    Track several targets with one CvTracker each.
+
+    Every frame, predict updates the trackers, at most max_active_trackers
+    of them to bound the cost (the selected target first, then the ones
+    waiting longest), and associate matches the detections to the tracks
+    by IoU. Unmatched detections start new tracks. Trackers keep their
+    state while they wait for their turn, they are re-initialized only
+    when a detection corrected the box of a track whose tracker failed.
+    """
+
+    def __init__(self, tracker_factory: Callable[[], CvTracker], tracker_health: int,
+                 iou_threshold: float = 0.3, max_active_trackers: int = 4,
+                 max_tracks: int = 8):
+        self.tracker_factory = tracker_factory
+        self.tracker_health = tracker_health
+        self.iou_threshold = iou_threshold
+        self.max_active_trackers = max_active_trackers
+        self.max_tracks = max_tracks
+
+        self.tracks: List[Track] = []
+        self.selected_id = None
+        self._ids = itertools.count(1)
+        self._frame_cnt = 0
+
+    @property
+    def selected(self) -> Optional[Track]:
+        for track in self.tracks:
+            if track.id == self.selected_id:
+                return track
+        return None
+
+    def select(self, track_id: Optional[int]) -> bool:
+        """
+        Choose the target to follow. Returns False when there is no
+        track with this ID.
+        """
+        if track_id is not None and all(t.id != track_id for t in self.tracks):
+            return False
+        self.selected_id = track_id
+        return True
+
+    def add(self, img: Image, bbox: BoundingBox) -> Track:
+        """
+        Start tracking bbox right away, e.g. a target the operator chose.
+        """
+        track = Track(next(self._ids), self.tracker_factory(), bbox, self.tracker_health)
+        track.tracker.init_tracker(img, bbox)
+        track.last_update = self._frame_cnt
+        self.tracks.append(track)
+        return track
+
+    def reset(self):
+        self.tracks = []
+        self.selected_id = None
+
+    def predict(self, img: Image) -> List[Track]:
+        """
+        Update the trackers on img, returns the tracks.
+        """
+        self._frame_cnt += 1
+        if not self.tracks:
+            return self.tracks
+
+        # selected target first, then the ones updated longest ago
+        order = sorted(self.tracks, key=lambda t: (t.id != self.selected_id, t.last_update))
+        for track in order[:self.max_active_trackers]:
+            track.last_update = self._frame_cnt
+            if track.needs_init:
+                track.tracker.init_tracker(img, track.bbox)
+                track.needs_init = False
+                track.lost = False
+                track.stale = False
+                continue
+            ok, bbox = track.tracker.predict(img)
+            track.stale = False
+            # health drops in associate unless a detection re-anchors a
+            # lost track
+            track.lost = not ok
+            if ok:
+                track.bbox = bbox
+        for track in order[self.max_active_trackers:]:
+            track.stale = True
+        return self.tracks
+
+    def associate(self, detections: np.ndarray) -> List[Track]:
+        """
+        Match detections (Nx4 array) to the tracks, start tracks for the
+        unmatched ones and drop the tracks whose health ran out.
+        """
+        detections = np.asarray(detections).reshape(-1, 4)
+        matched_tracks = set()
+        matched_detections = set()
+
+        if self.tracks and len(detections):
+            iou = iou_matrix([t.bbox for t in self.tracks], detections)
+            # greedy matching, best pairs first
+            for flat in np.argsort(-iou, axis=None):
+                i, j = divmod(int(flat), iou.shape[1])
+                if iou[i, j] < self.iou_threshold:
+                    break
+                if i in matched_tracks or j in matched_detections:
+                    continue
+                matched_tracks.add(i)
+                matched_detections.add(j)
+
+                track = self.tracks[i]
+                track.hits += 1
+                track.health = self.tracker_health
+                if track.lost:
+                    # correct the box the tracker will restart from
+                    track.bbox = tuple(int(v) for v in detections[j])
+                    track.needs_init = True
+
+        for i, track in enumerate(self.tracks):
+            track.age += 1
+            track.matched = i in matched_tracks
+            if not track.matched:
+                track.health -= 1
+        self.tracks = [t for t in self.tracks if t.health > 0]
+        if self.selected is None:
+            self.selected_id = None
+
+        for j, bbox in enumerate(detections):
+            if j in matched_detections or len(self.tracks) >= self.max_tracks:
+                continue
+            # the tracker is initialized at its first turn in predict, so
+            # many new targets do not blow the per-frame budget
+            track = Track(next(self._ids), self.tracker_factory(),
+                          tuple(int(v) for v in bbox), self.tracker_health)
+            track.stale = True
+            track.needs_init = True
+            self.tracks.append(track)
+        return self.tracks
@@ -4,7 +4,8 @@ This module provides essential pipelines for image processing.
 
 
 import cv2
-from typing import Tuple
+import numpy as np
+from typing import Tuple, List, Dict, Iterable, Optional
 from abc import ABC, abstractmethod
 
 from .utils import (
@@ -15,81 +16,243 @@ from .utils import (
 
 
 class BaseTransformComponent(ABC):
+    """
+    Base class of the transformers.
+
+    With reuse_buffers enabled a component writes its output into arrays
+    it owns, one per input shape and dtype, instead of allocating a new
+    array per call. The output is then only valid until the next call.
+    """
+
+    # number of input shapes a component keeps output buffers for
+    MAX_BUFFERS = 4
+
+    def __init__(self, reuse_buffers: bool = False):
+        self.reuse_buffers = reuse_buffers
+        self._buffers = {}
+
     @abstractmethod
     def transform(self, img: Image) -> Image:
         pass
 
+    def _dst(self, img: Image, shape: Optional[Tuple[int, ...]] = None) -> Optional[Image]:
+        """
+        Output buffer for img, or None (let OpenCV allocate) when buffers
+        are not reused. shape defaults to the shape of img.
+        """
+        if not self.reuse_buffers:
+            return None
+
+        key = (img.shape, img.dtype)
+        buf = self._buffers.get(key)
+        if buf is None:
+            if len(self._buffers) >= self.MAX_BUFFERS:
+                # input size changes, e.g. a region of interest moved
+                del self._buffers[next(iter(self._buffers))]
+            buf = np.empty(img.shape if shape is None else shape, img.dtype)
+            self._buffers[key] = buf
+        return buf
+
+    def signature(self) -> Tuple:
+        """
+        A hashable description of the transform. Two components with the
+        same signature produce the same output for the same input.
+        """
+        def freeze(v):
+            if isinstance(v, np.ndarray):
+                return (v.shape, v.dtype.str, v.tobytes())
+            return v
+
+        params = sorted((k, freeze(v)) for k, v in vars(self).items()
+                        if k != '_buffers')
+        return (type(self),) + tuple(params)
+
 
 class ResizeTransformer(BaseTransformComponent):
-    def __init__(self, out_size: Tuple[int, int]):
-        super().__init__()
+    def __init__(self, out_size: Tuple[int, int], reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self.out_size = out_size
 
     def transform(self, img: Image) -> Image:
-        out = cv2.resize(img, self.out_size)
+        shape = self.out_size[::-1] + img.shape[2:]
+        out = cv2.resize(img, self.out_size, dst=self._dst(img, shape))
         return out
 
 
+class PyrDownTransformer(BaseTransformComponent):
+    """
+    Go down levels levels of a Gaussian pyramid, halving the image size
+    (and smoothing it) at every level.
+    """
+
+    def __init__(self, levels: int = 1, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
+        self.levels = levels
+
+    def transform(self, img: Image) -> Image:
+        for _ in range(self.levels):
+            shape = ((img.shape[0] + 1) // 2, (img.shape[1] + 1) // 2) + img.shape[2:]
+            img = cv2.pyrDown(img, dst=self._dst(img, shape))
+        return img
+
+
 class BlurTransformer(BaseTransformComponent):
     """
     Apply Gaussian Blur to input image.
     """
 
-    def __init__(self, ksize=(21, 21)):
-        super().__init__()
+    def __init__(self, ksize=(21, 21), reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self.ksize = ksize
 
     def transform(self, img: Image) -> Image:
-        out = cv2.GaussianBlur(img, ksize=self.ksize, sigmaX=0)
+        out = cv2.GaussianBlur(img, ksize=self.ksize, sigmaX=0,
+                               dst=self._dst(img))
         return out
 
 
 class GrayscaleTransformer(BaseTransformComponent):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
 
     def transform(self, img: Image) -> Image:
-        out = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        out = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY,
+                           dst=self._dst(img, img.shape[:2]))
         return out
 
 
 class ThresholdTransformer(BaseTransformComponent):
-    def __init__(self, threshold):
-        super().__init__()
+    def __init__(self, threshold, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self.threshold = threshold
 
     def transform(self, img: Image):
         _, img = cv2.threshold(
-            img, self.threshold, 255, cv2.THRESH_BINARY)
+            img, self.threshold, 255, cv2.THRESH_BINARY, dst=self._dst(img))
         return img
 
 
 class OpeningTransformer(BaseTransformComponent):
-    def __init__(self, kernel):
-        super().__init__()
+    def __init__(self, kernel, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self._kernel = kernel
 
     def transform(self, img: Image) -> Image:
-        img = cv2.morphologyEx(img, cv2.MORPH_OPEN, self._kernel)
+        img = cv2.morphologyEx(img, cv2.MORPH_OPEN, self._kernel,
+                               dst=self._dst(img))
         return img
 
 
 class ClosingTransformer(BaseTransformComponent):
-    def __init__(self, kernel):
-        super().__init__()
+    def __init__(self, kernel, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self._kernel = kernel
 
     def transform(self, img: Image) -> Image:
-        img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, self._kernel)
+        img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, self._kernel,
+                               dst=self._dst(img))
         return img
 
 
 class DilatingTransformer(BaseTransformComponent):
-    def __init__(self, kernel, iteration=1):
-        super().__init__()
+    def __init__(self, kernel, iteration=1, reuse_buffers: bool = False):
+        super().__init__(reuse_buffers)
         self._kernel = kernel
         self._iteration = iteration
 
     def transform(self, img: Image) -> Image:
-        img = cv2.dilate(img, self._kernel, iterations=self._iteration)
+        img = cv2.dilate(img, self._kernel, dst=self._dst(img),
+                         iterations=self._iteration)
         return img
+
+
+class TransformGraph:
+    """
+    A small DAG of transformers with shared intermediate outputs.
+
+    Every node transforms the output of its parent node (root nodes
+    transform the input image), so a common step such as a resize is
+    computed once per frame and its result fans out to all branches.
+    Named outputs select the nodes returned by run. Transformers must not
+    modify their input in place since it may be shared by other branches.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._children = {}
+        self.outputs = {}
+
+    @classmethod
+    def from_pipelines(cls, pipelines: Dict[str, List[BaseTransformComponent]]) -> 'TransformGraph':
+        """
+        Build a graph from named lists of transformers (the format used by
+        run_pipeline). Equivalent leading transformers are shared.
+        """
+        graph = cls()
+        for output, pipe in pipelines.items():
+            graph.add_pipeline(output, pipe)
+        return graph
+
+    def add_node(self, name: str, component: BaseTransformComponent,
+                 parent: Optional[str] = None) -> str:
+        if name in self._nodes:
+            raise ValueError(f'node {name} already exists')
+        if parent is not None and parent not in self._nodes:
+            raise ValueError(f'unknown parent node {parent}')
+
+        self._nodes[name] = (component, parent)
+        self._children.setdefault(parent, []).append(name)
+        return name
+
+    def add_output(self, output: str, node: Optional[str]):
+        """
+        Expose node as a named output. A node of None is the input image.
+        """
+        if node is not None and node not in self._nodes:
+            raise ValueError(f'unknown node {node}')
+        self.outputs[output] = node
+
+    def add_pipeline(self, output: str, pipe: List[BaseTransformComponent],
+                     parent: Optional[str] = None) -> Optional[str]:
+        """
+        Append a chain of transformers below parent and expose its last
+        node as output. Steps already present under the same parent with
+        the same signature are reused instead of added.
+        """
+        node = parent
+        for component in pipe:
+            node = self._find_child(node, component) or self.add_node(
+                self._new_name(output), component, node)
+        self.add_output(output, node)
+        return node
+
+    def run(self, img: Image, outputs: Optional[Iterable[str]] = None) -> Dict[str, Image]:
+        """
+        Run the graph on img and return the requested outputs (all of them
+        by default). Only the nodes needed for these outputs are computed.
+        """
+        if outputs is None:
+            outputs = self.outputs.keys()
+
+        results = {None: img}
+
+        def compute(node):
+            if node not in results:
+                component, parent = self._nodes[node]
+                results[node] = component.transform(compute(parent))
+            return results[node]
+
+        return {out: compute(self.outputs[out]) for out in outputs}
+
+    def _find_child(self, parent: Optional[str], component: BaseTransformComponent) -> Optional[str]:
+        signature = component.signature()
+        for child in self._children.get(parent, []):
+            if self._nodes[child][0].signature() == signature:
+                return child
+        return None
+
+    def _new_name(self, output: str) -> str:
+        i = 0
+        while f'{output}.{i}' in self._nodes:
+            i += 1
+        return f'{output}.{i}'
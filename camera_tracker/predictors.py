@@ -1,21 +1,26 @@
 """
 This module provides predictors (trackers and detectors)
 """
+import math
 import time
 import cv2
 import numpy as np
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
 from abc import ABC, abstractmethod
-from contextlib import suppress
 
 from .utils import (
     tracker_factory,
     BoundingBox,
     Image,
-    bbox_area,
-    run_pipeline
+    bbox_intersection_over_union,
+    run_pipeline,
+    crop,
+    expand_bbox,
+    translate_bbox
 )
 
+from .bbox import merge_adjacent as merge_adjacent_bboxes
+
 from .pipeline_components import (
     ThresholdTransformer,
     OpeningTransformer,
@@ -24,6 +29,9 @@ from .pipeline_components import (
 )
 
 
+_NO_BOXES = np.empty((0, 4), dtype=np.int64)
+
+
 class BasePredictionComponent(ABC):
     @abstractmethod
     def predict(self, img: Image) -> Any:
@@ -33,13 +41,23 @@ class BasePredictionComponent(ABC):
 class CvTracker(BasePredictionComponent):
     """
     A wrapper to OpenCV tracker.
+
+    In ROI mode (roi_scale is set) the tracker only sees a window of
+    roi_scale times the target size around the target, so the cost per
+    frame depends on the target size rather than on the frame size. The
+    window is moved, and the tracker re-initialized in it, when the
+    target leaves its central part. Returned boxes are in frame coordinates.
     """
 
-    def __init__(self, tracker_name: str, tracker_health: int):
+    def __init__(self, tracker_name: str, tracker_health: int,
+                 roi_scale: Optional[float] = None):
         super().__init__()
         self.tracker_name = tracker_name
         self.tracker_inited = False
         self.tracker = None
+        self.roi_scale = roi_scale
+        # window the tracker works in, None when it sees the whole frame
+        self.roi = None
 
         # stats
         self.frame_process_time = 0
@@ -51,8 +69,7 @@ class CvTracker(BasePredictionComponent):
         self.tracker_health = self.max_tracker_health
 
     def init_tracker(self, initial_frame: Image, initial_bbox: BoundingBox):
-        self.tracker = tracker_factory(self.tracker_name)
-        self.tracker.init(initial_frame, initial_bbox)
+        self._anchor(initial_frame, initial_bbox)
         self.tracker_inited = True
         self.tracker_health = self.max_tracker_health
         self.fps = 0
@@ -65,7 +82,14 @@ class CvTracker(BasePredictionComponent):
             raise RuntimeError('tracker not initialized!')
 
         timer = cv2.getTickCount()
-        tracker_status, bbox = self.tracker.update(img)
+        if self.roi is None:
+            tracker_status, bbox = self._update(img)
+        else:
+            tracker_status, bbox = self._update(crop(img, self.roi))
+            if tracker_status:
+                bbox = translate_bbox(bbox, self.roi[0], self.roi[1])
+                if self._outside_roi_centre(bbox):
+                    self._anchor(img, bbox)
         fps = cv2.getTickFrequency() / (cv2.getTickCount() - timer)
 
         self.tot_frame_cnt += 1
@@ -90,19 +114,223 @@ class CvTracker(BasePredictionComponent):
     def get_health(self) -> int:
         return self.tracker_health
 
+    def _anchor(self, frame: Image, bbox: BoundingBox):
+        """
+        (Re)initialize the OpenCV tracker on frame, inside a window
+        around bbox in ROI mode.
+        """
+        if self.roi_scale is None:
+            self.roi = None
+            self._init(frame, bbox)
+            return
+
+        self.roi = expand_bbox(bbox, self.roi_scale, frame.shape[1::-1])
+        self._init(crop(frame, self.roi),
+                   translate_bbox(bbox, -self.roi[0], -self.roi[1]))
+
+    def _init(self, img: Image, bbox: BoundingBox):
+        self.tracker = tracker_factory(self.tracker_name)
+        self.tracker.init(img, bbox)
+
+    def _update(self, img: Image) -> Tuple[bool, BoundingBox]:
+        return self.tracker.update(img)
+
+    def _outside_roi_centre(self, bbox: BoundingBox) -> bool:
+        # the central part is the window without a quarter on each side
+        x, y, w, h = self.roi
+        cx = bbox[0] + bbox[2] / 2
+        cy = bbox[1] + bbox[3] / 2
+        return not (x + w / 4 <= cx <= x + w * 3 / 4 and
+                    y + h / 4 <= cy <= y + h * 3 / 4)
+
     def decrease_health(self):
         self.tracker_health -= 1
 
 
+class CascadeTracker(CvTracker):
+    """
+    A cheap OpenCV tracker (e.g. MOSSE) updated on every frame, re-anchored
+    by an accurate one (e.g. CSRT or KCF) updated every refine_interval
+    frames, and on frames the cheap tracker loses the target.
+
+    The cheap tracker is only re-initialized on the accurate box when
+    the two overlap less than REANCHOR_IOU. The accurate tracker only
+    searches around where it last saw the target, which may have moved
+    away since the last refine. When it fails, or its box doesn't overlap
+    the cheap one, it is re-initialized on the cheap box instead.
+
+    refine_interval adapts to the measured cost of both trackers: it is
+    the smallest interval keeping the average cost per frame within
+    frame_budget (seconds). With a large budget the accurate tracker runs
+    on every frame, with a small one it runs every max_refine_interval frames.
+    The cost of a refine includes the re-initializations it triggers.
+    """
+
+    # weight of a new measurement in the cost averages
+    COST_SMOOTHING = 0.1
+    # the cheap tracker is re-anchored when it overlaps the accurate box
+    # less than this
+    REANCHOR_IOU = 0.5
+
+    def __init__(self, tracker_name: str, tracker_health: int,
+                 accurate_tracker_name: str, frame_budget: float,
+                 max_refine_interval: int = 30,
+                 roi_scale: Optional[float] = None):
+        super().__init__(tracker_name, tracker_health, roi_scale)
+        self.accurate_tracker_name = accurate_tracker_name
+        self.accurate_tracker = None
+        self.frame_budget = frame_budget
+        self.max_refine_interval = max_refine_interval
+        self.refine_interval = 1
+
+        self._frame_cnt = 0
+        self._cheap_cost = 0.0
+        self._accurate_cost = 0.0
+
+        # stats
+        self.refine_cnt = 0
+        self.reanchor_cnt = 0
+
+    def get_stat(self) -> Dict[str, int]:
+        stat = super().get_stat()
+        stat['refine_interval'] = self.refine_interval
+        stat['refine_count'] = self.refine_cnt
+        stat['accurate_reanchor_count'] = self.reanchor_cnt
+        return stat
+
+    def _init(self, img: Image, bbox: BoundingBox):
+        super()._init(img, bbox)
+        self.accurate_tracker = tracker_factory(self.accurate_tracker_name)
+        self.accurate_tracker.init(img, bbox)
+        self._frame_cnt = 0
+
+    def _update(self, img: Image) -> Tuple[bool, BoundingBox]:
+        self._frame_cnt += 1
+
+        t0 = time.perf_counter()
+        tracker_status, bbox = self.tracker.update(img)
+        self._cheap_cost = self._smooth(self._cheap_cost, time.perf_counter() - t0)
+
+        if tracker_status and self._frame_cnt % self.refine_interval:
+            return tracker_status, bbox
+
+        t0 = time.perf_counter()
+        accurate_status, accurate_bbox = self.accurate_tracker.update(img)
+        self.refine_cnt += 1
+
+        iou = bbox_intersection_over_union(accurate_bbox, bbox) if tracker_status else 0
+        if accurate_status and (not tracker_status or iou > 0):
+            if iou < self.REANCHOR_IOU:
+                # re-anchor the cheap tracker on the accurate box
+                self.tracker = tracker_factory(self.tracker_name)
+                self.tracker.init(img, accurate_bbox)
+            tracker_status, bbox = accurate_status, accurate_bbox
+        elif tracker_status:
+            # the accurate tracker lost the target, re-anchor it instead
+            self.accurate_tracker = tracker_factory(self.accurate_tracker_name)
+            self.accurate_tracker.init(img, bbox)
+            self.reanchor_cnt += 1
+
+        # re-initializations are part of the cost of a refine
+        self._accurate_cost = self._smooth(self._accurate_cost, time.perf_counter() - t0)
+        self._adapt_refine_interval()
+        return tracker_status, bbox
+
+    def _adapt_refine_interval(self):
+        # average cost per frame: cheap + accurate / refine_interval
+        spare = self.frame_budget - self._cheap_cost
+        if spare <= 0:
+            interval = self.max_refine_interval
+        else:
+            interval = math.ceil(self._accurate_cost / spare)
+        self.refine_interval = min(max(interval, 1), self.max_refine_interval)
+
+    def _smooth(self, average: float, value: float) -> float:
+        if average == 0:
+            return value
+        return average + (value - average) * self.COST_SMOOTHING
+
+
+class GlobalMotionEstimator:
+    """
+    Estimate the translation of the whole image between two frames (i.e.
+    the camera motion) by phase correlation.
+
+    A big object on a plain background looks just like a camera motion,
+    so the detector only asks for an estimate while the camera is known to
+    move, or when at least min_changed_ratio of the whole frame changed.
+    """
+
+    def __init__(self, min_changed_ratio: float = 0.05, min_response: float = 0.1,
+                 min_shift: float = 0.5, max_shift_ratio: float = 0.25):
+        self.min_changed_ratio = min_changed_ratio
+        self.min_response = min_response
+        self.min_shift = min_shift
+        self.max_shift_ratio = max_shift_ratio
+
+        self.shift = (0.0, 0.0)
+        self.response = 0.0
+
+        # preallocated float32 frames and window
+        self._prev = None
+        self._curr = None
+        self._window = None
+
+    def estimate(self, prev_img: Image, img: Image) -> Optional[Tuple[float, float]]:
+        """
+        Return the (dx, dy) shift of img relative to prev_img, or None
+        when there is no reliable or noticeable shift.
+        """
+        if self._curr is None or self._curr.shape != img.shape:
+            self._prev = np.empty(img.shape, dtype=np.float32)
+            self._curr = np.empty(img.shape, dtype=np.float32)
+            self._window = cv2.createHanningWindow(
+                (img.shape[1], img.shape[0]), cv2.CV_32F)
+        np.copyto(self._prev, prev_img, casting='unsafe')
+        np.copyto(self._curr, img, casting='unsafe')
+
+        self.shift, self.response = cv2.phaseCorrelate(self._prev, self._curr, self._window)
+        dx, dy = self.shift
+        h, w = img.shape[:2]
+        if self.response < self.min_response or \
+                abs(dx) > w * self.max_shift_ratio or abs(dy) > h * self.max_shift_ratio:
+            return None
+        if abs(dx) < self.min_shift and abs(dy) < self.min_shift:
+            return None
+        return dx, dy
+
+
 class PixelDifferenceDetector(BasePredictionComponent):
     """
     Detect movement by comparing two consecutive frames pixel by pixel.
+
+    When a region of interest is set (see set_roi) only that part of the
+    frames is compared. Returned boxes are always in frame coordinates.
+
+    With downscale > 1 the detector is fed images downscale times smaller
+    than the frames the tracker sees (e.g. a pyramid level). Boxes, box
+    area limits and regions of interest stay in tracker coordinates.
+
+    predict returns the biggest moving object, predict_all every one of
+    them. Boxes at most merge_distance pixels apart are merged into one,
+    so fragments of an object too small to be kept on their own are kept
+    together. Boxes more elongated than max_aspect_ratio are ignored.
+
+    With a motion_estimator (see GlobalMotionEstimator) the previous frame
+    is shifted by the camera motion before the frames are compared, so
+    moving the camera does not make the whole frame look changed. Set
+    camera_motion_expected while the camera is being moved.
     """
 
     def __init__(self, pixel_difference_threshold: int,
                  structuring_kernel_shape: Tuple[int, int],
                  bbox_area_min: float,
-                 bbox_area_max: float):
+                 bbox_area_max: float,
+                 reuse_buffers: bool = False,
+                 downscale: int = 1,
+                 motion_estimator: Optional[GlobalMotionEstimator] = None,
+                 max_aspect_ratio: Optional[float] = None,
+                 merge_distance: Optional[int] = None):
         super().__init__()
 
         self.threshold = pixel_difference_threshold
@@ -110,72 +338,380 @@ class PixelDifferenceDetector(BasePredictionComponent):
             cv2.MORPH_ELLIPSE, structuring_kernel_shape)
         self.bbox_area_min = bbox_area_min
         self.bbox_area_max = bbox_area_max
+        self.max_aspect_ratio = max_aspect_ratio
+        self.merge_distance = merge_distance
+        self.reuse_buffers = reuse_buffers
+        self.downscale = downscale
+        self.motion_estimator = motion_estimator
+        # camera motion compensated in the last frame, in detector image
+        # coordinates, None when not compensated
+        self.global_motion = None
+        self.camera_motion_expected = False
         self.prev_img = None
+        # region of interest in detector image coordinates
+        self.roi = None
+
+        # share of changed pixels in the last difference mask. Above
+        # max_changed_ratio the contour extraction is skipped.
+        self.changed_pixels = 0
+        self.changed_ratio = 0.0
+        self.max_changed_ratio = None
+
+        # preallocated previous frame and difference image
+        self._prev_buf = None
+        self._delta_buf = None
+        self._warp_buf = None
 
         self.pipe = [
-            ThresholdTransformer(self.threshold),
-            DilatingTransformer(self.kernel, 2)
+            ThresholdTransformer(self.threshold, reuse_buffers),
+            DilatingTransformer(self.kernel, 2, reuse_buffers)
         ]
 
         # stat
         self.frame_process_time = 0
 
     def predict(self, img: Image) -> Tuple[bool, BoundingBox]:
+        """
+        Detect the biggest moving object.
+        """
+        boxes = self.predict_all(img)
+        if not len(boxes):
+            return False, None
+        return True, tuple(int(v) for v in boxes[0])
+
+    def predict_all(self, img: Image) -> np.ndarray:
+        """
+        Detect all moving objects. Returns their boxes as an Nx4 (x, y,
+        w, h) array in frame coordinates, biggest first.
+        """
         t0 = time.time()
         if len(img.shape) != 2:
             raise RuntimeError(
                 'PixelDifferenceDetector only supports grayscale image')
 
         if self.prev_img is None:
-            self.prev_img = img
-            return False, None
-
-        img_delta = cv2.absdiff(self.prev_img, img)
+            self._store_prev_img(img)
+            self.changed_pixels = 0
+            self.changed_ratio = 0.0
+            return _NO_BOXES
 
-        img_delta = run_pipeline(self.pipe, img_delta)
+        curr_img = crop(img, self.roi) if self.roi is not None else img
+        img_delta = self._foreground(img, curr_img)
 
-        self.img_delta = img_delta
-
-        contours, _ = cv2.findContours(
-            img_delta.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        if contours:
-            contours = [cv2.boundingRect(cntr) for cntr in contours]
-            contours_filtered = list(filter(self.validate_bbox, contours))
-            if contours_filtered:
-                biggest_box = max(contours_filtered, key=lambda i: i[2]*i[3])
-                ret = (self.validate_bbox(biggest_box), biggest_box)
-            else:
-                ret = (False, None)
+        if self.changed_pixels == 0 or self._most_changed():
+            # nothing or most of the frame changed, no point looking for objects
+            boxes = _NO_BOXES
         else:
-            ret = (False, None)
-
-        self.prev_img = img.copy()
+            # one call labels all blobs, row 0 is the background
+            _, _, stats, _ = cv2.connectedComponentsWithStats(img_delta, connectivity=8)
+            boxes = self._to_frame_coordinates_all(stats[1:, :4])
+            if self.merge_distance is not None and len(boxes) > 1:
+                boxes = merge_adjacent_bboxes(boxes, self.merge_distance)
+            boxes = self._filter_boxes(boxes)
+            # equal areas: the last blob in scan order first, as
+            # findContours lists them
+            areas = boxes[:, 2] * boxes[:, 3]
+            boxes = boxes[np.lexsort((-np.arange(len(boxes)), -areas))]
+
+        self._store_prev_img(img)
 
         self.frame_process_time = time.time() - t0
-        return ret
+        return boxes
+
+    def _most_changed(self) -> bool:
+        return self.max_changed_ratio is not None and self.changed_ratio > self.max_changed_ratio
+
+    def _filter_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        w, h = boxes[:, 2], boxes[:, 3]
+        areas = w * h
+        keep = (w > 1) & (h > 1) & (areas > self.bbox_area_min) & (areas < self.bbox_area_max)
+        if self.max_aspect_ratio is not None:
+            keep &= np.maximum(w, h) <= self.max_aspect_ratio * np.minimum(w, h)
+        return boxes[keep]
+
+    def _foreground(self, img: Image, curr_img: Image) -> Image:
+        """
+        Mask of the changed pixels of curr_img, which is img cropped to
+        the region of interest.
+        """
+        prev_img = crop(self.prev_img, self.roi) if self.roi is not None else self.prev_img
+        img_delta = self._difference(prev_img, curr_img)
+
+        self.global_motion = None
+        if self._should_compensate_motion():
+            self.global_motion = self.motion_estimator.estimate(self.prev_img, img)
+            if self.global_motion is not None:
+                img_delta = self._difference(
+                    self._warp_prev_img(curr_img, self.global_motion), curr_img)
+        return img_delta
+
+    def _should_compensate_motion(self) -> bool:
+        if self.motion_estimator is None:
+            return False
+        if self.camera_motion_expected:
+            return True
+        # inside a region of interest the target itself may cover most
+        # of the image, only trust a whole-frame change
+        return self.roi is None and self.changed_ratio >= self.motion_estimator.min_changed_ratio
+
+    def _difference(self, prev_img: Image, curr_img: Image) -> Image:
+        delta_buf = None
+        if self.reuse_buffers:
+            if self._delta_buf is None or self._delta_buf.shape != curr_img.shape:
+                self._delta_buf = np.empty_like(curr_img)
+            delta_buf = self._delta_buf
+        img_delta = cv2.absdiff(prev_img, curr_img, dst=delta_buf)
+        return self._process_mask(img_delta)
+
+    def _process_mask(self, img_delta: Image) -> Image:
+        """
+        Threshold and dilate a difference image, and count the changed
+        pixels.
+        """
+        img_delta = run_pipeline(self.pipe, img_delta)
+
+        self.img_delta = img_delta
+        self.changed_pixels = cv2.countNonZero(img_delta)
+        self.changed_ratio = self.changed_pixels / img_delta.size
+        return img_delta
+
+    def _warp_prev_img(self, curr_img: Image, shift: Tuple[float, float]) -> Image:
+        """
+        Shift the previous frame by the camera motion, cropped like
+        curr_img. Pixels the previous frame does not cover are taken from
+        curr_img, so they never look changed.
+        """
+        x0, y0 = (self.roi[0], self.roi[1]) if self.roi is not None else (0, 0)
+        h, w = curr_img.shape[:2]
+        if self._warp_buf is None or self._warp_buf.shape != curr_img.shape:
+            self._warp_buf = np.empty_like(curr_img)
+        np.copyto(self._warp_buf, curr_img)
+
+        m = np.float32([[1, 0, shift[0] - x0], [0, 1, shift[1] - y0]])
+        return cv2.warpAffine(self.prev_img, m, (w, h), dst=self._warp_buf,
+                              flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_TRANSPARENT)
+
+    def _store_prev_img(self, img: Image):
+        # img may be a buffer that is overwritten by the next frame
+        if not self.reuse_buffers:
+            self.prev_img = img.copy()
+            return
+
+        if self._prev_buf is None or self._prev_buf.shape != img.shape:
+            self._prev_buf = np.empty_like(img)
+        np.copyto(self._prev_buf, img)
+        self.prev_img = self._prev_buf
 
     def get_stat(self) -> Dict[str, int]:
         return {
             'frame_process_time': self.frame_process_time
         }
 
-    def validate_bbox(self, bbox: BoundingBox) -> bool:
-        area = bbox_area(bbox)
-        return bbox[2] > 1 and bbox[3] > 1 and (self.bbox_area_min < area < self.bbox_area_max)
+    def reset(self):
+        self.prev_img = None
+
+    def skip(self, img: Image):
+        """
+        Take img as the reference frame without detecting.
+        """
+        self._store_prev_img(img)
+
+    def set_roi(self, roi: Optional[BoundingBox]):
+        """
+        Only look for movement inside roi, or in the whole frame when
+        roi is None. The previous frame is always kept whole, so
+        switching back to full-frame search needs no extra frame.
+        """
+        if roi is not None and (roi[2] <= 0 or roi[3] <= 0):
+            roi = None
+
+        if roi is not None and self.downscale != 1:
+            # round outwards so the window still covers roi
+            x1, y1 = roi[0] // self.downscale, roi[1] // self.downscale
+            x2 = -(-(roi[0] + roi[2]) // self.downscale)
+            y2 = -(-(roi[1] + roi[3]) // self.downscale)
+            roi = (int(x1), int(y1), int(x2 - x1), int(y2 - y1))
+        self.roi = roi
+
+    def _to_frame_coordinates_all(self, boxes: np.ndarray) -> np.ndarray:
+        boxes = boxes.astype(np.int64)
+        if self.roi is not None:
+            boxes[:, :2] += self.roi[:2]
+        if self.downscale != 1:
+            boxes *= self.downscale
+        return boxes
+
+
+class BackgroundSubtractionDetector(PixelDifferenceDetector):
+    """
+    Detect moving objects by comparing every frame with a model of the
+    background instead of the previous frame, so slow objects do not
+    vanish and, with a mixture model, flickering backgrounds (leaves,
+    sensor noise) stop producing boxes.
+
+    model is one of
+    - 'running_average': the background is an exponential moving average
+      of the frames, kept in a preallocated float32 buffer and updated in
+      place (cv2.accumulateWeighted) with weight learning_rate per frame.
+      Cheap, and good at slow objects, but fast ones leave a trail.
+    - 'mog2': OpenCV's per-pixel Gaussian mixture (BackgroundSubtractorMOG2),
+      which also learns backgrounds that flicker between several values
+
+    learning_rate defaults to DEFAULT_LEARNING_RATES of the model.
+
+    Boxes, regions of interest and camera moving detection work as in
+    PixelDifferenceDetector. With motion compensation the running average
+    is shifted along with the camera. A Gaussian mixture cannot be
+    shifted, so while the camera moves the frames are compared as in
+    PixelDifferenceDetector and the mixture is learned again afterwards.
+    When more than max_changed_ratio of the frame changed (the camera
+    moved, see CameraMovingDetector) the model is re-seeded with the
+    frame, so the new view is the background from the next frame on.
+    """
+
+    DEFAULT_LEARNING_RATES = {
+        'running_average': 0.05,
+        'mog2': 0.005
+    }
+
+    def __init__(self, *args, model: str = 'running_average',
+                 learning_rate: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if model not in self.DEFAULT_LEARNING_RATES:
+            raise ValueError(f'unknown background model: {model}')
+        self.model = model
+        if learning_rate is None:
+            learning_rate = self.DEFAULT_LEARNING_RATES[model]
+        self.learning_rate = learning_rate
+
+        # running average, its shifted copy and the average as uint8
+        self._acc = None
+        self._acc_buf = None
+        self._background = None
+        self._mog2 = None
+        self._mask_buf = None
+        # the mixture already learned the current frame
+        self._learned = False
+
+    @property
+    def background(self) -> Optional[Image]:
+        if self.model == 'mog2':
+            return self._mog2.getBackgroundImage() if self._mog2 is not None else None
+        return self._background
+
+    def reset(self):
+        super().reset()
+        self._acc = None
+        self._mog2 = None
+
+    def _foreground(self, img: Image, curr_img: Image) -> Image:
+        if self.model == 'mog2':
+            img_delta = self._mog2_foreground(img)
+        else:
+            img_delta = self._difference(self._crop_background(), curr_img)
+
+        self.global_motion = None
+        if self._should_compensate_motion():
+            self.global_motion = self.motion_estimator.estimate(self.prev_img, img)
+            if self.global_motion is not None:
+                if self.model == 'mog2':
+                    # learned from the end of this frame on
+                    self._mog2 = None
+                    self._learned = False
+                    img_delta = self._difference(
+                        self._warp_prev_img(curr_img, self.global_motion), curr_img)
+                else:
+                    self._shift_background(img, self.global_motion)
+                    img_delta = self._difference(self._crop_background(), curr_img)
+        return img_delta
+
+    def _crop_background(self) -> Image:
+        return crop(self._background, self.roi) if self.roi is not None else self._background
+
+    def _mog2_foreground(self, img: Image) -> Image:
+        # the mixture has to see whole frames, only its mask is cropped
+        if self._mask_buf is None or self._mask_buf.shape != img.shape:
+            self._mask_buf = np.empty_like(img)
+        mask = self._mog2.apply(img, self._mask_buf, self.learning_rate)
+        self._learned = True
+        return self._process_mask(crop(mask, self.roi) if self.roi is not None else mask)
+
+    def _shift_background(self, img: Image, shift: Tuple[float, float]):
+        """
+        Shift the running average by the camera motion. Pixels it does not
+        cover are taken from img.
+        """
+        if self._acc_buf is None or self._acc_buf.shape != self._acc.shape:
+            self._acc_buf = np.empty_like(self._acc)
+        np.copyto(self._acc_buf, img)
+        m = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+        cv2.warpAffine(self._acc, m, img.shape[1::-1], dst=self._acc_buf,
+                       flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT)
+        self._acc, self._acc_buf = self._acc_buf, self._acc
+        cv2.convertScaleAbs(self._acc, dst=self._background)
+
+    def _store_prev_img(self, img: Image):
+        super()._store_prev_img(img)
+        if self._most_changed():
+            # the camera moved, the model would take many frames to learn
+            # the new view
+            self._learn(img, 1.0)
+        elif not self._learned:
+            self._learn(img, self.learning_rate)
+        self._learned = False
+
+    def _learn(self, img: Image, learning_rate: float):
+        if self.model == 'mog2':
+            if self._mog2 is None:
+                self._mog2 = cv2.createBackgroundSubtractorMOG2(
+                    history=max(1, int(1 / self.learning_rate)), detectShadows=False)
+                # take the first frame as the background
+                learning_rate = 1.0
+            self._mog2.apply(img, learningRate=learning_rate)
+            return
+
+        if self._acc is None or self._acc.shape != img.shape:
+            self._acc = img.astype(np.float32)
+            self._background = np.empty_like(img)
+        else:
+            cv2.accumulateWeighted(img, self._acc, learning_rate)
+        cv2.convertScaleAbs(self._acc, dst=self._background)
 
 
 class CameraMovingDetector(BasePredictionComponent):
+    """
+    Detect camera movement from the share of pixels changed between two
+    frames, as found by a PixelDifferenceDetector.
+
+    The PixelDifferenceDetector can be the one used to detect objects. The
+    difference mask is then computed once per frame: predict runs the
+    detector and keeps its result in last_detection, and all detected
+    boxes in last_boxes. When the camera is moving the detector skips the
+    blob extraction.
+
+    The threshold is a count of changed pixels in the whole frame, in
+    region of interest mode too.
+    """
+
     def __init__(self, pixel_diff_detector: PixelDifferenceDetector,
                  threshold: int):
-        self._pixel_diff_detector = pixel_diff_detector
+        self.pixel_diff_detector = pixel_diff_detector
         self._threshold = threshold
+        self.last_detection = (False, None)
+        self.last_boxes = _NO_BOXES
 
     def predict(self, img: Image) -> bool:
-        self._pixel_diff_detector.predict(img)
-
-        ret = True
-        with suppress(Exception):
-            ret = np.sum(self._pixel_diff_detector.img_delta > 0) > self._threshold
-            
-        return ret
+        # threshold is a pixel count in tracker coordinates. The detector
+        # works with ratios of the area it compares, only the region of
+        # interest when one is set, so a target filling a small region
+        # of interest is not taken for a camera motion.
+        detector = self.pixel_diff_detector
+        max_pixels = self._threshold / detector.downscale ** 2
+        compared = crop(img, detector.roi) if detector.roi is not None else img
+        detector.max_changed_ratio = max_pixels / max(compared.shape[0] * compared.shape[1], 1)
+
+        self.last_boxes = detector.predict_all(img)
+        self.last_detection = (True, tuple(int(v) for v in self.last_boxes[0])) \
+            if len(self.last_boxes) else (False, None)
+        return detector.changed_pixels > max_pixels
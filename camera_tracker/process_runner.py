@@ -0,0 +1,360 @@
+"""
+This module runs the tracking loop in a worker process, so its pure
+Python work (contour post-processing, IoU logic, overlay, bookkeeping)
+does not compete for the GIL with the control, motor and streaming
+threads of the main process.
+
+The main process reads the camera and writes every frame into a
+shared-memory frame channel (see frame_channel.py), the worker tracks on
+it and writes the labeled frames into the channel the web server maps.
+Locations and the Kalman state are pushed back through a pipe, commands
+go through another one. TrackingSystemProxy stands in for the
+TrackingSystem in the main process.
+"""
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .builder import build_tracking_system
+from .capture import CapturedFrame
+from .frame_channel import SharedFrameReader, SharedFrameWriter
+from .metrics import Metrics
+
+# TrackingSystem methods the proxy may call in the worker
+COMMANDS = ('pause', 'resume', 'set_target', 'select_track',
+            'get_status', 'get_metrics')
+
+
+class SharedFrameSource:
+    """
+    Video source reading the frames of a frame channel, until stop_event
+    is set. Yields CapturedFrame tuples with the frame number and capture
+    timestamp of the writer, skipping frames that were overwritten before
+    they were read.
+
+    Frames are copied into a ring of buffers, a yielded image stays valid
+    until two more frames have been read, as with FrameCapture.
+    """
+
+    HELD_FRAMES = 2
+
+    def __init__(self, path: str, stop_event=None, poll_interval: float = 0.001):
+        self.path = path
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self._buffers = [None] * (self.HELD_FRAMES + 1)
+
+    def __iter__(self):
+        reader = SharedFrameReader(self.path)
+        try:
+            last_seq = None
+            idx = 0
+            while self.stop_event is None or not self.stop_event.is_set():
+                frame = reader.read(self._buffers[idx], last_seq)
+                if frame is None:
+                    time.sleep(self.poll_interval)
+                    continue
+                last_seq = frame.seq
+                self._buffers[idx] = frame.image
+                idx = (idx + 1) % len(self._buffers)
+                yield CapturedFrame(frame.frame_no, frame.timestamp, frame.image)
+        finally:
+            reader.close()
+
+
+def _push_locations(tracking_sys, conn, stop_event):
+    # send every new location together with the Kalman state, so the main
+    # process predicts the location without asking the worker. A location
+    # that was reset is sent without waking the waiters, as in the loop.
+    sent = None
+    while not stop_event.is_set():
+        with tracking_sys.loc_cv:
+            notified = tracking_sys.loc_cv.wait(0.5)
+            loc = tracking_sys.location
+            kalman = tracking_sys.kalman
+            state = None
+            if loc is not None and kalman is not None and kalman.initialized:
+                state = (kalman.x.copy(), kalman.timestamp)
+        if notified or loc != sent:
+            conn.send((loc, state, notified))
+            sent = loc
+
+
+def _publish_frames(tracking_sys, path, max_shape, max_fps, stop_event):
+    writer = SharedFrameWriter(path, max_shape)
+    min_interval = 1 / max_fps
+    last_seq = 0
+    try:
+        while not stop_event.is_set():
+            t0 = time.monotonic()
+            if tracking_sys.wait_labeled_video_frame(last_seq, timeout=0.5) == last_seq:
+                continue
+            last_seq = tracking_sys.write_labeled_video_frame(writer, last_seq)
+            time.sleep(max(0.0, min_interval - (time.monotonic() - t0)))
+    finally:
+        writer.close()
+
+
+def run_worker(settings: Dict, input_path: str, output_path: str,
+               max_shape: Tuple[int, int, int], max_fps: float,
+               command_conn, location_conn, stop_event):
+    """
+    Entry point of the worker process: track on the frames of the
+    input_path channel and publish labeled frames to output_path, until
+    the stop command.
+    """
+    settings = SimpleNamespace(**settings)
+    tracking_sys = build_tracking_system(
+        settings, SharedFrameSource(input_path, stop_event), name='worker')
+
+    threads = [
+        threading.Thread(target=_push_locations, name='push_locations', daemon=True,
+                         args=(tracking_sys, location_conn, stop_event)),
+        threading.Thread(target=_publish_frames, name='publish_frames', daemon=True,
+                         args=(tracking_sys, output_path, max_shape, max_fps, stop_event))
+    ]
+    tracking_sys.start()
+    for thread in threads:
+        thread.start()
+
+    while True:
+        name, args = command_conn.recv()
+        if name == 'stop':
+            break
+        try:
+            if name == 'camera_motion':
+                tracking_sys.detector.camera_motion_expected = args[0]
+                result = None
+            elif name in COMMANDS:
+                result = getattr(tracking_sys, name)(*args)
+            else:
+                raise ValueError(f'unknown command: {name}')
+        except Exception as e:
+            command_conn.send((False, e))
+        else:
+            command_conn.send((True, result))
+
+    stop_event.set()
+    tracking_sys.stop()
+    for thread in threads:
+        thread.join()
+    command_conn.send((True, None))
+
+
+class TrackingSystemProxy:
+    """
+    Run a TrackingSystem built from settings in a worker process, with the
+    interface the app uses: commands, locations, status and metrics, and
+    labeled frames.
+
+    The frames of video_source (a FrameCapture or any iterable of frames)
+    are written into the input_path channel by a thread of the main
+    process. The worker writes labeled frames to output_path at most
+    stream_max_fps times a second, where get_labeled_video_frame reads
+    them.
+
+    Stages timed in the main process (e.g. the JPEG encoding of a
+    JpegPublisher) go to the local metrics and are merged into
+    get_metrics.
+    """
+
+    # extra time the worker gets to reply on top of the command timeout
+    REPLY_MARGIN = 5.0
+
+    def __init__(self, settings, video_source: Iterable,
+                 input_path: str = '/dev/shm/camera_tracker_input',
+                 output_path: str = '/dev/shm/camera_tracker_frames',
+                 max_shape: Tuple[int, int, int] = (1080, 1920, 3),
+                 stream_max_fps: float = 15,
+                 start_method: str = 'spawn'):
+        # settings are passed by value, a settings module can't be pickled
+        self.settings = {name: value for name, value in vars(settings).items()
+                         if name.isupper()}
+        self.video_source = video_source
+        self.input_path = input_path
+        self.output_path = output_path
+        self.max_shape = max_shape
+        self.stream_max_fps = stream_max_fps
+        self._context = multiprocessing.get_context(start_method)
+
+        self.process = None
+        self.thread = None
+        self._receiver = None
+        self._stop_event = self._context.Event()
+        self._command_conn = None
+        self._location_conn = None
+        self._command_lock = threading.Lock()
+        self._writer = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+        self.location = None
+        self._kalman_state = None
+        self.loc_lock = threading.RLock()
+        self.loc_cv = threading.Condition(self.loc_lock)
+
+        self.metrics = Metrics()
+
+    def start(self):
+        self._writer = SharedFrameWriter(self.input_path, self.max_shape)
+        self._command_conn, worker_command_conn = self._context.Pipe()
+        self._location_conn, worker_location_conn = self._context.Pipe(duplex=False)
+        self.process = self._context.Process(
+            target=run_worker, name='TrackingSystemWorker', daemon=True,
+            args=(self.settings, self.input_path, self.output_path, self.max_shape,
+                  self.stream_max_fps, worker_command_conn, worker_location_conn,
+                  self._stop_event))
+        self.process.start()
+
+        self.thread = threading.Thread(target=self._feed_frames, name='feed_frames', daemon=True)
+        self._receiver = threading.Thread(target=self._receive_locations,
+                                          name='receive_locations', daemon=True)
+        self.thread.start()
+        self._receiver.start()
+        print('worker process started')
+
+    def stop(self):
+        self._stop_event.set()
+        if self.process is None:
+            return
+        self._call('stop')
+        self.process.join()
+        self.thread.join()
+        self._receiver.join()
+        self._writer.close(unlink=True)
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self.process = None
+        print('worker process stopped')
+
+    def pause(self, timeout: float = 1.0) -> bool:
+        return self._call('pause', timeout, timeout=timeout)
+
+    def resume(self, timeout: float = 1.0) -> bool:
+        return self._call('resume', timeout, timeout=timeout)
+
+    def set_target(self, bbox, timeout: float = 1.0) -> bool:
+        return self._call('set_target', tuple(bbox), timeout, timeout=timeout)
+
+    def select_track(self, track_id, timeout: float = 1.0) -> bool:
+        return self._call('select_track', track_id, timeout, timeout=timeout)
+
+    @contextmanager
+    def camera_motion(self):
+        self._call('camera_motion', True)
+        try:
+            yield
+        finally:
+            self._call('camera_motion', False)
+
+    def get_location(self):
+        with self.loc_lock:
+            return self.location
+
+    def get_predicted_location(self, lead: float = 0.0):
+        """
+        Location predicted from the last Kalman state the worker sent,
+        None as TrackingSystem.get_predicted_location.
+        """
+        with self.loc_lock:
+            if self.location is None or self._kalman_state is None:
+                return None
+            x, timestamp = self._kalman_state
+        dt = time.monotonic() + lead - timestamp
+        return float(x[0] + x[2] * dt), float(x[1] + x[3] * dt)
+
+    def get_status(self) -> Dict:
+        return self._call('get_status')
+
+    def get_metrics(self) -> Dict:
+        metrics = self._call('get_metrics')
+        local = self.metrics.snapshot()
+        metrics['stages'].update(local['stages'])
+        metrics['counters'].update(local['counters'])
+        return metrics
+
+    def get_labeled_video_frame(self, out: Optional[np.ndarray] = None):
+        return self.copy_labeled_video_frame(out)[1]
+
+    def copy_labeled_video_frame(self, out: Optional[np.ndarray] = None):
+        """
+        Copy the labeled frame, returns the channel seq of the copied
+        frame, as wait_labeled_video_frame, and the copy.
+        """
+        with self._reader_lock:
+            reader = self._open_reader()
+            if reader is None:
+                return 0, None
+            frame = reader.read(out)
+            if frame is None:
+                return reader.seq, None
+        return frame.seq, frame.image
+
+    def wait_labeled_video_frame(self, last_seq: int, timeout=None,
+                                 poll_interval: float = 0.005) -> int:
+        """
+        Wait until the worker writes a labeled frame newer than last_seq,
+        or until timeout. Returns the seq of the current labeled frame.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._reader_lock:
+                reader = self._open_reader()
+                seq = reader.seq if reader is not None else 0
+            # the seq is odd while a frame is written
+            if seq != last_seq and seq % 2 == 0:
+                return seq
+            if deadline is not None and time.monotonic() >= deadline:
+                return last_seq
+            time.sleep(poll_interval)
+
+    def _open_reader(self) -> Optional[SharedFrameReader]:
+        # the worker creates the channel once it is up
+        if self._reader is None:
+            try:
+                self._reader = SharedFrameReader(self.output_path)
+            except (OSError, ValueError, RuntimeError):
+                return None
+        return self._reader
+
+    def _call(self, name: str, *args, timeout: float = 0.0):
+        with self._command_lock:
+            self._command_conn.send((name, args))
+            if not self._command_conn.poll(timeout + self.REPLY_MARGIN):
+                raise TimeoutError(f'worker did not reply to {name}')
+            ok, result = self._command_conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def _feed_frames(self):
+        frame_no = 0
+        for item in self.video_source:
+            if self._stop_event.is_set():
+                break
+            if isinstance(item, CapturedFrame):
+                self._writer.write(item.image, item.seq, item.timestamp)
+            else:
+                frame_no += 1
+                self._writer.write(item, frame_no)
+            self.metrics.incr('fed_frames')
+
+    def _receive_locations(self):
+        while not self._stop_event.is_set():
+            if not self._location_conn.poll(0.5):
+                continue
+            try:
+                loc, state, notify = self._location_conn.recv()
+            except EOFError:
+                return
+            with self.loc_cv:
+                self.location = loc
+                self._kalman_state = state
+                if notify:
+                    self.loc_cv.notify_all()
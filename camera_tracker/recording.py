@@ -0,0 +1,253 @@
+"""
+This module records camera sessions and replays them, so performance
+problems seen in the field can be reproduced offline on the same input.
+
+A recording is a single file: a header followed by records, each a
+fixed-size record header and a payload. Frame records hold the raw frame
+(or a PNG of it, still lossless) as it entered the tracking loop, event
+records hold JSON: the commands the loop received, the camera motion
+flag, and the result of every frame. The file is memory-mapped for
+reading and the index is rebuilt by scanning the record headers, so a
+recording cut short by a crash is readable up to its last full record.
+"""
+import json
+import mmap
+import time
+import struct
+import threading
+import numpy as np
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+import cv2
+
+from .capture import CapturedFrame
+
+MAGIC = b'CTRS'
+VERSION = 1
+
+# magic, version, wall clock time of the recording start
+HEADER = struct.Struct('<4sId')
+# record kind, payload encoding, payload size, frame seq, timestamp
+RECORD = struct.Struct('<BBxxIQd')
+# height, width, channels of a frame payload
+FRAME_SHAPE = struct.Struct('<III')
+
+FRAME = 1
+EVENT = 2
+
+RAW = 0
+PNG = 1
+JSON = 2
+
+ENCODINGS = {None: RAW, 'png': PNG}
+
+Event = namedtuple('Event', ['seq', 'timestamp', 'kind', 'data'])
+_FrameIndex = namedtuple('_FrameIndex', ['seq', 'timestamp', 'offset', 'size', 'encoding', 'shape'])
+
+
+def _to_json(value):
+    # NumPy scalars and arrays in boxes and locations
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class SessionRecorder:
+    """
+    Write a recording to path. compression is None for raw frames or
+    'png' for lossless compression, which trades CPU time for a smaller
+    file.
+
+    Records may be written from several threads.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        if compression not in ENCODINGS:
+            raise ValueError(f'unknown compression: {compression}')
+        self.path = path
+        self.encoding = ENCODINGS[compression]
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+
+        # stats
+        self.frame_cnt = 0
+        self.event_cnt = 0
+
+    def write_frame(self, image: np.ndarray, seq: int, timestamp: float):
+        if image.dtype != np.uint8:
+            raise ValueError('frames must be uint8')
+        h, w = image.shape[:2]
+        c = image.shape[2] if image.ndim == 3 else 1
+        if self.encoding == PNG:
+            success, data = cv2.imencode('.png', image)
+            if not success:
+                raise RuntimeError('cannot encode frame')
+        else:
+            data = np.ascontiguousarray(image)
+        data = memoryview(data).cast('B')
+
+        with self._lock:
+            self._file.write(RECORD.pack(FRAME, self.encoding,
+                                         FRAME_SHAPE.size + data.nbytes, seq, timestamp))
+            self._file.write(FRAME_SHAPE.pack(h, w, c))
+            self._file.write(data)
+            self.frame_cnt += 1
+
+    def write_event(self, kind: str, data: Any, seq: int, timestamp: float):
+        payload = json.dumps({'kind': kind, 'data': data}, default=_to_json).encode()
+        with self._lock:
+            self._file.write(RECORD.pack(EVENT, JSON, len(payload), seq, timestamp))
+            self._file.write(payload)
+            self.event_cnt += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Recording:
+    """
+    Read a recording. Frames are indexed by their position in the
+    recording, raw frames are returned as read-only views of the mapped
+    file, without a copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER.size:
+            raise RuntimeError(f'{path} is not a recording')
+        magic, version, self.start_time = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f'{path} is not a recording')
+
+        self._frames: List[_FrameIndex] = []
+        self.events: List[Event] = []
+        self._scan()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def frame(self, i: int) -> CapturedFrame:
+        index = self._frames[i]
+        data = np.frombuffer(self._mm, dtype=np.uint8, count=index.size,
+                             offset=index.offset)
+        if index.encoding == PNG:
+            image = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+        else:
+            h, w, c = index.shape
+            image = data.reshape((h, w, c) if c > 1 else (h, w))
+        return CapturedFrame(index.seq, index.timestamp, image)
+
+    def events_by_seq(self, kind: Optional[str] = None) -> Dict[int, List[Event]]:
+        """
+        Events (of kind, by default all) grouped by the frame seq they
+        were recorded at.
+        """
+        events = {}
+        for event in self.events:
+            if kind is None or event.kind == kind:
+                events.setdefault(event.seq, []).append(event)
+        return events
+
+    def results(self) -> Dict[int, Dict]:
+        """
+        The result of every frame, by frame seq.
+        """
+        return {event.seq: event.data for event in self.events if event.kind == 'result'}
+
+    def close(self):
+        self._mm.close()
+
+    def _scan(self):
+        offset = HEADER.size
+        end = len(self._mm)
+        while offset + RECORD.size <= end:
+            kind, encoding, size, seq, timestamp = RECORD.unpack_from(self._mm, offset)
+            payload = offset + RECORD.size
+            if payload + size > end:
+                # cut short while writing
+                break
+
+            if kind == FRAME:
+                shape = FRAME_SHAPE.unpack_from(self._mm, payload)
+                self._frames.append(_FrameIndex(seq, timestamp, payload + FRAME_SHAPE.size,
+                                                size - FRAME_SHAPE.size, encoding, shape))
+            elif kind == EVENT:
+                event = json.loads(self._mm[payload:payload + size])
+                self.events.append(Event(seq, timestamp, event['kind'], event['data']))
+            offset = payload + size
+
+
+class ReplaySource:
+    """
+    Video source replaying the frames of a recording, at the original
+    frame rate when realtime, as fast as they are consumed otherwise.
+
+    Frames keep their recorded seq, and timestamps are shifted to the
+    replay clock keeping the recorded intervals, so the motion model sees
+    the same time steps whatever the speed. Latencies measured at max
+    speed are therefore not glass-to-decision latencies.
+
+    Once attached to a TrackingSystem, the recorded commands and camera
+    motion flags are applied before the frame they were received on, so
+    the loop gets the inputs of the recorded session. Stages whose
+    decisions depend on measured time (e.g. adaptive scheduling) or on
+    randomness OpenCV doesn't let us seed (e.g. the MIL tracker) can
+    still diverge.
+    """
+
+    def __init__(self, path: str, realtime: bool = True):
+        self.recording = Recording(path)
+        self.realtime = realtime
+        self.tracking_sys = None
+
+    def attach(self, tracking_sys):
+        self.tracking_sys = tracking_sys
+
+    def __len__(self):
+        return len(self.recording)
+
+    def __iter__(self):
+        events = self.recording.events_by_seq()
+        t_start = time.monotonic()
+        t_first = None
+        for i in range(len(self.recording)):
+            seq, timestamp, image = self.recording.frame(i)
+            if t_first is None:
+                t_first = timestamp
+            replay_time = t_start + timestamp - t_first
+            if self.realtime:
+                time.sleep(max(0.0, replay_time - time.monotonic()))
+
+            if self.tracking_sys is not None:
+                for event in events.get(seq, ()):
+                    self._apply(event)
+            yield CapturedFrame(seq, replay_time, image)
+
+    def close(self):
+        self.recording.close()
+
+    def _apply(self, event: Event):
+        # commands are queued without waiting, they are received at the
+        # start of the frame as in the recorded session
+        if event.kind == 'camera_motion':
+            self.tracking_sys.detector.camera_motion_expected = event.data
+        elif event.kind == 'command':
+            name, arg = event.data['name'], event.data['arg']
+            if name in ('pause', 'resume'):
+                getattr(self.tracking_sys, name)(timeout=0)
+            elif name == 'set_target':
+                self.tracking_sys.set_target(tuple(arg), timeout=0)
+            elif name == 'select_track':
+                self.tracking_sys.select_track(arg, timeout=0)
@@ -0,0 +1,103 @@
+"""
+This module provides the frame scheduler of the tracking loop, which
+decides per frame which stages run so the loop keeps up with the frame
+rate instead of falling behind.
+"""
+import math
+from collections import namedtuple
+from typing import Dict
+
+# stages to run on a frame. Without detection the camera moving check is
+# skipped too, the tracker always runs.
+FramePlan = namedtuple('FramePlan', ['detect', 'overlay'])
+
+
+class FrameScheduler:
+    """
+    Keep the average processing time of a frame within frame_budget
+    (seconds).
+
+    While the tracking is healthy the detector runs every
+    detection_interval frames. The interval is the smallest one whose
+    average cost fits the budget, from the measured cost of frames with
+    and without detection, up to max_detection_interval. When even that
+    does not fit, the labeled frame is only published every
+    max_overlay_interval frames.
+    """
+
+    # weight of a new measurement in the cost averages
+    COST_SMOOTHING = 0.1
+
+    def __init__(self, frame_budget: float, max_detection_interval: int = 5,
+                 max_overlay_interval: int = 3):
+        self.frame_budget = frame_budget
+        self.max_detection_interval = max_detection_interval
+        self.max_overlay_interval = max_overlay_interval
+        self.detection_interval = 1
+        self.overlay_interval = 1
+
+        self._frames_since_detection = 0
+        self._frames_since_overlay = 0
+        # average frame cost with and without detection
+        self._detect_cost = 0.0
+        self._track_cost = 0.0
+
+        # stats
+        self.skipped_detections = 0
+        self.skipped_overlays = 0
+
+    def plan(self, healthy: bool) -> FramePlan:
+        """
+        Stages to run on the next frame. healthy tells whether the tracker
+        follows a confirmed target, detection runs on every frame otherwise.
+        """
+        detect = not healthy or self._frames_since_detection + 1 >= self.detection_interval
+        overlay = self._frames_since_overlay + 1 >= self.overlay_interval
+        if not detect:
+            self.skipped_detections += 1
+        if not overlay:
+            self.skipped_overlays += 1
+        return FramePlan(detect, overlay)
+
+    def record(self, plan: FramePlan, seconds: float, detected: bool):
+        """
+        Account for a processed frame: its plan, how long it took, and
+        whether the detector actually ran on it.
+        """
+        if detected:
+            self._frames_since_detection = 0
+            self._detect_cost = self._smooth(self._detect_cost, seconds)
+        else:
+            self._frames_since_detection += 1
+            self._track_cost = self._smooth(self._track_cost, seconds)
+        self._frames_since_overlay = 0 if plan.overlay else self._frames_since_overlay + 1
+        self._adapt_intervals()
+
+    def get_stat(self) -> Dict[str, float]:
+        return {
+            'frame_budget': self.frame_budget,
+            'detection_interval': self.detection_interval,
+            'overlay_interval': self.overlay_interval,
+            'detect_frame_cost': self._detect_cost,
+            'track_frame_cost': self._track_cost,
+            'skipped_detections': self.skipped_detections,
+            'skipped_overlays': self.skipped_overlays
+        }
+
+    def _adapt_intervals(self):
+        # average cost per frame: track + (detect - track) / interval
+        extra = max(self._detect_cost - self._track_cost, 0.0)
+        spare = self.frame_budget - self._track_cost
+        if spare <= 0:
+            interval = self.max_detection_interval
+        else:
+            interval = math.ceil(extra / spare)
+        self.detection_interval = min(max(interval, 1), self.max_detection_interval)
+
+        cost = self._track_cost + extra / self.detection_interval
+        self.overlay_interval = 1 if cost <= self.frame_budget else self.max_overlay_interval
+
+    def _smooth(self, average: float, value: float) -> float:
+        if average == 0:
+            return value
+        return average + (value - average) * self.COST_SMOOTHING
@@ -0,0 +1,73 @@
+"""
+This module streams the labeled frames of a TrackingSystem to the web
+server. Frames are only encoded when a new one is published, and at most
+max_fps times per second, so streaming does not compete with tracking.
+"""
+import time
+import threading
+import cv2
+
+
+class JpegPublisher:
+    """
+    Encode new labeled frames as JPEG and pass them to sink, a callable
+    taking the encoded buffer (a 1-D uint8 array).
+    """
+
+    def __init__(self, tracking_sys, sink, max_fps: float = 15, jpeg_quality: int = 80):
+        self.tracking_sys = tracking_sys
+        self.sink = sink
+        self.max_fps = max_fps
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+        self.seq = 0
+        self.published_cnt = 0
+        # the labeled frame is copied into the same buffer every time
+        self._frame = None
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.run, name='jpeg_publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        min_interval = 1 / self.max_fps if self.max_fps else 0
+        while not self._stop_event.is_set():
+            t0 = time.monotonic()
+            if not self.publish(timeout=0.5):
+                continue
+            # cap the streaming rate, frames published meanwhile are skipped
+            self._stop_event.wait(min_interval - (time.monotonic() - t0))
+
+    def publish(self, timeout=None) -> bool:
+        """
+        Wait for a new labeled frame and publish it. Returns False when no
+        new frame came before timeout.
+        """
+        seq = self.tracking_sys.wait_labeled_video_frame(self.seq, timeout)
+        if seq == self.seq:
+            return False
+        # the seq of the copied frame, a newer one may have been published
+        # since the wait
+        self.seq, frame = self.tracking_sys.copy_labeled_video_frame(out=self._frame)
+        if frame is None:
+            return False
+        self._frame = frame
+
+        with self.tracking_sys.metrics.time('encode'):
+            success, img = cv2.imencode('.jpg', self._frame, self.encode_params)
+        if not success:
+            return False
+
+        self.sink(img)
+        self.published_cnt += 1
+        return True
@@ -0,0 +1,106 @@
+"""
+This module runs several video streams (e.g. cameras) in one process,
+each with its own TrackingSystem, sharing one worker pool.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from . import utils
+from .builder import build_tracking_system
+from .capture import FrameCapture
+from .tracking_system import TrackingSystem
+
+
+class StreamManager:
+    """
+    Track on several video streams at once.
+
+    sources maps a stream name to a camera index, a video file or a
+    stream URL, which is read by a FrameCapture, or to a ready video
+    source (any iterable of frames). Every stream gets its own
+    TrackingSystem built from settings, so detector, tracker and state
+    are independent, but their pipelined stages all run on one shared
+    pool of max_workers threads (by default 2 per stream, at most one per
+    CPU). The OpenCV work of the process is bounded by the pool size
+    however many streams run.
+
+    cpu_affinity maps a stream name to the CPUs its loop thread is
+    pinned to, and pool_cpus pins the shared workers, so streams can be
+    partitioned across the cores of the board.
+    """
+
+    def __init__(self, settings, sources: Dict[str, Any],
+                 max_workers: Optional[int] = None,
+                 cpu_affinity: Optional[Dict[str, Set[int]]] = None,
+                 pool_cpus: Optional[Set[int]] = None,
+                 build: Callable[..., TrackingSystem] = build_tracking_system):
+        if not sources:
+            raise ValueError('no video source')
+        self.settings = settings
+        cpu_affinity = cpu_affinity or {}
+
+        if max_workers is None:
+            max_workers = min(2 * len(sources), os.cpu_count() or 1)
+        self.pool_cpus = pool_cpus
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='StreamManager',
+                                           initializer=self._pin_worker)
+
+        self.captures: Dict[str, FrameCapture] = {}
+        self.streams: Dict[str, TrackingSystem] = {}
+        for name, source in sources.items():
+            self.streams[name] = build(settings, self._open(name, source),
+                                       executor=self.executor,
+                                       name=name,
+                                       cpus=cpu_affinity.get(name))
+
+    def __getitem__(self, name: str) -> TrackingSystem:
+        return self.streams[name]
+
+    def __iter__(self):
+        return iter(self.streams)
+
+    def __len__(self):
+        return len(self.streams)
+
+    def start(self):
+        for stream in self.streams.values():
+            stream.start()
+
+    def stop(self):
+        # stop the captures first, so loops waiting for a frame return
+        for capture in self.captures.values():
+            capture.stop()
+        for stream in self.streams.values():
+            if stream.thread is not None:
+                stream.stop()
+        self.executor.shutdown()
+
+    def get_location(self, name: str):
+        return self.streams[name].get_location()
+
+    def get_locations(self) -> Dict[str, Any]:
+        return {name: stream.get_location() for name, stream in self.streams.items()}
+
+    def get_labeled_video_frame(self, name: str, out=None):
+        return self.streams[name].get_labeled_video_frame(out)
+
+    def get_status(self) -> Dict[str, Dict]:
+        return {name: stream.get_status() for name, stream in self.streams.items()}
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        return {name: stream.get_metrics() for name, stream in self.streams.items()}
+
+    def _open(self, name: str, source) -> Iterable:
+        if not isinstance(source, (int, str)):
+            return source
+        capture = FrameCapture(utils.get_stream(source=source),
+                               buffer_size=self.settings.CAPTURE_BUFFER_SIZE,
+                               policy=self.settings.CAPTURE_POLICY)
+        self.captures[name] = capture
+        return capture
+
+    def _pin_worker(self):
+        if self.pool_cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.pool_cpus)
@@ -2,13 +2,49 @@
 This version lets the detector to run all the time,
 so adjustments to the tracker can be made.
 """
+import os
 import time
+import queue
 import threading
 import cv2
+import numpy as np
 import camera_tracker.pipeline_components as pc
 import camera_tracker.predictors as predictors
 import camera_tracker.utils as utils
-from contextlib import suppress
+from camera_tracker.capture import CapturedFrame
+from camera_tracker.metrics import Metrics
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from contextlib import suppress, contextmanager
+from enum import Enum
+
+
+class SystemState(Enum):
+    """
+    State of the tracking loop. Only the loop changes it, at frame
+    boundaries:
+
+        RUNNING -> PAUSING -> PAUSED -> RESUMING -> RUNNING
+        RUNNING <-> CAMERA_MOVING
+
+    PAUSING is the frame on which a pause takes effect and the state is
+    reset, RESUMING the first frame after a pause, on which the detector
+    only takes its reference frame.
+    """
+    RUNNING = 'running'
+    PAUSING = 'pausing'
+    PAUSED = 'paused'
+    RESUMING = 'resuming'
+    CAMERA_MOVING = 'camera_moving'
+
+
+# a request to the loop, done is set once the loop has applied it
+_Command = namedtuple('_Command', ['name', 'arg', 'done'])
+
+# what is drawn on a labeled frame, bboxes are None when not drawn,
+# tracks is a list of (id, bbox) of the other targets in multi-target mode
+Overlay = namedtuple('Overlay', ['track_bbox', 'detect_bbox', 'fps', 'tracks'],
+                     defaults=(None,))
 
 
 class TrackingSystem:
@@ -21,31 +57,117 @@ class TrackingSystem:
                  by a condition variable.
     2. frame: the current frame received. Receiving thread(s) can 
               get the current frame by calling get_video_frame method.   
+
+    The video source may yield plain images or CapturedFrame tuples. In
+    the latter case the capture sequence number and timestamp are kept,
+    so the glass-to-decision latency of every frame can be measured.
+
+    The labeled frame is rendered lazily: the loop only keeps a snapshot
+    of the tracker frame and the overlay to draw on it, and readers render
+    it on demand, once per frame however many readers there are. While
+    nobody reads labeled frames (for LABELED_FRAME_IDLE_TIME seconds) no
+    snapshot is taken at all.
+
+    With a Kalman filter (kwarg kalman) the target centroid is smoothed,
+    get_predicted_location predicts where the target will be, and while
+    the prediction and the tracker agree the detector may be skipped for
+    up to max_detection_skip frames in a row. A frame without detection
+    only confirms the tracker when its box still agrees with the
+    prediction for that frame, otherwise the tracker loses health.
+
+    With a MultiTargetTracker (kwarg multi_target_tracker) every detected
+    object is tracked with a persistent ID. The location follows the
+    selected target (see select_track), by default the longest tracked
+    one. Detection runs on every frame and on the full frame in this mode.
+
+    With a FrameScheduler (kwarg scheduler) the detector and the labeled
+    frame are skipped on some frames while the tracking is healthy, to
+    keep the frame processing time within the scheduler's budget. These
+    frames are checked against the Kalman prediction like the ones
+    skipped by the filter, without a filter they confirm nothing.
+
+    Stage timings and counters are kept in a Metrics registry, see
+    get_metrics.
+
+    With a SessionRecorder (kwarg recorder) every frame entering the loop
+    is recorded together with the commands received on it, the camera
+    motion flag and the result of the frame, so the session can be
+    replayed with a ReplaySource. stop closes the recorder.
+
+    In pipelined mode the detector and the tracker process each frame
+    concurrently on worker threads (OpenCV releases the GIL), and the
+    loop waits for both results of the frame before the tracking is
+    corrected. The worker pool may be shared by several systems (kwarg
+    executor, see StreamManager).
+
+    name tells systems of one process apart (threads, display windows),
+    and cpus pins the loop thread to these CPUs where supported.
     """
 
+    LABELED_FRAME_IDLE_TIME = 1.0
+
     def __init__(self, *args, **kwargs):
         self.tracker = kwargs['tracker']
         self.detector = kwargs['detector']
         self.camera_moving_detector = kwargs['camera_moving_detector']
-        self.pre_tracker_pipe = kwargs['pre_tracker_pipe']
-        self.pre_detector_pipe = kwargs['pre_detector_pipe']
+        self.pre_tracker_pipe = kwargs.get('pre_tracker_pipe')
+        self.pre_detector_pipe = kwargs.get('pre_detector_pipe')
+        # preprocessing graph with a 'detector' and a 'tracker' output.
+        # By default it is built from the two pipelines, sharing their
+        # common steps so e.g. the resize runs once per frame.
+        self.preprocess_graph = kwargs.get('preprocess_graph') or \
+            pc.TransformGraph.from_pipelines({
+                'detector': self.pre_detector_pipe,
+                'tracker': self.pre_tracker_pipe
+            })
         self.video_source = kwargs['video_source']
         self.iou_threshold = kwargs['iou_threshold']
         self.valid_loc_frame_cnt = kwargs['valid_loc_frame_cnt']
         self.display = kwargs['display']
-
+        self.pipelined = kwargs.get('pipelined', False)
+        self.kalman = kwargs.get('kalman')
+        self.multi_target_tracker = kwargs.get('multi_target_tracker')
+        self.scheduler = kwargs.get('scheduler')
+        self.recorder = kwargs.get('recorder')
+        self._recorded_camera_motion = False
+        self._followed_track_id = None
+        self.max_detection_skip = kwargs.get('max_detection_skip', 0)
+        self.detection_skip_distance = kwargs.get('detection_skip_distance', 5)
+        self._prediction_agrees = False
+        self._detection_skips = 0
+        # a shared pool is left to its owner to shut down
+        self._executor = kwargs.get('executor')
+        self._owns_executor = self._executor is None
+        self.name = kwargs.get('name')
+        self.cpus = kwargs.get('cpus')
 
         self.thread = None
         self.run_lock = threading.Lock()
         self.running = False
-        self.pause_lock = threading.RLock()
-        self.paused = False
+        self.state = SystemState.RUNNING
+        # pause, resume and set_target are queued and applied by the loop
+        self._commands = queue.SimpleQueue()
 
         self.curr_frame = None
         self.frame_lock = threading.RLock()
 
         self.curr_labled_frame = None
+        # labeled_frame_seq counts published labeled frames, consumers
+        # wait on labeled_frame_cv for it to change
+        self.labeled_frame_seq = 0
+        self._labeled_frame_no = 0
+        self._labeled_frame_timestamp = None
+        self._labeled_overlay = None
+        self._labeled_frame_waiters = 0
+        self._labeled_frame_read_time = float('-inf')
+        # render cache, shared by all readers of the same labeled frame
+        self._rendered_frame = None
+        self._rendered_seq = 0
         self.labeled_frame_lock = threading.RLock()
+        self.labeled_frame_cv = threading.Condition(self.labeled_frame_lock)
+        # the labeled frame is drawn into the buffer that is not published
+        self._display_bufs = [None, None]
+        self._display_idx = 0
 
         self.location = None
         self.loc_lock = threading.RLock()
@@ -57,25 +179,41 @@ class TrackingSystem:
         self.tracking_frame_cnt = 0
 
         self.track_bbox = None
+        # box of the last detection, None when nothing was detected
+        self.detect_bbox = None
+        # all boxes of the last detection in multi-target mode
+        self.detect_boxes = None
+        # target selected by set_target, initialized on the next frame
+        self._target = None
+
+        self.frame_seq = 0
+        self.frame_timestamp = None
 
         # stats
         self.fps = 0
+        self.latency = 0
+        self._fps_t0 = time.time()
+        self.metrics = kwargs.get('metrics') or Metrics()
 
     def reset_state_vars(self):
         """
         Reset state variables. This function assumes
         no other thread is running so it's not thread-safe
         """
-        self.curr_frame = None
         self.location = None
         self.tracking = False
         self.detected = False
         self.tracking_frame_cnt = 0
-        self.detector.prev_img = None
+        self.detector.reset()
+        if self.multi_target_tracker is not None:
+            self.multi_target_tracker.reset()
+            self._followed_track_id = None
+        self._reset_motion_model()
 
     def start(self):
         self.thread = threading.Thread(
-            target=self.run_sys, name='TrackingSystem')
+            target=self.run_sys,
+            name='TrackingSystem' if self.name is None else f'TrackingSystem-{self.name}')
 
         with self.run_lock:
             self.running = True
@@ -88,25 +226,102 @@ class TrackingSystem:
         with self.run_lock:
             self.running = False
         self.thread.join()
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown()
+            self._executor = None
+        if self.recorder is not None:
+            self.recorder.close()
 
         self.reset_state_vars()
         print('threads stopped')
 
-    def pause(self):
-        with self.pause_lock:
-            self.paused = True
-        time.sleep(0.4)
-        self.reset_state_vars()
+    @property
+    def paused(self) -> bool:
+        return self.state in (SystemState.PAUSING, SystemState.PAUSED)
+
+    def pause(self, timeout: float = 1.0) -> bool:
+        """
+        Pause tracking at the next frame boundary. Returns whether the
+        loop applied the pause before timeout.
+        """
+        return self._send_command('pause', timeout=timeout)
 
-    def resume(self):
-        with self.pause_lock:
-            self.paused = False
+    def resume(self, timeout: float = 1.0) -> bool:
+        return self._send_command('resume', timeout=timeout)
+
+    def set_target(self, bbox, timeout: float = 1.0) -> bool:
+        """
+        Track the object at bbox (in tracker frame coordinates) from the
+        next frame on, resuming if paused.
+        """
+        return self._send_command('set_target', bbox, timeout=timeout)
+
+    def select_track(self, track_id, timeout: float = 1.0) -> bool:
+        """
+        Follow the target with track_id in multi-target mode, None to go
+        back to following the longest tracked one.
+        """
+        if self.multi_target_tracker is None:
+            raise ValueError('not in multi-target mode')
+        return self._send_command('select_track', track_id, timeout=timeout)
+
+    @contextmanager
+    def camera_motion(self):
+        """
+        Tell the detector the camera is being moved (e.g. by the gimbal)
+        while in the with block, so it compensates the motion.
+        """
+        self.detector.camera_motion_expected = True
+        try:
+            yield
+        finally:
+            self.detector.camera_motion_expected = False
 
     def get_location(self):
         with self.loc_lock:
             loc = self.location
         return loc
 
+    def get_predicted_location(self, lead: float = 0.0):
+        """
+        Location of the target predicted lead seconds from now, or None
+        without a valid location or Kalman filter.
+        """
+        with self.loc_lock:
+            if self.location is None or self.kalman is None or not self.kalman.initialized:
+                return None
+            return self.kalman.predict(time.monotonic() + lead)
+
+    def get_metrics(self):
+        """
+        Per-stage latency histograms (seconds) and counters of the loop,
+        plus the current fps and glass-to-decision latency.
+        """
+        metrics = self.metrics.snapshot()
+        metrics['fps'] = self.fps
+        metrics['latency'] = self.latency
+        metrics['frame_seq'] = self.frame_seq
+        metrics['tracking'] = self.tracking
+        if self.scheduler is not None:
+            metrics['scheduler'] = self.scheduler.get_stat()
+        return metrics
+
+    def get_status(self):
+        status = {
+            'state': self.state.value,
+            'paused': self.paused,
+            'tracking': self.tracking,
+            'location': self.get_location(),
+            'fps': self.fps,
+            'frame_seq': self.frame_seq
+        }
+        if self.multi_target_tracker is not None:
+            status['selected_track'] = self._followed_track_id
+            status['tracks'] = [
+                {'id': t.id, 'bbox': [int(v) for v in t.bbox], 'hits': t.hits}
+                for t in self.multi_target_tracker.tracks]
+        return status
+
     def get_video_frame(self):
         with self.frame_lock:
             if self.curr_frame is not None:
@@ -116,135 +331,550 @@ class TrackingSystem:
         return frame
 
 
-    def get_labeled_video_frame(self):
+    def get_labeled_video_frame(self, out=None):
+        """
+        Copy the labeled frame, into out when it has the right shape.
+        """
+        return self.copy_labeled_video_frame(out)[1]
+
+    def copy_labeled_video_frame(self, out=None):
+        """
+        Copy the labeled frame as get_labeled_video_frame, returns the seq
+        of the copied frame and the copy (None when there is no frame).
+        """
         with self.labeled_frame_lock:
-            if self.curr_labled_frame is not None:
-                frame = self.curr_labled_frame.copy()
-            else:
-                frame = None
-        return frame
+            self._labeled_frame_read_time = time.monotonic()
+            seq = self.labeled_frame_seq
+            frame = self._render_labeled_frame()
+            if frame is None:
+                return seq, None
+            if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+                return seq, frame.copy()
+            np.copyto(out, frame)
+        return seq, out
+
+    def wait_labeled_video_frame(self, last_seq: int, timeout=None) -> int:
+        """
+        Wait until a labeled frame newer than last_seq is published, or
+        until timeout. Returns the seq of the current labeled frame.
+        """
+        with self.labeled_frame_cv:
+            self._labeled_frame_waiters += 1
+            try:
+                self.labeled_frame_cv.wait_for(
+                    lambda: self.labeled_frame_seq != last_seq, timeout)
+            finally:
+                self._labeled_frame_waiters -= 1
+            return self.labeled_frame_seq
+
+    def write_labeled_video_frame(self, writer, last_seq: int = 0) -> int:
+        """
+        Write the labeled frame into writer (e.g. a SharedFrameWriter) if
+        it is newer than last_seq, without the intermediate copy of
+        get_labeled_video_frame. Returns the seq of the labeled frame.
+        """
+        with self.labeled_frame_lock:
+            self._labeled_frame_read_time = time.monotonic()
+            seq = self.labeled_frame_seq
+            if seq != last_seq:
+                frame = self._render_labeled_frame()
+                if frame is not None:
+                    writer.write(frame, self._labeled_frame_no,
+                                 self._labeled_frame_timestamp)
+        return seq
 
     def run_sys(self):
-        t0 = time.time()
-        for frame_orig in self.video_source:
+        if self.cpus and hasattr(os, 'sched_setaffinity'):
+            # pid 0 is the calling thread
+            os.sched_setaffinity(0, self.cpus)
+        self._fps_t0 = time.time()
+        t_wait = time.perf_counter()
+        for item in self.video_source:
+            self.metrics.observe('capture', time.perf_counter() - t_wait)
+
             with self.run_lock:
                 if not self.running:
                     break
 
-            with self.frame_lock:
-                self.curr_frame = frame_orig
+            t_frame = time.perf_counter()
+            if not self._process_frame(item):
+                break
+            if self.recorder is not None:
+                self._record_result()
+            self.metrics.observe('frame', time.perf_counter() - t_frame)
+            t_wait = time.perf_counter()
 
-            with self.pause_lock:
-                if self.paused:
-                    with self.labeled_frame_lock:
-                        self.curr_labled_frame = frame_orig
-                    continue
-
-            frame = frame_orig.copy()
-            frame = utils.run_pipeline(self.pre_detector_pipe, frame)
-            
-            frame_tmp = frame.copy()
-            cam_moving = self.camera_moving_detector.predict(frame_tmp)
-            if cam_moving:
-                print('camera is moving!')
-                self.reset_state_vars()
-                continue
-
-            self.detected, detect_bbox = self.detector.predict(frame)
-
-            if self.tracking:
-                frame = frame_orig.copy()
-                frame = utils.run_pipeline(self.pre_tracker_pipe, frame)
-                self.tracking, self.track_bbox = self.tracker.predict(frame)
-                if self.detected and self.tracking:
-                    self.tracking_frame_cnt += 1
-                    # correct tracking if possible
-                    iou = utils.bbox_intersection_over_union(
-                        detect_bbox, self.track_bbox)
-                    if iou < self.iou_threshold:
-                        self.tracker.decrease_health()
-                        if self.tracker.get_health() == 0:
-                            self.tracking = False
-                            self.tracking_frame_cnt = 0
-                    
-                    
-                    # only update location info when both tracking and detected
-                    if self.tracking_frame_cnt > self.valid_loc_frame_cnt:
-                        with self.loc_lock:
-                            print(f'new target: {self.track_bbox}')
-                            self.location = (self.track_bbox[0] + self.track_bbox[2] / 2,
-                                            self.track_bbox[1] + self.track_bbox[3] / 2)
-                            print(f'new location: {self.location}')
-                            self.loc_cv.notify_all()
-
-                else:
-                    self.location = None
-                    self.tracking_frame_cnt = 0
-                # else keep tracking
+    def _process_frame(self, item) -> bool:
+        """
+        Process one item of the video source. Returns False when the
+        loop has to stop.
+        """
+        t_start = time.perf_counter()
+        if isinstance(item, CapturedFrame):
+            self.frame_seq, self.frame_timestamp, frame_orig = item
+        else:
+            frame_orig = item
+            self.frame_seq += 1
+            self.frame_timestamp = time.monotonic()
+        self.metrics.incr('frames')
+        self.detect_bbox = None
+        if self.recorder is not None:
+            self._record_frame(frame_orig)
+
+        commands = self._receive_commands()
+
+        with self.frame_lock:
+            self.curr_frame = frame_orig
+
+        if self.state == SystemState.PAUSING:
+            self.reset_state_vars()
+            self.state = SystemState.PAUSED
+        if self.state == SystemState.PAUSED:
+            self._ack_commands(commands)
+            self._publish_labeled_frame(frame_orig)
+            self.metrics.incr('paused_frames')
+            return True
+        if self.state == SystemState.RESUMING:
+            # the camera may have moved while paused
+            self.reset_state_vars()
+
+        with self.metrics.time('preprocess'):
+            frames = self.preprocess_graph.run(frame_orig)
+        frame = frames['detector']
+        frame_tracker = frames['tracker']
+
+        if self._target is not None:
+            self._init_target(frame_tracker, self._target)
+            self._target = None
+        self._ack_commands(commands)
+
+        # while tracking in ROI mode only look around the target,
+        # otherwise search the full frame
+        single_target = self.multi_target_tracker is None
+        self.detector.set_roi(self.tracker.roi if self.tracking and single_target else None)
+
+        plan = self.scheduler.plan(self._tracking_healthy()) \
+            if self.scheduler is not None else None
+        skip_detection = self._skip_detection()
+        if plan is not None and not plan.detect and not skip_detection:
+            skip_detection = True
+            self.metrics.incr('scheduled_detection_skips')
+        cam_moving, (self.detected, detect_bbox), track_ret = \
+            self._detect_and_track(frame, frame_tracker, skip_detection)
+        if cam_moving:
+            print('camera is moving!')
+            self.state = SystemState.CAMERA_MOVING
+            self.metrics.incr('camera_moving_frames')
+            self.reset_state_vars()
+            return True
+        self.state = SystemState.RUNNING
+
+        if self.detected:
+            self.detect_bbox = detect_bbox
+            self.metrics.incr('detections')
+
+        if not single_target:
+            self._update_targets()
+        elif self.tracking:
+            self.tracking, self.track_bbox = track_ret
+            if not self.tracking:
+                self.metrics.incr('tracker_lost')
+            # a skipped detection only confirms the tracker when its box
+            # agrees with the Kalman prediction of this frame
+            confirmed = self.detected or \
+                (skip_detection and self.tracking and self._agrees_with_prediction(self.track_bbox))
+            if self.tracking and confirmed:
+                self.tracking_frame_cnt += 1
+                # correct tracking if possible
+                iou = utils.bbox_intersection_over_union(
+                    detect_bbox, self.track_bbox) if self.detected else 1.0
+                if iou < self.iou_threshold:
+                    self._decrease_tracker_health()
+
+                # only update location info when both tracking and detected
+                if self.tracking_frame_cnt > self.valid_loc_frame_cnt:
+                    with self.loc_lock:
+                        print(f'new target: {self.track_bbox}')
+                        self.location = (self.track_bbox[0] + self.track_bbox[2] / 2,
+                                         self.track_bbox[1] + self.track_bbox[3] / 2)
+                        print(f'new location: {self.location}')
+                        self.loc_cv.notify_all()
+                    self.metrics.incr('locations')
+
+            elif self.tracking and skip_detection:
+                # unconfirmed, the location is left as it is. A box that
+                # left the prediction costs health like a detection miss.
+                self.metrics.incr('unconfirmed_skips')
+                if self.kalman is not None and self.kalman.initialized:
+                    self._decrease_tracker_health()
             else:
-                # tracker not tracking right now
+                self.location = None
                 self.tracking_frame_cnt = 0
-                if self.detected:
-                    # detected, so initialize tracker
-                    self.tracker.init_tracker(frame, detect_bbox)
-                    self.tracking = True
-                    self.track_bbox = detect_bbox
-                # else continue loop
-
-            
-
-            t_frame = time.time() - t0
-            self.fps = 1 / t_frame
-            tracker_stat = self.tracker.get_stat()
-
-            
-            frame_display = frame_orig.copy()
-            frame_display = utils.run_pipeline(
-                self.pre_tracker_pipe, frame_display)
-            if self.tracking:
-                p1 = (int(self.track_bbox[0]), int(self.track_bbox[1]))
-                p2 = (int(self.track_bbox[0] + self.track_bbox[2]),
-                        int(self.track_bbox[1] + self.track_bbox[3]))
-                cv2.rectangle(frame_display, p1, p2, (0, 255, 0), 2, 1)
+            # else keep tracking
+        else:
+            # tracker not tracking right now
+            self.tracking_frame_cnt = 0
             if self.detected:
-                p1 = (int(detect_bbox[0]), int(detect_bbox[1]))
-                p2 = (int(detect_bbox[0] + detect_bbox[2]),
-                        int(detect_bbox[1] + detect_bbox[3]))
-                cv2.rectangle(frame_display, p1, p2, (255, 0, 0), 2, 1)
-
-            cv2.putText(frame_display, 'FPS : {:.2f}'.format(self.fps), (10, 20),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (50, 170, 50), 2)
-            cv2.putText(frame_display, 'tracker', (10, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            cv2.putText(frame_display, 'detector', (10, 60),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-            
-            with self.labeled_frame_lock:
-                self.curr_labled_frame = frame_display
-
-            if self.display:
-                cv2.imshow('app', frame_display)
+                # detected, so initialize tracker
+                with self.metrics.time('tracker_init'):
+                    self.tracker.init_tracker(frame_tracker, detect_bbox)
+                self.metrics.incr('tracker_inits')
+                self.tracking = True
+                self.track_bbox = detect_bbox
+            # else continue loop
+
+        self._update_motion_model()
+
+        t_frame = time.time() - self._fps_t0
+        self.fps = 1 / t_frame
+        self.latency = time.monotonic() - self.frame_timestamp
+        self.metrics.observe('latency', self.latency)
+
+        overlay = plan is None or plan.overlay
+        if overlay:
+            self._publish_labeled_frame(frame_tracker, Overlay(
+                self.track_bbox if self.tracking else None,
+                detect_bbox if self.detected else None,
+                self.fps,
+                self._other_tracks()))
+        else:
+            self.metrics.incr('overlay_skips')
+
+        if self.display:
+            if overlay:
+                with self.labeled_frame_lock:
+                    cv2.imshow(self._window_name('app'), self._render_labeled_frame())
                 with suppress(Exception):
-                    cv2.imshow('delta', self.detector.img_delta)
+                    cv2.imshow(self._window_name('delta'), self.detector.img_delta)
 
-                if (cv2.waitKey(1) & 0xFF) == ord('q'):
-                    break
+            if (cv2.waitKey(1) & 0xFF) == ord('q'):
+                return False
 
-                # print(f'tracking: {self.tracking}; detected: {self.detected}')
-                # print(
-                #     f"time taken on detecting: {self.detector.get_stat()['frame_process_time']}")
-                # print(
-                #     f"time taken on tracking: {self.tracker.get_stat()['frame_process_time']}")
+        if plan is not None:
+            self.scheduler.record(plan, time.perf_counter() - t_start, not skip_detection)
+        self._fps_t0 = time.time()
+        return True
 
-            t0 = time.time()
+    def _detect(self, frame_detector):
+        """
+        Check if the camera is moving and detect objects. When the camera
+        moving detector shares our detector, the difference mask is only
+        computed once. Returns the camera moving flag and the detector result.
+        """
+        if self.camera_moving_detector.pixel_diff_detector is self.detector:
+            # the camera moving check is part of the detection
+            with self.metrics.time('detect'):
+                cam_moving = self.camera_moving_detector.predict(frame_detector)
+            self.detect_boxes = self.camera_moving_detector.last_boxes
+            return cam_moving, self.camera_moving_detector.last_detection
+
+        self.detect_boxes = None
+        with self.metrics.time('camera_moving'):
+            cam_moving = self.camera_moving_detector.predict(frame_detector)
+        if cam_moving:
+            return cam_moving, (False, None)
+        with self.metrics.time('detect'):
+            if self.multi_target_tracker is None:
+                return cam_moving, self.detector.predict(frame_detector)
+            self.detect_boxes = self.detector.predict_all(frame_detector)
+        if len(self.detect_boxes):
+            return cam_moving, (True, tuple(int(v) for v in self.detect_boxes[0]))
+        return cam_moving, (False, None)
+
+    def _track(self, frame_tracker):
+        with self.metrics.time('track'):
+            if self.multi_target_tracker is not None:
+                return self.multi_target_tracker.predict(frame_tracker)
+            return self.tracker.predict(frame_tracker)
+
+    def _detect_and_track(self, frame_detector, frame_tracker, skip_detection=False):
+        """
+        Run the detection stage, and the tracker when tracking, on the
+        current frame. In pipelined mode the two stages run concurrently.
+        Returns the camera moving flag, the detector result and the
+        tracker result (None when not tracking).
+        """
+        if skip_detection:
+            # keep the detector reference frame current
+            self.detector.skip(frame_detector)
+            self.metrics.incr('detection_skips')
+            return False, (False, None), self._track(frame_tracker)
 
-    def set_target(self, bbox):
-        self.pause()
-        self.reset_state_vars()
+        if not self.tracking and not self._has_tracks():
+            return self._detect(frame_detector) + (None,)
+
+        if not self.pipelined:
+            return self._detect(frame_detector) + (self._track(frame_tracker),)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix='TrackingSystem')
+
+        detect_future = self._executor.submit(self._detect, frame_detector)
+        track_future = self._executor.submit(self._track, frame_tracker)
+        return detect_future.result() + (track_future.result(),)
+
+    def _window_name(self, window):
+        return window if self.name is None else f'{window} {self.name}'
 
+    def _has_tracks(self) -> bool:
+        return self.multi_target_tracker is not None and bool(self.multi_target_tracker.tracks)
+
+    def _tracking_healthy(self) -> bool:
+        """
+        Whether the tracker follows a confirmed target and never missed
+        the detections since, so detections may be skipped.
+        """
+        return self.multi_target_tracker is None and self.tracking and \
+            self.tracking_frame_cnt > self.valid_loc_frame_cnt and \
+            self.tracker.get_health() == self.tracker.max_tracker_health
+
+    def _skip_detection(self) -> bool:
+        # new targets are only found by the detector in multi-target mode
+        if self.tracking and self._prediction_agrees and self.multi_target_tracker is None and \
+                self._detection_skips < self.max_detection_skip:
+            self._detection_skips += 1
+            return True
+        self._detection_skips = 0
+        return False
+
+    def _decrease_tracker_health(self):
+        self.tracker.decrease_health()
+        if self.tracker.get_health() == 0:
+            self.tracking = False
+            self.tracking_frame_cnt = 0
+            self.metrics.incr('tracker_lost')
+
+    def _agrees_with_prediction(self, bbox) -> bool:
+        """
+        Whether the centroid of bbox is within detection_skip_distance of
+        the Kalman prediction for the current frame.
+        """
+        if self.kalman is None:
+            return False
+        centroid = (bbox[0] + bbox[2] / 2, bbox[1] + bbox[3] / 2)
+        with self.loc_lock:
+            return self.kalman.initialized and \
+                self.kalman.distance(centroid, self.frame_timestamp) < self.detection_skip_distance
+
+    def _update_motion_model(self):
+        """
+        Feed the tracked centroid to the Kalman filter, and check whether
+        it agreed with the prediction.
+        """
+        if self.kalman is None:
+            return
+        if not self.tracking:
+            self._reset_motion_model()
+            return
+
+        centroid = (self.track_bbox[0] + self.track_bbox[2] / 2,
+                    self.track_bbox[1] + self.track_bbox[3] / 2)
+        with self.loc_lock:
+            self._prediction_agrees = self._agrees_with_prediction(self.track_bbox)
+            self.kalman.update(centroid, self.frame_timestamp)
+
+    def _update_targets(self):
+        """
+        Match the detections to the tracked targets, and follow the
+        selected one.
+        """
+        mtt = self.multi_target_tracker
+        with self.metrics.time('associate'):
+            mtt.associate(self.detect_boxes if self.detect_boxes is not None else [])
+        if mtt.selected is None:
+            # follow the longest tracked target until the operator picks one
+            confirmed = [t for t in mtt.tracks if t.hits > self.valid_loc_frame_cnt]
+            if confirmed:
+                mtt.select(max(confirmed, key=lambda t: t.hits).id)
+
+        target = mtt.selected
+        target_id = target.id if target is not None else None
+        if target_id != self._followed_track_id:
+            # the motion model belongs to the previous target
+            self._reset_motion_model()
+            self._followed_track_id = target_id
+            self.metrics.incr('target_switches')
+
+        self.tracking = target is not None
+        self.track_bbox = target.bbox if target is not None else None
+        if target is not None and target.matched and target.hits > self.valid_loc_frame_cnt:
+            with self.loc_lock:
+                self.location = (self.track_bbox[0] + self.track_bbox[2] / 2,
+                                 self.track_bbox[1] + self.track_bbox[3] / 2)
+                print(f'new location of target {target_id}: {self.location}')
+                self.loc_cv.notify_all()
+            self.metrics.incr('locations')
+        elif target is None:
+            self.location = None
+
+    def _other_tracks(self):
+        if self.multi_target_tracker is None:
+            return None
+        return [(t.id, t.bbox) for t in self.multi_target_tracker.tracks
+                if t.id != self._followed_track_id]
+
+    def _reset_motion_model(self):
+        self._prediction_agrees = False
+        if self.kalman is not None:
+            with self.loc_lock:
+                self.kalman.reset()
+
+    def _labeled_frame_watched(self) -> bool:
+        return self.display or self._labeled_frame_waiters > 0 or \
+            time.monotonic() - self._labeled_frame_read_time < self.LABELED_FRAME_IDLE_TIME
+
+    def _publish_labeled_frame(self, frame, overlay=None):
+        """
+        Publish a snapshot of frame and the overlay to draw on it, unless
+        nobody reads labeled frames.
+        """
+        if not self._labeled_frame_watched():
+            return
+        frame = self._next_display_buffer(frame)
+        with self.labeled_frame_cv:
+            self.curr_labled_frame = frame
+            self._labeled_overlay = overlay
+            self.labeled_frame_seq += 1
+            self._labeled_frame_no = self.frame_seq
+            self._labeled_frame_timestamp = self.frame_timestamp
+            self.labeled_frame_cv.notify_all()
+
+    def _render_labeled_frame(self):
+        """
+        Render the published labeled frame, or return the cached render.
+        Must be called holding labeled_frame_lock.
+        """
+        if self.curr_labled_frame is None:
+            return None
+        if self._rendered_seq == self.labeled_frame_seq:
+            return self._rendered_frame
+
+        with self.metrics.time('overlay'):
+            frame = self.curr_labled_frame
+            rendered = self._rendered_frame
+            if rendered is None or rendered.shape != frame.shape or rendered.dtype != frame.dtype:
+                rendered = self._rendered_frame = np.empty_like(frame)
+            np.copyto(rendered, frame)
+            if self._labeled_overlay is not None:
+                self._draw_overlay(rendered, self._labeled_overlay)
+        self._rendered_seq = self.labeled_frame_seq
+        return rendered
+
+    @staticmethod
+    def _draw_overlay(frame_display, overlay):
+        if overlay.track_bbox is not None:
+            bbox = overlay.track_bbox
+            p1 = (int(bbox[0]), int(bbox[1]))
+            p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
+            cv2.rectangle(frame_display, p1, p2, (0, 255, 0), 2, 1)
+        if overlay.detect_bbox is not None:
+            bbox = overlay.detect_bbox
+            p1 = (int(bbox[0]), int(bbox[1]))
+            p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
+            cv2.rectangle(frame_display, p1, p2, (255, 0, 0), 2, 1)
+        for track_id, bbox in overlay.tracks or ():
+            p1 = (int(bbox[0]), int(bbox[1]))
+            p2 = (int(bbox[0] + bbox[2]), int(bbox[1] + bbox[3]))
+            cv2.rectangle(frame_display, p1, p2, (0, 255, 255), 1, 1)
+            cv2.putText(frame_display, str(track_id), (p1[0], p1[1] - 4),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+        cv2.putText(frame_display, 'FPS : {:.2f}'.format(overlay.fps), (10, 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (50, 170, 50), 2)
+        cv2.putText(frame_display, 'tracker', (10, 40),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        cv2.putText(frame_display, 'detector', (10, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+    def _next_display_buffer(self, img):
+        """
+        Copy img into the display buffer that is not currently published.
+        Readers only copy the published buffer while holding
+        labeled_frame_lock, so it is never written while being read.
+        """
+        self._display_idx ^= 1
+        buf = self._display_bufs[self._display_idx]
+        if buf is None or buf.shape != img.shape or buf.dtype != img.dtype:
+            buf = np.empty_like(img)
+            self._display_bufs[self._display_idx] = buf
+        np.copyto(buf, img)
+        return buf
+
+    def _send_command(self, name, arg=None, timeout=None) -> bool:
+        """
+        Queue a command for the loop and wait until it is applied. Commands
+        sent while the loop is not running are applied on its first frame.
+        """
+        cmd = _Command(name, arg, threading.Event())
+        self._commands.put(cmd)
+        if self.thread is None or not self.thread.is_alive():
+            return False
+        return cmd.done.wait(timeout)
+
+    def _receive_commands(self):
+        """
+        Apply the queued commands to the state, in order.
+        """
+        commands = []
+        while True:
+            try:
+                cmd = self._commands.get_nowait()
+            except queue.Empty:
+                return commands
+            commands.append(cmd)
+            if self.recorder is not None:
+                self.recorder.write_event('command', {'name': cmd.name, 'arg': cmd.arg},
+                                          self.frame_seq, self.frame_timestamp)
+
+            if cmd.name == 'pause':
+                if not self.paused:
+                    self.state = SystemState.PAUSING
+                self._target = None
+            elif cmd.name == 'resume':
+                if self.paused:
+                    self.state = SystemState.RESUMING
+            elif cmd.name == 'set_target':
+                self._target = cmd.arg
+                self.state = SystemState.RUNNING
+            elif cmd.name == 'select_track':
+                self.multi_target_tracker.select(cmd.arg)
+
+    def _record_frame(self, frame):
+        self.recorder.write_frame(frame, self.frame_seq, self.frame_timestamp)
+        # the flag is set from other threads, it is sampled once per frame
+        camera_motion = self.detector.camera_motion_expected
+        if camera_motion != self._recorded_camera_motion:
+            self.recorder.write_event('camera_motion', camera_motion,
+                                      self.frame_seq, self.frame_timestamp)
+            self._recorded_camera_motion = camera_motion
+
+    def _record_result(self):
+        result = {
+            'state': self.state.value,
+            'detected': self.detected,
+            'detect_bbox': self.detect_bbox,
+            'tracking': self.tracking,
+            'track_bbox': self.track_bbox if self.tracking else None,
+            'location': self.get_location()
+        }
+        if self.multi_target_tracker is not None:
+            result['tracks'] = [(t.id, t.bbox) for t in self.multi_target_tracker.tracks]
+        self.recorder.write_event('result', result, self.frame_seq, self.frame_timestamp)
+
+    @staticmethod
+    def _ack_commands(commands):
+        for cmd in commands:
+            cmd.done.set()
+
+    def _init_target(self, frame_tracker, bbox):
+        self.reset_state_vars()
         print('set target at', bbox)
-        self.tracker.init_tracker(self.curr_frame, bbox)
+        if self.multi_target_tracker is not None:
+            track = self.multi_target_tracker.add(frame_tracker, bbox)
+            self.multi_target_tracker.select(track.id)
+            self._followed_track_id = track.id
+        else:
+            self.tracker.init_tracker(frame_tracker, bbox)
         self.tracking = True
         self.track_bbox = bbox
-
-        self.resume()
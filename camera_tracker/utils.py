@@ -3,6 +3,8 @@ import numpy as np
 from typing import Tuple, Any, List
 from pathlib import Path
 
+from . import bbox
+
 
 # custom types
 BoundingBox = Tuple[int, int, int, int]
@@ -21,20 +23,23 @@ def tracker_factory(tracker_name: str):
     return tracker_table[tracker_name]()
 
 
-def get_stream(mock: bool = False):
+def get_stream(mock: bool = False, source=0):
+    """
+    Open a video source: a camera index, a video file or a stream URL.
+    """
     if mock:
         video_path = str(Path(__file__).parents[2] / 'videos/performance_test.mov')
         cap = cv2.VideoCapture(video_path)
     else:
-        cap = cv2.VideoCapture(0)
+        cap = cv2.VideoCapture(source)
 
     return cap
 
-def get_frame_generator(mock: bool = False):
+def get_frame_generator(mock: bool = False, source=0):
     """
     this function returns a generator that yields the current frame
     """
-    cap = get_stream(mock)
+    cap = get_stream(mock, source)
     while True:
         ret, frame = cap.read()
         if not ret:
@@ -52,6 +57,47 @@ def bbox_area(bbox: BoundingBox) -> float:
     return bbox[2] * bbox[3]
 
 
+def translate_bbox(bbox: BoundingBox, dx: float, dy: float) -> BoundingBox:
+    return (bbox[0] + dx, bbox[1] + dy, bbox[2], bbox[3])
+
+
+def scale_bbox(bbox: BoundingBox, factor: float) -> BoundingBox:
+    return (bbox[0] * factor, bbox[1] * factor, bbox[2] * factor, bbox[3] * factor)
+
+
+def scale_kernel_size(ksize: Tuple[int, int], downscale: float) -> Tuple[int, int]:
+    """
+    Scale a Gaussian kernel size for an image downscale times smaller.
+    The result stays odd, as cv2.GaussianBlur requires.
+    """
+    return tuple(max(1, int(round(k / downscale))) | 1 for k in ksize)
+
+
+def expand_bbox(bbox: BoundingBox, scale: float, frame_size: Tuple[int, int]) -> BoundingBox:
+    """
+    Scale bbox around its centre and clip it to a frame of
+    frame_size (width, height). Returns integer coordinates.
+    """
+    cx = bbox[0] + bbox[2] / 2
+    cy = bbox[1] + bbox[3] / 2
+    w = bbox[2] * scale
+    h = bbox[3] * scale
+
+    x1 = max(0, int(cx - w / 2))
+    y1 = max(0, int(cy - h / 2))
+    x2 = min(frame_size[0], int(cx + w / 2 + 1))
+    y2 = min(frame_size[1], int(cy + h / 2 + 1))
+    return (x1, y1, max(0, x2 - x1), max(0, y2 - y1))
+
+
+def crop(img: Image, bbox: BoundingBox) -> Image:
+    """
+    Return the part of img inside bbox. The result is a view, not a copy.
+    """
+    x, y, w, h = (int(v) for v in bbox)
+    return img[y:y + h, x:x + w]
+
+
 def bbox_intersection_over_union(bbox_a: BoundingBox, bbox_b: BoundingBox) -> float:
     # determine the (x, y)-coordinates of the intersection rectangle
     xA = max(bbox_a[0], bbox_b[0])
@@ -72,3 +118,11 @@ def bbox_intersection_over_union(bbox_a: BoundingBox, bbox_b: BoundingBox) -> fl
     if iou < 0:
         iou = 0
     return iou
+
+
+def bbox_iou_matrix(boxes_a, boxes_b) -> np.ndarray:
+    """
+    Pairwise bbox_intersection_over_union of two box arrays, see
+    bbox.iou_matrix.
+    """
+    return bbox.iou_matrix(boxes_a, boxes_b)
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from camera_tracker import bbox
+from camera_tracker.utils import bbox_intersection_over_union, bbox_area, scale_bbox, translate_bbox
+
+
+class BboxTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.boxes_a = np.concatenate([rng.integers(0, 100, (6, 2)), rng.integers(1, 40, (6, 2))], axis=1)
+        self.boxes_b = np.concatenate([rng.integers(0, 100, (9, 2)), rng.integers(1, 40, (9, 2))], axis=1)
+
+    def test_iou_matrix_matches_scalar(self):
+        iou = bbox.iou_matrix(self.boxes_a, self.boxes_b)
+        self.assertEqual(iou.shape, (6, 9))
+        for i, a in enumerate(self.boxes_a):
+            for j, b in enumerate(self.boxes_b):
+                self.assertAlmostEqual(iou[i, j], bbox_intersection_over_union(a, b))
+
+    def test_iou_matrix_single_box(self):
+        iou = bbox.iou_matrix((10, 10, 20, 20), [(10, 10, 20, 20), (100, 100, 5, 5)])
+        self.assertEqual(iou.shape, (1, 2))
+        self.assertAlmostEqual(iou[0, 1], 0)
+        self.assertEqual(bbox.iou_matrix([], [(0, 0, 5, 5)]).shape, (0, 1))
+
+    def test_degenerate_iou(self):
+        # the scalar version divides by zero here
+        self.assertEqual(bbox.iou_matrix((0, 0, 0, 0), (5, 5, 0, 0))[0, 0], 0)
+
+    def test_area_scale_translate(self):
+        tuples = [tuple(b) for b in self.boxes_a]
+        np.testing.assert_array_equal(bbox.area(self.boxes_a), [bbox_area(b) for b in tuples])
+        np.testing.assert_allclose(bbox.scale(self.boxes_a, 0.5), [scale_bbox(b, 0.5) for b in tuples])
+        np.testing.assert_array_equal(bbox.translate(self.boxes_a, 3, -4),
+                                      [translate_bbox(b, 3, -4) for b in tuples])
+        np.testing.assert_array_equal(bbox.scale((10, 10, 4, 4), (2, 3)), [[20, 30, 8, 12]])
+
+    def test_conversions(self):
+        xyxy = bbox.xywh_to_xyxy(self.boxes_a)
+        np.testing.assert_array_equal(xyxy[:, 2:], self.boxes_a[:, :2] + self.boxes_a[:, 2:])
+        np.testing.assert_array_equal(bbox.xyxy_to_xywh(xyxy), self.boxes_a)
+        np.testing.assert_allclose(bbox.centroid((10, 20, 5, 10)), [[12.5, 25]])
+
+    def test_clip(self):
+        clipped = bbox.clip([(-5, 10, 20, 20), (90, 90, 20, 20), (200, 0, 5, 5)], (100, 100))
+        np.testing.assert_array_equal(clipped, [(0, 10, 15, 20), (90, 90, 10, 10), (100, 0, 0, 5)])
+
+    def test_merge_many_boxes(self):
+        # two separate clusters of 256 boxes
+        cluster = np.tile([10, 10, 20, 20], (256, 1))
+        boxes = np.concatenate([cluster, cluster + [200, 0, 0, 0]])
+        merged = bbox.merge_adjacent(boxes, 3)
+        self.assertEqual(sorted(map(tuple, merged)), [(10, 10, 20, 20), (210, 10, 20, 20)])
+
+    def test_merge_chain(self):
+        # each box is near the next one only, the chain forms one group
+        boxes = [(i * 12, 0, 10, 10) for i in range(50)][::-1] + [(0, 100, 10, 10)]
+        merged = bbox.merge_adjacent(boxes, 3)
+        self.assertEqual(sorted(map(tuple, merged)), [(0, 0, 598, 10), (0, 100, 10, 10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
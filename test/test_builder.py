@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from camera_tracker.builder import REQUIRED_SETTINGS, load_settings
+
+profiles = Path(__file__).parents[1] / 'app/setting_profiles'
+
+
+class LoadSettingsTest(unittest.TestCase):
+    def test_profiles_are_complete(self):
+        for profile in profiles.glob('distance_*.py'):
+            settings = load_settings(profile)
+            for name in REQUIRED_SETTINGS:
+                self.assertTrue(hasattr(settings, name), f'{profile.name}: {name}')
+
+    def test_overrides(self):
+        settings = load_settings(profiles / 'distance_5.py', PIPELINED=True)
+        self.assertTrue(settings.PIPELINED)
+
+    def test_missing_setting(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'partial.py')
+            with open(path, 'w') as f:
+                f.write('IMG_SIZE = (640, 360)\n')
+            with self.assertRaisesRegex(ValueError, 'TRACKER_NAME'):
+                load_settings(path)
+
+    def test_shared_settings(self):
+        # the profiles only set the settings that depend on the distance
+        near = load_settings(profiles / 'distance_5.py')
+        far = load_settings(profiles / 'distance_100.py')
+        self.assertEqual(near.FRAME_BUDGET, far.FRAME_BUDGET)
+        self.assertNotEqual(near.TRACKER_NAME, far.TRACKER_NAME)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import time
+import unittest
+import numpy as np
+import camera_tracker.predictors as predictors
+from camera_tracker.predictors import CascadeTracker
+
+
+class FakeTracker:
+    """
+    Returns the results queued in its class for its name, or follows the
+    box it was initialized with. cost is slept per update, init_cost per
+    init.
+    """
+
+    results = {}
+    cost = {}
+    init_cost = {}
+    instances = []
+
+    def __init__(self, name):
+        self.name = name
+        self.bbox = None
+        self.inits = []
+        FakeTracker.instances.append(self)
+
+    def init(self, img, bbox):
+        time.sleep(self.init_cost.get(self.name, 0))
+        self.bbox = tuple(bbox)
+        self.inits.append(self.bbox)
+
+    def update(self, img):
+        time.sleep(self.cost.get(self.name, 0))
+        queued = self.results.get(self.name)
+        if queued:
+            return queued.pop(0)
+        return True, self.bbox
+
+
+class CascadeTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = predictors.tracker_factory
+        predictors.tracker_factory = FakeTracker
+        FakeTracker.results = {'cheap': [], 'accurate': []}
+        FakeTracker.cost = {}
+        FakeTracker.init_cost = {}
+        FakeTracker.instances = []
+        self.img = np.zeros((100, 100), np.uint8)
+
+    def tearDown(self):
+        predictors.tracker_factory = self.factory
+
+    def make_tracker(self, frame_budget=1.0, max_refine_interval=30):
+        tracker = CascadeTracker('cheap', 3, 'accurate', frame_budget,
+                                 max_refine_interval=max_refine_interval)
+        tracker.init_tracker(self.img, (10, 10, 20, 20))
+        return tracker
+
+    def test_accurate_box_reanchors_cheap_tracker(self):
+        tracker = self.make_tracker()
+        FakeTracker.results['cheap'].append((True, (26, 10, 20, 20)))
+        FakeTracker.results['accurate'].append((True, (12, 10, 20, 20)))
+
+        self.assertEqual(tracker.predict(self.img), (True, (12, 10, 20, 20)))
+        self.assertEqual(tracker.tracker.inits, [(12, 10, 20, 20)])
+
+    def test_agreeing_trackers_are_kept(self):
+        tracker = self.make_tracker()
+        cheap = tracker.tracker
+        FakeTracker.results['cheap'].append((True, (12, 10, 20, 20)))
+        FakeTracker.results['accurate'].append((True, (14, 10, 20, 20)))
+
+        self.assertEqual(tracker.predict(self.img), (True, (14, 10, 20, 20)))
+        self.assertIs(tracker.tracker, cheap)
+        self.assertEqual(len(FakeTracker.instances), 2)
+
+    def test_lost_accurate_tracker_is_reanchored(self):
+        tracker = self.make_tracker()
+        accurate = tracker.accurate_tracker
+        FakeTracker.results['cheap'].append((True, (12, 10, 20, 20)))
+        FakeTracker.results['accurate'].append((False, (0, 0, 0, 0)))
+
+        self.assertEqual(tracker.predict(self.img), (True, (12, 10, 20, 20)))
+        self.assertIsNot(tracker.accurate_tracker, accurate)
+        self.assertEqual(tracker.accurate_tracker.inits, [(12, 10, 20, 20)])
+        self.assertEqual(tracker.get_stat()['accurate_reanchor_count'], 1)
+
+    def test_stale_accurate_box_is_ignored(self):
+        # the accurate tracker is still where the target was
+        tracker = self.make_tracker()
+        FakeTracker.results['cheap'].append((True, (60, 60, 20, 20)))
+        FakeTracker.results['accurate'].append((True, (10, 10, 20, 20)))
+
+        self.assertEqual(tracker.predict(self.img), (True, (60, 60, 20, 20)))
+        self.assertEqual(tracker.accurate_tracker.inits, [(60, 60, 20, 20)])
+
+    def test_refine_interval_fits_budget(self):
+        FakeTracker.cost = {'accurate': 0.01}
+        tracker = self.make_tracker(frame_budget=0.004)
+        for _ in range(5):
+            tracker.predict(self.img)
+        # accurate cost / budget, plus sleep overshoot
+        self.assertGreaterEqual(tracker.refine_interval, 3)
+        self.assertLess(tracker.refine_interval, 30)
+
+        refines = tracker.refine_cnt
+        for _ in range(3 * tracker.refine_interval):
+            tracker.predict(self.img)
+        self.assertLessEqual(tracker.refine_cnt - refines, 4)
+
+    def test_reanchor_cost_fits_budget(self):
+        # the accurate tracker fails on every refine and is re-initialized
+        tracker = self.make_tracker(frame_budget=0.004)
+        FakeTracker.init_cost = {'accurate': 0.01}
+        FakeTracker.results['accurate'] = [(False, (0, 0, 0, 0))] * 10
+        for _ in range(5):
+            tracker.predict(self.img)
+        self.assertGreaterEqual(tracker.refine_interval, 3)
+
+    def test_large_budget_refines_every_frame(self):
+        tracker = self.make_tracker(frame_budget=1.0)
+        for _ in range(5):
+            tracker.predict(self.img)
+        self.assertEqual(tracker.refine_interval, 1)
+        self.assertEqual(tracker.refine_cnt, 5)
+
+    def test_budget_below_cheap_cost(self):
+        FakeTracker.cost = {'cheap': 0.005}
+        tracker = self.make_tracker(frame_budget=0.001, max_refine_interval=10)
+        tracker.predict(self.img)
+        self.assertEqual(tracker.refine_interval, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import threading
+import unittest
+from camera_tracker.control import ControlServer, ControlClient, ControlError
+
+
+class ControlTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'control.sock')
+        self.release = threading.Event()
+        handlers = {
+            'add': lambda a, b: a + b,
+            'fail': self.fail_handler,
+            'block': self.release.wait,
+        }
+        self.server = ControlServer(self.path, handlers)
+        self.server.start()
+
+    def tearDown(self):
+        self.release.set()
+        self.server.stop()
+
+    @staticmethod
+    def fail_handler():
+        raise ValueError('bad target')
+
+    def test_request(self):
+        with ControlClient(self.path) as client:
+            self.assertEqual(client.request('add', a=1, b=2), 3)
+            # several requests on one connection
+            self.assertEqual(client.request('add', a=[1], b=[2]), [1, 2])
+
+    def test_errors(self):
+        with ControlClient(self.path) as client:
+            with self.assertRaisesRegex(ControlError, 'unknown command'):
+                client.request('foo')
+            with self.assertRaisesRegex(ControlError, 'bad target'):
+                client.request('fail')
+            with self.assertRaises(ControlError):
+                client.request('add', a=1)
+            # the connection is still usable
+            self.assertEqual(client.request('add', a=1, b=1), 2)
+
+    def test_concurrent_connections(self):
+        blocked = ControlClient(self.path)
+        thread = threading.Thread(target=blocked.request, args=('block',))
+        thread.start()
+
+        # a blocking command does not hold up other clients
+        with ControlClient(self.path, timeout=1) as client:
+            self.assertEqual(client.request('add', a=2, b=2), 4)
+
+        self.release.set()
+        thread.join()
+        blocked.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+from camera_tracker.capture import (
+    FrameCapture,
+    DROP_OLDEST,
+    BLOCK,
+    LATEST_ONLY
+)
+
+
+class FakeCapture:
+    """
+    Produces n_frames frames whose pixels are all equal to the frame number.
+    """
+
+    def __init__(self, n_frames, shape=(4, 6, 3)):
+        self.n_frames = n_frames
+        self.shape = shape
+        self.cnt = 0
+        self.released = False
+
+    def read(self, image=None):
+        if self.cnt >= self.n_frames:
+            return False, None
+        self.cnt += 1
+        if image is None:
+            image = np.empty(self.shape, dtype=np.uint8)
+        image[...] = self.cnt
+        return True, image
+
+    def release(self):
+        self.released = True
+
+
+class FrameCaptureTest(unittest.TestCase):
+    def test_block_keeps_every_frame(self):
+        cap = FrameCapture(FakeCapture(20), buffer_size=3, policy=BLOCK)
+        frames = list(cap)
+
+        self.assertEqual([f.seq for f in frames], list(range(1, 21)))
+        self.assertEqual(cap.get_stat()['dropped_count'], 0)
+        cap.stop()
+
+    def test_frame_matches_seq(self):
+        cap = FrameCapture(FakeCapture(10), buffer_size=3, policy=BLOCK)
+        for frame in cap:
+            self.assertTrue(np.all(frame.image == frame.seq))
+        cap.stop()
+
+    def test_latest_only_returns_freshest(self):
+        fake = FakeCapture(10)
+        cap = FrameCapture(fake, buffer_size=4, policy=LATEST_ONLY)
+        cap.start()
+        cap.thread.join()
+
+        frame = cap.read()
+        self.assertEqual(frame.seq, 10)
+        self.assertTrue(np.all(frame.image == 10))
+        self.assertIsNone(cap.read())
+        self.assertEqual(cap.get_stat()['dropped_count'], 9)
+        cap.stop()
+        self.assertTrue(fake.released)
+
+    def test_drop_oldest_keeps_newest_frames(self):
+        cap = FrameCapture(FakeCapture(10), buffer_size=4, policy=DROP_OLDEST)
+        cap.start()
+        cap.thread.join()
+
+        seqs = [f.seq for f in cap]
+        # the read that hit the end of stream went to the spare buffer
+        self.assertEqual(seqs, [7, 8, 9, 10])
+        self.assertEqual(cap.get_stat()['dropped_count'], 6)
+        cap.stop()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            FrameCapture(FakeCapture(1), policy='newest')
+
+
+if __name__ == '__main__':
+    unittest.main()
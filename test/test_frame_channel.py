@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from camera_tracker.frame_channel import SharedFrameWriter, SharedFrameReader
+
+
+class FrameChannelTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.writer = SharedFrameWriter(self.path, max_shape=(20, 30, 3))
+        self.reader = SharedFrameReader(self.path)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close(unlink=True)
+
+    def test_read_before_write(self):
+        self.assertIsNone(self.reader.read())
+
+    def test_write_read(self):
+        frame = np.random.randint(0, 255, (20, 30, 3), dtype=np.uint8)
+        self.writer.write(frame, frame_no=7, timestamp=1.5)
+
+        shared = self.reader.read()
+        self.assertEqual(shared.frame_no, 7)
+        self.assertEqual(shared.timestamp, 1.5)
+        np.testing.assert_array_equal(shared.image, frame)
+
+        # the frame was already read
+        self.assertIsNone(self.reader.read(last_seq=shared.seq))
+
+    def test_reuse_output_buffer(self):
+        out = np.empty((10, 10), dtype=np.uint8)
+        self.writer.write(np.full((10, 10), 3, dtype=np.uint8))
+        shared = self.reader.read(out=out)
+        self.assertIs(shared.image, out)
+        self.assertTrue((out == 3).all())
+
+        # a new shape reallocates
+        self.writer.write(np.full((5, 8, 3), 4, dtype=np.uint8))
+        shared = self.reader.read(out=out, last_seq=shared.seq)
+        self.assertEqual(shared.image.shape, (5, 8, 3))
+        self.assertTrue((shared.image == 4).all())
+
+    def test_frame_too_big(self):
+        with self.assertRaises(ValueError):
+            self.writer.write(np.zeros((40, 30, 3), dtype=np.uint8))
+
+    def test_read_jpeg(self):
+        self.writer.write(np.zeros((20, 30, 3), dtype=np.uint8))
+        seq, jpeg = self.reader.read_jpeg()
+        self.assertEqual(seq, self.writer.seq)
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
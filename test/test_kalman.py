@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+from camera_tracker.kalman import ConstantVelocityKalman
+
+
+class KalmanTest(unittest.TestCase):
+    def test_uninitialized(self):
+        kalman = ConstantVelocityKalman()
+        self.assertFalse(kalman.initialized)
+        self.assertIsNone(kalman.predict(1.0))
+
+    def test_constant_velocity(self):
+        kalman = ConstantVelocityKalman()
+        # 100 px/s along x, 50 px/s along y, at 20 fps
+        for i in range(40):
+            t = i / 20
+            kalman.update((10 + 100 * t, 20 + 50 * t), t)
+
+        vx, vy = kalman.velocity
+        self.assertAlmostEqual(vx, 100, delta=1)
+        self.assertAlmostEqual(vy, 50, delta=1)
+
+        # half a second past the last measurement
+        x, y = kalman.predict(39 / 20 + 0.5)
+        self.assertAlmostEqual(x, 10 + 100 * (39 / 20 + 0.5), delta=2)
+        self.assertAlmostEqual(y, 20 + 50 * (39 / 20 + 0.5), delta=2)
+
+    def test_irregular_time_steps(self):
+        kalman = ConstantVelocityKalman()
+        rng = np.random.default_rng(0)
+        t = 0.0
+        for _ in range(40):
+            t += rng.uniform(0.02, 0.2)
+            kalman.update((100 * t, 0.0), t)
+        self.assertAlmostEqual(kalman.velocity[0], 100, delta=2)
+
+    def test_smoothing(self):
+        kalman = ConstantVelocityKalman(measurement_noise=25)
+        rng = np.random.default_rng(1)
+        errors = []
+        for i in range(100):
+            measured = (200 + rng.normal(0, 5), 100 + rng.normal(0, 5))
+            kalman.update(measured, i / 20)
+            errors.append(np.hypot(kalman.location[0] - 200, kalman.location[1] - 100))
+        # the filtered location is closer to the truth than a measurement
+        self.assertLess(np.mean(errors[50:]), 5)
+
+    def test_reset(self):
+        kalman = ConstantVelocityKalman()
+        kalman.update((1, 2), 0.0)
+        kalman.reset()
+        self.assertFalse(kalman.initialized)
+        kalman.update((5, 6), 1.0)
+        self.assertEqual(kalman.location, (5, 6))
+        self.assertEqual(kalman.velocity, (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from camera_tracker.builder import load_settings, build_tracking_system
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
+
+
+class LabeledFrameTest(unittest.TestCase):
+    def setUp(self):
+        settings = load_settings(profile, PIPELINED=False)
+        self.tracking_sys = build_tracking_system(settings, video_source=None)
+        self.tracking_sys.running = True
+
+    def run_frames(self, n):
+        self.tracking_sys.video_source = [np.full((720, 1280, 3), 100, dtype=np.uint8)
+                                          for _ in range(n)]
+        self.tracking_sys.run_sys()
+
+    def test_no_snapshot_while_unwatched(self):
+        self.run_frames(3)
+        self.assertEqual(self.tracking_sys.labeled_frame_seq, 0)
+        self.assertIsNone(self.tracking_sys.get_labeled_video_frame())
+
+        # a read marks the labeled frame as watched
+        self.run_frames(2)
+        self.assertEqual(self.tracking_sys.labeled_frame_seq, 2)
+        frame = self.tracking_sys.get_labeled_video_frame()
+        self.assertEqual(frame.shape, (360, 640, 3))
+        seq, copy = self.tracking_sys.copy_labeled_video_frame(out=frame)
+        self.assertEqual(seq, 2)
+        self.assertIs(copy, frame)
+
+    def test_render_once_per_frame(self):
+        self.tracking_sys.get_labeled_video_frame()
+        self.run_frames(1)
+
+        first = self.tracking_sys.get_labeled_video_frame()
+        second = self.tracking_sys.get_labeled_video_frame()
+        np.testing.assert_array_equal(first, second)
+        # the overlay was drawn
+        self.assertFalse((first == 100).all())
+
+        overlay = self.tracking_sys.metrics.snapshot()['stages']['overlay']
+        self.assertEqual(overlay['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from camera_tracker.metrics import Histogram, Metrics
+
+
+class HistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        hist = Histogram()
+        for i in range(1, 1001):
+            hist.observe(i / 1e4)
+
+        snapshot = hist.snapshot()
+        self.assertEqual(snapshot['count'], 1000)
+        self.assertAlmostEqual(snapshot['mean'], 0.05005)
+        # bucket bounds are sqrt(2) apart
+        self.assertAlmostEqual(snapshot['p50'], 0.05, delta=0.05 * 0.42)
+        self.assertAlmostEqual(snapshot['p99'], 0.099, delta=0.099 * 0.42)
+        self.assertLessEqual(snapshot['p99'], snapshot['max'])
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(50), 0.0)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_stage_timer_and_counters(self):
+        metrics = Metrics()
+        with metrics.time('detect'):
+            pass
+        metrics.incr('frames')
+        metrics.incr('frames')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['stages']['detect']['count'], 1)
+        self.assertEqual(snapshot['counters']['frames'], 2)
+
+        text = metrics.to_prometheus()
+        self.assertIn('camera_tracker_stage_seconds_count{stage="detect"} 1', text)
+        self.assertIn('camera_tracker_frames_total 2', text)
+
+    def test_disabled(self):
+        metrics = Metrics(enabled=False)
+        with metrics.time('detect'):
+            pass
+        metrics.incr('frames')
+        self.assertEqual(metrics.snapshot()['stages'], {})
+        self.assertEqual(metrics.snapshot()['counters'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
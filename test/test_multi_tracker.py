@@ -0,0 +1,164 @@
+import unittest
+import numpy as np
+from camera_tracker.multi_tracker import MultiTargetTracker
+from camera_tracker.utils import bbox_intersection_over_union, bbox_iou_matrix
+
+
+class FakeTracker:
+    """
+    Follows the box it was initialized with at a constant velocity.
+    """
+
+    def __init__(self, velocity=(0, 0)):
+        self.velocity = velocity
+        self.bbox = None
+        self.fail = False
+        self.inits = 0
+        self.predictions = 0
+
+    def init_tracker(self, img, bbox):
+        self.bbox = tuple(bbox)
+        self.inits += 1
+
+    def predict(self, img):
+        self.predictions += 1
+        if self.fail:
+            return False, None
+        x, y, w, h = self.bbox
+        self.bbox = (x + self.velocity[0], y + self.velocity[1], w, h)
+        return True, self.bbox
+
+
+class IouMatrixTest(unittest.TestCase):
+    def test_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        boxes_a = rng.integers(0, 50, (5, 4)) + [0, 0, 1, 1]
+        boxes_b = rng.integers(0, 50, (7, 4)) + [0, 0, 1, 1]
+        iou = bbox_iou_matrix(boxes_a, boxes_b)
+        self.assertEqual(iou.shape, (5, 7))
+        for i, a in enumerate(boxes_a):
+            for j, b in enumerate(boxes_b):
+                self.assertAlmostEqual(iou[i, j], bbox_intersection_over_union(a, b))
+
+    def test_empty(self):
+        self.assertEqual(bbox_iou_matrix([], [(0, 0, 5, 5)]).shape, (0, 1))
+
+
+class MultiTargetTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.trackers = []
+        self.img = np.zeros((100, 100), np.uint8)
+
+    def make_tracker(self):
+        tracker = FakeTracker()
+        self.trackers.append(tracker)
+        return tracker
+
+    def step(self, mtt, detections):
+        mtt.predict(self.img)
+        return mtt.associate(np.array(detections).reshape(-1, 4))
+
+    def test_persistent_ids(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        tracks = self.step(mtt, [(10, 10, 20, 20), (60, 60, 20, 20)])
+        ids = {t.bbox: t.id for t in tracks}
+        self.assertEqual(len(ids), 2)
+
+        for _ in range(5):
+            tracks = self.step(mtt, [(60, 60, 20, 20), (11, 10, 20, 20)])
+        self.assertEqual({t.id for t in tracks}, set(ids.values()))
+        self.assertTrue(all(t.matched for t in tracks))
+        self.assertTrue(all(t.hits == 6 for t in tracks))
+
+    def test_lost_track_is_dropped(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=2)
+        self.step(mtt, [(10, 10, 20, 20), (60, 60, 20, 20)])
+        mtt.select(mtt.tracks[1].id)
+        for _ in range(2):
+            tracks = self.step(mtt, [(10, 10, 20, 20)])
+        self.assertEqual([t.bbox for t in tracks], [(10, 10, 20, 20)])
+        self.assertIsNone(mtt.selected)
+
+    def test_select(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        tracks = self.step(mtt, [(10, 10, 20, 20), (60, 60, 20, 20)])
+        self.assertTrue(mtt.select(tracks[1].id))
+        self.assertIs(mtt.selected, tracks[1])
+        self.assertFalse(mtt.select(1000))
+        self.assertIs(mtt.selected, tracks[1])
+
+    def test_active_tracker_budget(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=10,
+                                 max_active_trackers=2)
+        detections = [(10 * i, 0, 5, 5) for i in range(5)]
+        self.step(mtt, detections)
+        mtt.select(mtt.tracks[4].id)
+
+        for _ in range(10):
+            self.step(mtt, detections)
+            # the selected target is updated on every frame
+            self.assertEqual(mtt.tracks[4].last_update, mtt._frame_cnt)
+
+        # every frame updates at most 2 trackers
+        updates = sum(t.inits + t.predictions for t in self.trackers)
+        self.assertLessEqual(updates, 2 * 10)
+        # and all of them got a turn, waiting trackers are predicted
+        # from their state rather than re-initialized
+        self.assertTrue(all(t.inits == 1 for t in self.trackers))
+        self.assertTrue(all(t.predictions > 0 for t in self.trackers))
+
+    def test_failed_tracker_reanchored(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        track_id = self.step(mtt, [(10, 10, 20, 20)])[0].id
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.trackers[0].fail = True
+
+        # the track survives the failure and keeps its ID
+        tracks = self.step(mtt, [(12, 10, 20, 20)])
+        self.assertEqual([t.id for t in tracks], [track_id])
+        self.assertTrue(tracks[0].lost)
+        self.assertEqual(tracks[0].bbox, (12, 10, 20, 20))
+
+        # and the tracker restarts from the detection
+        self.trackers[0].fail = False
+        tracks = self.step(mtt, [(12, 10, 20, 20)])
+        self.assertFalse(tracks[0].lost)
+        self.assertEqual(self.trackers[0].inits, 2)
+        self.assertEqual(self.trackers[0].bbox, (12, 10, 20, 20))
+
+    def test_recovered_tracker_not_reanchored(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.trackers[0].fail = True
+        self.assertTrue(self.step(mtt, [])[0].lost)
+        self.trackers[0].fail = False
+        tracks = self.step(mtt, [])
+        self.assertFalse(tracks[0].lost)
+
+        # a matching detection doesn't restart the recovered tracker
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.assertEqual(self.trackers[0].inits, 1)
+
+    def test_failed_tracker_dropped_without_detections(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        self.step(mtt, [(10, 10, 20, 20)])
+        self.trackers[0].fail = True
+        for n_tracks in (1, 1, 0):
+            self.assertEqual(len(self.step(mtt, [])), n_tracks)
+
+    def test_max_tracks(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3, max_tracks=3)
+        tracks = self.step(mtt, [(10 * i, 0, 5, 5) for i in range(5)])
+        self.assertEqual(len(tracks), 3)
+
+    def test_add(self):
+        mtt = MultiTargetTracker(self.make_tracker, tracker_health=3)
+        track = mtt.add(self.img, (10, 10, 20, 20))
+        self.assertFalse(track.stale)
+        self.assertEqual(self.trackers[0].inits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,13 @@
 import unittest
 import cv2
-from camera_tracker.predictors import PixelDifferenceDetector
+import numpy as np
+from camera_tracker.predictors import (
+    PixelDifferenceDetector,
+    BackgroundSubtractionDetector,
+    CameraMovingDetector,
+    GlobalMotionEstimator,
+    merge_adjacent_bboxes
+)
 
 img1 = cv2.imread('tracking_img1.png')
 img2 = cv2.imread('tracking_img2.png')
@@ -29,5 +36,321 @@ class DetectorTest(unittest.TestCase):
         print(ret[1])
 
 
+def make_frames(size=(120, 160)):
+    background = np.zeros(size, dtype=np.uint8)
+    moved = background.copy()
+    moved[40:70, 50:90] = 200
+    return background, moved
+
+
+class CameraMovingDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = PixelDifferenceDetector(pixel_difference_threshold=10,
+                                                structuring_kernel_shape=(3, 3),
+                                                bbox_area_min=100,
+                                                bbox_area_max=5000)
+        self.moving_detector = CameraMovingDetector(self.detector, 120 * 160 / 2)
+
+    def test_shared_detection(self):
+        background, moved = make_frames()
+        self.assertFalse(self.moving_detector.predict(background))
+        self.assertFalse(self.moving_detector.predict(moved))
+
+        ok, bbox = self.moving_detector.last_detection
+        self.assertTrue(ok)
+        self.assertLessEqual(bbox[0], 50)
+        self.assertGreaterEqual(bbox[0] + bbox[2], 90)
+        self.assertEqual(self.detector.changed_pixels, cv2.countNonZero(self.detector.img_delta))
+
+    def test_camera_moving(self):
+        background, _ = make_frames()
+        self.moving_detector.predict(background)
+
+        self.assertTrue(self.moving_detector.predict(background + 100))
+        self.assertGreater(self.detector.changed_ratio, 0.5)
+        self.assertEqual(self.moving_detector.last_detection, (False, None))
+
+    def test_target_filling_roi(self):
+        background, moved = make_frames()
+        self.moving_detector.predict(background)
+        self.detector.set_roi((45, 35, 50, 40))
+
+        # most of the region of interest changed, a tenth of the frame
+        self.assertFalse(self.moving_detector.predict(moved))
+        self.assertGreater(self.detector.changed_ratio, 0.5)
+        self.assertTrue(self.moving_detector.last_detection[0])
+
+
+class RoiDetectionTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = PixelDifferenceDetector(pixel_difference_threshold=10,
+                                                structuring_kernel_shape=(3, 3),
+                                                bbox_area_min=100,
+                                                bbox_area_max=5000)
+
+    def test_box_in_frame_coordinates(self):
+        background, moved = make_frames()
+        full = PixelDifferenceDetector(10, (3, 3), 100, 5000)
+        full.predict(background)
+        self.detector.predict(background)
+
+        self.detector.set_roi((30, 20, 80, 70))
+        self.assertEqual(self.detector.predict(moved), full.predict(moved))
+        self.assertEqual(self.detector.img_delta.shape, (70, 80))
+
+    def test_movement_outside_roi(self):
+        background, moved = make_frames()
+        self.detector.predict(background)
+
+        self.detector.set_roi((100, 80, 60, 40))
+        self.assertEqual(self.detector.predict(moved), (False, None))
+
+
+class DownscaledDetectionTest(unittest.TestCase):
+    def test_box_in_tracker_coordinates(self):
+        background, moved = make_frames()
+        detector = PixelDifferenceDetector(pixel_difference_threshold=10,
+                                           structuring_kernel_shape=(3, 3),
+                                           bbox_area_min=100,
+                                           bbox_area_max=5000,
+                                           downscale=2)
+        detector.predict(cv2.pyrDown(background))
+        ok, bbox = detector.predict(cv2.pyrDown(moved))
+
+        self.assertTrue(ok)
+        self.assertLessEqual(bbox[0], 50)
+        self.assertGreaterEqual(bbox[0] + bbox[2], 90)
+        self.assertLessEqual(bbox[1], 40)
+        self.assertGreaterEqual(bbox[1] + bbox[3], 70)
+
+    def test_roi_in_tracker_coordinates(self):
+        detector = PixelDifferenceDetector(10, (3, 3), 100, 5000, downscale=4)
+        detector.set_roi((10, 10, 21, 20))
+        self.assertEqual(detector.roi, (2, 2, 6, 6))
+
+
+def make_panned_frames(shift=(5, 3)):
+    # the camera pans over a textured scene, content moves by shift
+    rng = np.random.default_rng(0)
+    scene = cv2.GaussianBlur((rng.random((240, 360)) * 255).astype(np.uint8), (7, 7), 0)
+    dx, dy = shift
+    before = scene[20:140, 20:180].copy()
+    after = scene[20 - dy:140 - dy, 20 - dx:180 - dx].copy()
+    return before, after
+
+
+class MotionCompensationTest(unittest.TestCase):
+    def test_estimate_shift(self):
+        before, after = make_panned_frames((5, 3))
+        estimator = GlobalMotionEstimator()
+        dx, dy = estimator.estimate(before, after)
+        self.assertAlmostEqual(dx, 5, delta=0.2)
+        self.assertAlmostEqual(dy, 3, delta=0.2)
+
+        # no camera motion
+        self.assertIsNone(estimator.estimate(after, after))
+
+    def test_camera_pan_not_detected(self):
+        before, after = make_panned_frames()
+        for estimator, changed in ((None, True), (GlobalMotionEstimator(), False)):
+            detector = PixelDifferenceDetector(pixel_difference_threshold=25,
+                                               structuring_kernel_shape=(5, 5),
+                                               bbox_area_min=10,
+                                               bbox_area_max=1e9,
+                                               motion_estimator=estimator)
+            detector.predict(before)
+            detected, _ = detector.predict(after)
+            self.assertEqual(detected, changed)
+
+    def test_still_camera_not_compensated(self):
+        # the object covers most of the region of interest
+        background, moved = make_frames()
+        detector = PixelDifferenceDetector(pixel_difference_threshold=25,
+                                           structuring_kernel_shape=(5, 5),
+                                           bbox_area_min=10,
+                                           bbox_area_max=1e9,
+                                           motion_estimator=GlobalMotionEstimator())
+        detector.set_roi((45, 35, 50, 40))
+        detector.predict(background)
+        detected, _ = detector.predict(moved)
+        self.assertTrue(detected)
+        self.assertIsNone(detector.global_motion)
+
+    def test_object_detected_while_panning(self):
+        before, after = make_panned_frames()
+        after[50:80, 60:100] = 255
+        detector = PixelDifferenceDetector(pixel_difference_threshold=25,
+                                           structuring_kernel_shape=(5, 5),
+                                           bbox_area_min=10,
+                                           bbox_area_max=1e9,
+                                           motion_estimator=GlobalMotionEstimator())
+        detector.set_roi((40, 30, 100, 80))
+        detector.camera_motion_expected = True
+        detector.predict(before)
+        detected, bbox = detector.predict(after)
+        self.assertTrue(detected)
+        self.assertIsNotNone(detector.global_motion)
+        x, y, w, h = bbox
+        self.assertTrue(55 <= x <= 60 and 45 <= y <= 50 and 40 <= w <= 50)
+
+
+class MultiObjectDetectionTest(unittest.TestCase):
+    def make_detector(self, **kwargs):
+        return PixelDifferenceDetector(pixel_difference_threshold=25,
+                                       structuring_kernel_shape=(3, 3),
+                                       bbox_area_min=30,
+                                       bbox_area_max=5000,
+                                       **kwargs)
+
+    def make_movers(self):
+        background = np.zeros((120, 160), dtype=np.uint8)
+        moved = background.copy()
+        moved[10:20, 10:20] = 200
+        moved[50:80, 60:100] = 200
+        moved[100:104, 10:60] = 200
+        moved[5:6, 150:151] = 200
+        return background, moved
+
+    def test_predict_all(self):
+        detector = self.make_detector()
+        background, moved = self.make_movers()
+        detector.predict(background)
+        boxes = detector.predict_all(moved)
+
+        self.assertEqual(boxes.shape, (3, 4))
+        # biggest first
+        areas = boxes[:, 2] * boxes[:, 3]
+        self.assertTrue((np.diff(areas) <= 0).all())
+        self.assertTrue(boxes[0][0] <= 60 and boxes[0][0] + boxes[0][2] >= 100)
+
+    def test_predict_returns_biggest(self):
+        detector = self.make_detector()
+        background, moved = self.make_movers()
+        detector.predict(background)
+        detected, bbox = detector.predict(moved)
+        self.assertTrue(detected)
+        self.assertIsInstance(bbox[0], int)
+        self.assertTrue(bbox[0] <= 60 and bbox[0] + bbox[2] >= 100)
+
+    def test_aspect_ratio(self):
+        detector = self.make_detector(max_aspect_ratio=3)
+        background, moved = self.make_movers()
+        detector.predict(background)
+        # the thin strip is dropped
+        self.assertEqual(len(detector.predict_all(moved)), 2)
+
+    def test_merge_adjacent(self):
+        boxes = np.array([[0, 0, 10, 10], [12, 0, 10, 10], [24, 0, 10, 10], [100, 100, 5, 5]])
+        merged = merge_adjacent_bboxes(boxes, 3)
+        self.assertEqual(sorted(map(tuple, merged.tolist())), [(0, 0, 34, 10), (100, 100, 5, 5)])
+        self.assertEqual(len(merge_adjacent_bboxes(boxes, 1)), 4)
+
+    def test_merged_fragments_kept(self):
+        # fragments each too small to be kept on their own
+        background = np.zeros((60, 80), dtype=np.uint8)
+        moved = background.copy()
+        for x in (10, 20, 30):
+            moved[20:23, x:x + 3] = 200
+        for merge_distance, n_boxes in ((None, 0), (5, 1)):
+            detector = PixelDifferenceDetector(pixel_difference_threshold=25,
+                                               structuring_kernel_shape=(3, 3),
+                                               bbox_area_min=100,
+                                               bbox_area_max=5000,
+                                               merge_distance=merge_distance)
+            detector.predict(background)
+            self.assertEqual(len(detector.predict_all(moved)), n_boxes)
+
+
+def make_slow_mover(n_frames=120, speed=0.5, flicker=False, seed=0):
+    """
+    A bright square moving speed pixels per frame over a noisy background,
+    optionally next to a patch flickering between two values.
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(n_frames):
+        frame = rng.normal(80, 3, (120, 200)).astype(np.float32)
+        if flicker and rng.random() < 0.5:
+            frame[10:40, 150:190] += 25
+        x = int(20 + speed * i)
+        frame[60:90, x:x + 20] = 200
+        yield cv2.GaussianBlur(np.clip(frame, 0, 255).astype(np.uint8), (11, 11), 0), x
+
+
+class BackgroundSubtractionTest(unittest.TestCase):
+    def make_pixel_diff_detector(self):
+        return PixelDifferenceDetector(pixel_difference_threshold=10,
+                                       structuring_kernel_shape=(3, 3),
+                                       bbox_area_min=40,
+                                       bbox_area_max=20000)
+
+    def make_detector(self, **kwargs):
+        kwargs.setdefault('bbox_area_min', 40)
+        return BackgroundSubtractionDetector(pixel_difference_threshold=10,
+                                             structuring_kernel_shape=(3, 3),
+                                             bbox_area_max=20000,
+                                             reuse_buffers=True,
+                                             **kwargs)
+
+    def count_hits(self, detector, frames):
+        hits = 0
+        for frame, x in frames:
+            detected, bbox = detector.predict(frame)
+            # the box covers the centre of the square
+            hits += detected and bbox[0] <= x + 10 <= bbox[0] + bbox[2]
+        return hits
+
+    def test_slow_object(self):
+        pixel_diff = self.make_pixel_diff_detector()
+        # barely changes between two frames
+        self.assertLess(self.count_hits(pixel_diff, make_slow_mover()), 10)
+        for model in BackgroundSubtractionDetector.DEFAULT_LEARNING_RATES:
+            hits = self.count_hits(self.make_detector(model=model), make_slow_mover())
+            self.assertGreater(hits, 60, model)
+
+    def test_flicker(self):
+        pixel_diff = self.make_pixel_diff_detector()
+        detector = self.make_detector(model='mog2')
+        false_boxes = {pixel_diff: 0, detector: 0}
+        for frame, x in make_slow_mover(flicker=True):
+            for d in false_boxes:
+                false_boxes[d] += sum(bbox[0] > x + 40 for bbox in d.predict_all(frame))
+        self.assertLess(false_boxes[detector], false_boxes[pixel_diff] / 2)
+
+    def test_background_buffers(self):
+        detector = self.make_detector(model='running_average')
+        frames = make_slow_mover(n_frames=3)
+        detector.predict(next(frames)[0])
+        acc = detector._acc
+        for frame, _ in frames:
+            detector.predict(frame)
+        # updated in place
+        self.assertIs(detector._acc, acc)
+        self.assertEqual(detector.background.dtype, np.uint8)
+
+        detector.reset()
+        self.assertIsNone(detector._acc)
+
+    def test_camera_moving_one_frame(self):
+        # the camera pans once, between frames 10 and 11
+        rng = np.random.default_rng(0)
+        scene = cv2.GaussianBlur(rng.integers(0, 255, (120, 240), dtype=np.uint8), (5, 5), 0)
+        frames = [scene[:, :200]] * 10 + [scene[:, 40:]] * 10
+        for detector in (self.make_pixel_diff_detector(),
+                         self.make_detector(model='running_average'),
+                         self.make_detector(model='mog2')):
+            moving_detector = CameraMovingDetector(detector, 120 * 200 / 4)
+            moving = [moving_detector.predict(frame) for frame in frames]
+            self.assertEqual(moving, [False] * 10 + [True] + [False] * 9, detector)
+
+    def test_learning_rate(self):
+        self.assertEqual(self.make_detector(learning_rate=0).learning_rate, 0)
+        self.assertEqual(self.make_detector(model='mog2').learning_rate,
+                         BackgroundSubtractionDetector.DEFAULT_LEARNING_RATES['mog2'])
+
+    def test_unknown_model(self):
+        with self.assertRaises(ValueError):
+            self.make_detector(model='foo')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
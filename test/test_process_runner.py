@@ -0,0 +1,76 @@
+import os
+import time
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from camera_tracker.builder import load_settings
+from camera_tracker.frame_channel import SharedFrameWriter
+from camera_tracker.process_runner import SharedFrameSource, TrackingSystemProxy
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
+
+
+class SharedFrameSourceTest(unittest.TestCase):
+    def test_read_frames(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'frames')
+            writer = SharedFrameWriter(path, (4, 4, 3))
+            source = iter(SharedFrameSource(path))
+
+            writer.write(np.full((4, 4, 3), 1, np.uint8), 7, 1.5)
+            frame = next(source)
+            self.assertEqual((frame.seq, frame.timestamp), (7, 1.5))
+            self.assertTrue((frame.image == 1).all())
+
+            # the held frame is not overwritten by the next one
+            writer.write(np.full((4, 4, 3), 2, np.uint8), 8, 2.0)
+            self.assertEqual(next(source).seq, 8)
+            self.assertTrue((frame.image == 1).all())
+            source.close()
+            writer.close()
+
+
+class TrackingSystemProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+        def frames():
+            for i in range(100):
+                time.sleep(0.01)
+                yield np.full((360, 640, 3), 50, dtype=np.uint8)
+
+        self.proxy = TrackingSystemProxy(load_settings(profile), frames(),
+                                         input_path=os.path.join(self.tmp.name, 'input'),
+                                         output_path=os.path.join(self.tmp.name, 'frames'),
+                                         max_shape=(360, 640, 3))
+        self.proxy.start()
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.tmp.cleanup()
+
+    def test_commands(self):
+        self.assertTrue(self.proxy.pause())
+        self.assertTrue(self.proxy.get_status()['paused'])
+        self.assertTrue(self.proxy.resume())
+        with self.assertRaises(ValueError):
+            self.proxy.select_track(1)
+        with self.proxy.camera_motion():
+            pass
+        self.assertIsNone(self.proxy.get_location())
+        self.assertIsNone(self.proxy.get_predicted_location(0.1))
+
+    def test_labeled_frames(self):
+        seq = self.proxy.wait_labeled_video_frame(0, timeout=10)
+        self.assertNotEqual(seq, 0)
+        frame = self.proxy.get_labeled_video_frame()
+        self.assertEqual(frame.shape, (360, 640, 3))
+
+        metrics = self.proxy.get_metrics()
+        self.assertGreater(metrics['frame_seq'], 0)
+        self.assertGreater(metrics['counters']['fed_frames'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
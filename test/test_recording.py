@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from camera_tracker.builder import build_tracking_system, load_settings
+from camera_tracker.recording import Recording, ReplaySource, SessionRecorder
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
+
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'session.rec')
+        rng = np.random.default_rng(0)
+        self.frames = [rng.integers(0, 255, (20, 30, 3), dtype=np.uint8) for _ in range(3)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self, compression=None):
+        recorder = SessionRecorder(self.path, compression=compression)
+        for i, frame in enumerate(self.frames):
+            recorder.write_frame(frame, i + 1, 10.0 + i / 10)
+        recorder.write_event('command', {'name': 'set_target', 'arg': (1, 2, 3, 4)}, 2, 10.1)
+        recorder.write_event('result', {'detect_bbox': np.array([1, 2, 3, 4])}, 2, 10.1)
+        recorder.close()
+
+    def check_frames(self, recording):
+        self.assertEqual(len(recording), 3)
+        for i, frame in enumerate(self.frames):
+            seq, timestamp, image = recording.frame(i)
+            self.assertEqual((seq, timestamp), (i + 1, 10.0 + i / 10))
+            np.testing.assert_array_equal(image, frame)
+
+    def test_raw(self):
+        self.record()
+        recording = Recording(self.path)
+        self.check_frames(recording)
+        self.assertEqual(recording.events_by_seq('command')[2][0].data,
+                         {'name': 'set_target', 'arg': [1, 2, 3, 4]})
+        self.assertEqual(recording.results(), {2: {'detect_bbox': [1, 2, 3, 4]}})
+
+    def test_png(self):
+        self.record(compression='png')
+        self.check_frames(Recording(self.path))
+
+    def test_cut_short(self):
+        self.record()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+        recording = Recording(self.path)
+        self.assertEqual(len(recording), 3)
+        self.assertEqual(len(recording.events), 1)
+
+    def test_not_a_recording(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(RuntimeError):
+            Recording(self.path)
+
+
+class ReplayTest(unittest.TestCase):
+    def test_replay_session(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            def frames():
+                for i in range(10):
+                    if i == 3:
+                        tracking_sys.pause(timeout=0)
+                    if i == 6:
+                        tracking_sys.resume(timeout=0)
+                    yield np.full((360, 640, 3), 50, dtype=np.uint8)
+
+            settings = load_settings(profile, RECORD_PATH=os.path.join(tmp, 'a.rec'))
+            tracking_sys = build_tracking_system(settings, frames())
+            tracking_sys.running = True
+            tracking_sys.run_sys()
+            tracking_sys.recorder.close()
+
+            settings.RECORD_PATH = os.path.join(tmp, 'b.rec')
+            source = ReplaySource(os.path.join(tmp, 'a.rec'), realtime=False)
+            replay_sys = build_tracking_system(settings, source)
+            source.attach(replay_sys)
+            replay_sys.running = True
+            replay_sys.run_sys()
+            replay_sys.recorder.close()
+
+            recorded = Recording(os.path.join(tmp, 'a.rec')).results()
+            replayed = Recording(os.path.join(tmp, 'b.rec')).results()
+            self.assertEqual(len(recorded), 10)
+            self.assertEqual(recorded[5]['state'], 'paused')
+            self.assertEqual(recorded, replayed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from camera_tracker.scheduler import FrameScheduler
+
+
+def run(scheduler, n_frames, detect_cost, track_cost, healthy=True):
+    """
+    Feed n_frames frames of the given costs, returns how many detected.
+    """
+    detections = 0
+    for _ in range(n_frames):
+        plan = scheduler.plan(healthy)
+        detections += plan.detect
+        scheduler.record(plan, detect_cost if plan.detect else track_cost, plan.detect)
+    return detections
+
+
+class FrameSchedulerTest(unittest.TestCase):
+    def test_within_budget(self):
+        scheduler = FrameScheduler(frame_budget=0.05)
+        self.assertEqual(run(scheduler, 50, 0.02, 0.01), 50)
+        self.assertEqual(scheduler.detection_interval, 1)
+        self.assertEqual(scheduler.overlay_interval, 1)
+
+    def test_adapts_detection_interval(self):
+        scheduler = FrameScheduler(frame_budget=0.05)
+        run(scheduler, 100, 0.10, 0.02)
+        # 0.02 + 0.08 / 3 fits in 0.05, 0.02 + 0.08 / 2 does not
+        self.assertEqual(scheduler.detection_interval, 3)
+        self.assertEqual(scheduler.overlay_interval, 1)
+        self.assertEqual(run(scheduler, 30, 0.10, 0.02), 10)
+
+    def test_unhealthy_tracking_detects_every_frame(self):
+        scheduler = FrameScheduler(frame_budget=0.05)
+        run(scheduler, 100, 0.10, 0.02)
+        self.assertEqual(run(scheduler, 10, 0.10, 0.02, healthy=False), 10)
+
+    def test_over_budget(self):
+        scheduler = FrameScheduler(frame_budget=0.05, max_detection_interval=4,
+                                   max_overlay_interval=2)
+        run(scheduler, 100, 0.2, 0.08)
+        self.assertEqual(scheduler.detection_interval, 4)
+        self.assertEqual(scheduler.overlay_interval, 2)
+        stat = scheduler.get_stat()
+        self.assertGreater(stat['skipped_detections'], 0)
+        self.assertGreater(stat['skipped_overlays'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
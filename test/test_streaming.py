@@ -0,0 +1,98 @@
+import threading
+import unittest
+import numpy as np
+from camera_tracker.metrics import Metrics
+from camera_tracker.streaming import JpegPublisher
+
+
+class FakeTrackingSystem:
+    """
+    Publishes labeled frames like TrackingSystem does.
+    """
+
+    def __init__(self):
+        self.metrics = Metrics()
+        self.labeled_frame_seq = 0
+        self.frame = None
+        self.labeled_frame_cv = threading.Condition()
+
+    def publish(self, frame):
+        with self.labeled_frame_cv:
+            self.frame = frame
+            self.labeled_frame_seq += 1
+            self.labeled_frame_cv.notify_all()
+
+    def wait_labeled_video_frame(self, last_seq, timeout=None):
+        with self.labeled_frame_cv:
+            self.labeled_frame_cv.wait_for(
+                lambda: self.labeled_frame_seq != last_seq, timeout)
+            return self.labeled_frame_seq
+
+    def copy_labeled_video_frame(self, out=None):
+        with self.labeled_frame_cv:
+            if out is None:
+                out = np.empty_like(self.frame)
+            np.copyto(out, self.frame)
+            return self.labeled_frame_seq, out
+
+
+class JpegPublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.tracking_sys = FakeTrackingSystem()
+        self.sent = []
+        self.publisher = JpegPublisher(self.tracking_sys, self.sent.append,
+                                       max_fps=0, jpeg_quality=50)
+
+    def test_encode_once_per_frame(self):
+        self.assertFalse(self.publisher.publish(timeout=0.01))
+
+        self.tracking_sys.publish(np.zeros((20, 30, 3), dtype=np.uint8))
+        self.assertTrue(self.publisher.publish(timeout=0.01))
+        # same frame, nothing to encode
+        self.assertFalse(self.publisher.publish(timeout=0.01))
+
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0][:2].tobytes(), b'\xff\xd8')
+        self.assertEqual(
+            self.tracking_sys.metrics.snapshot()['stages']['encode']['count'], 1)
+
+    def test_frame_published_before_copy(self):
+        self.tracking_sys.publish(np.zeros((20, 30, 3), dtype=np.uint8))
+        wait = self.tracking_sys.wait_labeled_video_frame
+
+        def wait_then_publish(last_seq, timeout=None):
+            seq = wait(last_seq, timeout)
+            # the loop publishes between the wait and the copy
+            self.tracking_sys.publish(np.ones((20, 30, 3), dtype=np.uint8))
+            return seq
+
+        self.tracking_sys.wait_labeled_video_frame = wait_then_publish
+        self.assertTrue(self.publisher.publish(timeout=0.01))
+        self.tracking_sys.wait_labeled_video_frame = wait
+        # the copied frame was the newer one, it is not encoded again
+        self.assertFalse(self.publisher.publish(timeout=0.01))
+        self.assertEqual(len(self.sent), 1)
+
+    def test_reuse_frame_buffer(self):
+        self.tracking_sys.publish(np.zeros((20, 30, 3), dtype=np.uint8))
+        self.publisher.publish()
+        buf = self.publisher._frame
+
+        self.tracking_sys.publish(np.ones((20, 30, 3), dtype=np.uint8))
+        self.publisher.publish()
+        self.assertIs(self.publisher._frame, buf)
+
+    def test_max_fps(self):
+        self.publisher.max_fps = 5
+        self.publisher.start()
+        for _ in range(20):
+            self.tracking_sys.publish(np.zeros((20, 30, 3), dtype=np.uint8))
+            threading.Event().wait(0.01)
+        self.publisher.stop()
+
+        # 20 frames in ~0.2s, at most one per 0.2s
+        self.assertLessEqual(self.publisher.published_cnt, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from camera_tracker.builder import load_settings
+from camera_tracker.streams import StreamManager
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
+
+
+def still_frames(n, value):
+    return [np.full((360, 640, 3), value, dtype=np.uint8) for _ in range(n)]
+
+
+class StreamManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = load_settings(profile)
+        self.manager = StreamManager(self.settings, {
+            'left': still_frames(5, 50),
+            'right': still_frames(8, 100)
+        }, max_workers=2)
+
+    def tearDown(self):
+        self.manager.stop()
+
+    def test_independent_streams(self):
+        self.manager.start()
+        for name in self.manager:
+            self.manager[name].thread.join(5)
+
+        status = self.manager.get_status()
+        self.assertEqual(status['left']['frame_seq'], 5)
+        self.assertEqual(status['right']['frame_seq'], 8)
+        self.assertIsNot(self.manager['left'].detector, self.manager['right'].detector)
+        self.assertIsNot(self.manager['left'].tracker, self.manager['right'].tracker)
+        self.assertEqual(self.manager.get_locations(), {'left': None, 'right': None})
+
+    def test_shared_executor(self):
+        executors = {id(self.manager[name]._executor) for name in self.manager}
+        self.assertEqual(executors, {id(self.manager.executor)})
+        self.assertEqual(self.manager['left'].thread, None)
+        self.assertEqual(self.manager.executor._max_workers, 2)
+
+    def test_labeled_frames(self):
+        self.manager.start()
+        for name in self.manager:
+            self.manager[name].thread.join(5)
+        # nobody watched, so no labeled frame was published
+        self.assertIsNone(self.manager.get_labeled_video_frame('left'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,55 +1,39 @@
 import unittest
-import time
-import camera_tracker.pipeline_components as pc
-import camera_tracker.predictors as predictors
-import camera_tracker.utils as utils
-from camera_tracker.tracking_system import TrackingSystem
-from app import settings
-
-def setup_tracking_system():
-    pre_tracker_pipe = [
-        pc.ResizeTransformer(out_size=settings.IMG_SIZE)
-    ]
-
-    pre_detector_pipe = [
-        pc.ResizeTransformer(out_size=settings.IMG_SIZE),
-        pc.GrayscaleTransformer(),
-        pc.BlurTransformer()
-    ]
-
-    detector = predictors.PixelDifferenceDetector(pixel_difference_threshold=settings.PIXEL_DIFFERENCE_TH,
-                                                  structuring_kernel_shape=settings.STRUCTURING_KERNEL_SHAPE,
-                                                  bbox_area_min=settings.BBOX_AREA_MIN_TH,
-                                                  bbox_area_max=settings.BBOX_AREA_MAX_TH)
-    tracker = predictors.CvTracker(tracker_name=settings.TRACKER_NAME,
-                                   tracker_health=settings.MAX_TRACKER_HEALTH)
-
-    tracking_sys = TrackingSystem(tracker=tracker,
-                                  detector=detector,
-                                  pre_tracker_pipe=pre_tracker_pipe,
-                                  pre_detector_pipe=pre_detector_pipe,
-                                  video_source=utils.get_frame_generator(mock=True),
-                                  iou_threshold=settings.IOU_THRESHOLD,
-                                  display=True)
-    return tracking_sys
+from pathlib import Path
+from camera_tracker.benchmark import SyntheticVideo, run_benchmark
+from camera_tracker.builder import load_settings
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
 
 
 class TrackingSystemPerformanceTest(unittest.TestCase):
     def setUp(self):
-        self.sys = setup_tracking_system()
-        self.sys.start()
-    
-    def tearDown(self):
-        self.sys.stop()
-
-    def test_tracking_system_fps(self):
-        time.sleep(10)
-        stats = self.sys.tracker.get_stat()
-        fail_ratio =  stats['failed_count'] / stats['frame_count']
-        print('frame count', stats['frame_count'])
-        print('failed count', stats['failed_count'])
-        print('fail_ratio', fail_ratio)
-        print('fps', stats['fps'])
+        self.settings = load_settings(profile)
+        self.video = SyntheticVideo(n_frames=150, seed=1)
+
+    def test_tracking_system_benchmark(self):
+        result = run_benchmark(self.settings, self.video, self.video.ground_truth)
+
+        print('throughput', result['throughput_fps'])
+        print('frame latency (ms)', result['latency_ms']['frame'])
+        print('accuracy', result['accuracy'])
+
+        self.assertEqual(result['frames'], 150)
+        self.assertGreater(result['throughput_fps'], 0)
+        # the shared detector is timed too
+        self.assertIn('detect', result['latency_ms'])
+        self.assertGreater(result['accuracy']['tracking_ratio'], 0.5)
+        self.assertGreater(result['accuracy']['mean_iou'], 0.2)
+
+    def test_sequential_matches_pipelined(self):
+        results = []
+        for pipelined in (False, True):
+            settings = load_settings(profile, PIPELINED=pipelined)
+            video = SyntheticVideo(n_frames=60, seed=2)
+            results.append(run_benchmark(settings, video, video.ground_truth))
+
+        self.assertEqual(results[0]['accuracy'], results[1]['accuracy'])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from camera_tracker.benchmark import SyntheticVideo
+from camera_tracker.builder import load_settings, build_tracking_system
+from camera_tracker.capture import CapturedFrame
+from camera_tracker.scheduler import FramePlan
+from camera_tracker.tracking_system import SystemState
+
+profile = Path(__file__).parents[1] / 'app/setting_profiles/distance_5.py'
+
+
+class SystemStateTest(unittest.TestCase):
+    def setUp(self):
+        settings = load_settings(profile, PIPELINED=False)
+        self.tracking_sys = build_tracking_system(settings, video_source=None)
+        self.tracking_sys.running = True
+        self.states = []
+
+    def run_frames(self, n):
+        frame = np.full((720, 1280, 3), 100, dtype=np.uint8)
+        for _ in range(n):
+            self.tracking_sys._process_frame(frame)
+            self.states.append(self.tracking_sys.state)
+
+    def test_pause_resume(self):
+        self.run_frames(1)
+        # the loop is not running, commands wait for the next frame
+        self.assertFalse(self.tracking_sys.pause())
+        self.assertEqual(self.tracking_sys.state, SystemState.RUNNING)
+
+        self.run_frames(2)
+        self.tracking_sys.resume()
+        self.run_frames(2)
+
+        self.assertEqual(self.states, [SystemState.RUNNING,
+                                       SystemState.PAUSED, SystemState.PAUSED,
+                                       SystemState.RUNNING, SystemState.RUNNING])
+        self.assertEqual(self.tracking_sys.metrics.snapshot()['counters']['paused_frames'], 2)
+
+    def test_commands_apply_in_order(self):
+        self.tracking_sys.pause()
+        self.tracking_sys.resume()
+        self.tracking_sys.pause()
+        self.run_frames(1)
+        self.assertTrue(self.tracking_sys.paused)
+
+    def test_camera_moving(self):
+        self.run_frames(1)
+        self.tracking_sys._process_frame(np.full((720, 1280, 3), 200, dtype=np.uint8))
+        self.assertEqual(self.tracking_sys.state, SystemState.CAMERA_MOVING)
+        self.run_frames(2)
+        self.assertEqual(self.states[-1], SystemState.RUNNING)
+
+
+class FakeTracker:
+    """
+    Reports the box the test sets.
+    """
+
+    def __init__(self, health=5):
+        self.max_tracker_health = health
+        self.health = health
+        self.roi = None
+        self.bbox = None
+
+    def init_tracker(self, img, bbox):
+        self.bbox = tuple(bbox)
+        self.health = self.max_tracker_health
+
+    def predict(self, img):
+        return True, self.bbox
+
+    def get_health(self):
+        return self.health
+
+    def decrease_health(self):
+        self.health -= 1
+
+
+class SkipTestCase(unittest.TestCase):
+    """
+    Runs a system whose detector and tracker report the boxes the test
+    sets.
+    """
+
+    settings = {}
+
+    def setUp(self):
+        settings = load_settings(profile, PIPELINED=False, ROI_SCALE=None,
+                                 MOTION_COMPENSATION=False, **self.settings)
+        self.tracking_sys = build_tracking_system(settings, video_source=None)
+        self.tracking_sys.running = True
+        self.tracking_sys.tracker = self.tracker = FakeTracker()
+        self.tracking_sys._detect = lambda frame: (False, (True, self.target))
+        self.img = np.full((360, 640, 3), 100, dtype=np.uint8)
+        self.seq = 0
+
+    def step(self, tracker_bbox=None):
+        # the target moves 5 pixels per frame at 20 fps
+        self.seq += 1
+        self.target = (100 + 5 * self.seq, 100, 20, 20)
+        if self.tracking_sys.tracking:
+            self.tracker.bbox = tracker_bbox or self.target
+        self.tracking_sys._process_frame(CapturedFrame(self.seq, self.seq * 0.05, self.img))
+
+
+class DetectionSkipTest(SkipTestCase):
+    settings = dict(ADAPTIVE_SCHEDULING=False, KALMAN_FILTER=True, MAX_DETECTION_SKIP=2)
+
+    def next_frame_skips(self):
+        ts = self.tracking_sys
+        return ts._prediction_agrees and ts._detection_skips < ts.max_detection_skip
+
+    def test_drifting_tracker_is_not_confirmed(self):
+        for _ in range(10):
+            self.step()
+        while not self.next_frame_skips():
+            self.step()
+        counters = self.tracking_sys.metrics.snapshot()['counters']
+        self.assertGreater(counters['detection_skips'], 0)
+        location = self.tracking_sys.get_location()
+        frame_cnt = self.tracking_sys.tracking_frame_cnt
+
+        # the tracker sticks to the background on a frame without detection
+        self.step(tracker_bbox=(100, 100, 20, 20))
+        self.assertEqual(self.tracker.get_health(), 4)
+        self.assertEqual(self.tracking_sys.get_location(), location)
+        self.assertEqual(self.tracking_sys.tracking_frame_cnt, frame_cnt)
+        self.assertEqual(self.tracking_sys.metrics.snapshot()['counters']['unconfirmed_skips'], 1)
+        # and the next frame is checked by the detector
+        self.assertFalse(self.next_frame_skips())
+
+    def test_agreeing_tracker_is_confirmed(self):
+        for _ in range(20):
+            self.step()
+        self.assertEqual(self.tracker.get_health(), 5)
+        self.assertNotIn('unconfirmed_skips', self.tracking_sys.metrics.snapshot()['counters'])
+        self.assertEqual(self.tracking_sys.get_location(), (100 + 5 * 20 + 10, 110))
+
+
+class ScheduledSkipTest(SkipTestCase):
+    settings = dict(ADAPTIVE_SCHEDULING=True, KALMAN_FILTER=False, MAX_DETECTION_SKIP=0)
+
+    def test_drifting_tracker_is_not_confirmed(self):
+        for _ in range(10):
+            self.step()
+        location = self.tracking_sys.get_location()
+        frame_cnt = self.tracking_sys.tracking_frame_cnt
+
+        # the scheduler skips the detector, the tracker drifts
+        self.tracking_sys.scheduler.plan = lambda healthy: FramePlan(False, True)
+        for _ in range(4):
+            self.step(tracker_bbox=(100, 100, 20, 20))
+        self.assertEqual(self.tracking_sys.get_location(), location)
+        self.assertEqual(self.tracking_sys.tracking_frame_cnt, frame_cnt)
+        counters = self.tracking_sys.metrics.snapshot()['counters']
+        self.assertEqual(counters['scheduled_detection_skips'], 4)
+        self.assertEqual(counters['unconfirmed_skips'], 4)
+        self.assertEqual(self.tracker.get_health(), 5)
+
+
+class PipelinedTest(unittest.TestCase):
+    def run_video(self, pipelined):
+        settings = load_settings(profile, PIPELINED=pipelined)
+        results = []
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            tracking_sys = build_tracking_system(settings, video_source=None, executor=executor)
+            tracking_sys.running = True
+            tracking_sys.tracker = FakeTracker()
+            for frame in SyntheticVideo(n_frames=60, seed=2):
+                tracking_sys._process_frame(frame)
+                results.append((tracking_sys.state, tracking_sys.tracking, tracking_sys.track_bbox,
+                                tracking_sys.detect_bbox, tracking_sys.location))
+        return results
+
+    def test_sequential_matches_pipelined(self):
+        sequential = self.run_video(False)
+        # the target was found and followed
+        self.assertTrue(any(result[1] for result in sequential))
+        self.assertEqual(self.run_video(True), sequential)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,9 @@ from camera_tracker.utils import run_pipeline
 from camera_tracker.pipeline_components import (
     ResizeTransformer,
     BlurTransformer,
-    GrayscaleTransformer
+    GrayscaleTransformer,
+    PyrDownTransformer,
+    TransformGraph
 )
 
 img = cv2.imread('pipeline_test_img.jpg')
@@ -26,6 +28,76 @@ class PipelineTest(unittest.TestCase):
         self.assertEqual(len(out.shape), 2)
         self.assertEqual(out_size[::-1], out.shape)
 
+    def test_reuse_buffers(self):
+        pipe = [
+            ResizeTransformer(out_size, reuse_buffers=True),
+            GrayscaleTransformer(reuse_buffers=True),
+            BlurTransformer(reuse_buffers=True),
+        ]
+
+        out = run_pipeline(pipe, img)
+        expected = run_pipeline(make_pipeline(), img)
+
+        self.assertTrue((out == expected).all())
+        self.assertIs(run_pipeline(pipe, img), out)
+
+    def test_pyramid_level(self):
+        pipe = make_pipeline()[:2] + [PyrDownTransformer(2, reuse_buffers=True)]
+
+        out = run_pipeline(pipe, img)
+
+        self.assertEqual(out.shape, (out_size[1] // 4, out_size[0] // 4))
+
+
+class CountingResizeTransformer(ResizeTransformer):
+    def __init__(self, out_size):
+        super().__init__(out_size)
+        self.calls = 0
+
+    def transform(self, img):
+        self.calls += 1
+        return super().transform(img)
+
+    def signature(self):
+        return (ResizeTransformer, self.out_size)
+
+
+class TransformGraphTest(unittest.TestCase):
+    def test_shared_resize(self):
+        resize_a = CountingResizeTransformer(out_size)
+        resize_b = CountingResizeTransformer(out_size)
+        graph = TransformGraph.from_pipelines({
+            'detector': [resize_a, GrayscaleTransformer(), BlurTransformer()],
+            'tracker': [resize_b]
+        })
+
+        out = graph.run(img)
+
+        self.assertEqual(resize_a.calls + resize_b.calls, 1)
+        self.assertEqual(out['detector'].shape, out_size[::-1])
+        self.assertEqual(out['tracker'].shape, out_size[::-1] + (3,))
+
+    def test_matches_run_pipeline(self):
+        graph = TransformGraph.from_pipelines({
+            'detector': make_pipeline(),
+            'tracker': [ResizeTransformer(out_size)]
+        })
+
+        out = graph.run(img)
+
+        self.assertTrue((out['detector'] == run_pipeline(make_pipeline(), img)).all())
+
+    def test_different_params_not_shared(self):
+        graph = TransformGraph.from_pipelines({
+            'small': [ResizeTransformer((32, 16))],
+            'big': [ResizeTransformer(out_size)]
+        })
+
+        out = graph.run(img, outputs=['small'])
+
+        self.assertEqual(list(out.keys()), ['small'])
+        self.assertEqual(out['small'].shape[:2], (16, 32))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file